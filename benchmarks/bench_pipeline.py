@@ -0,0 +1,368 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+"""Benchmark the BugMonitor pipeline against synthetic bugs
+
+Builds, build downloads and evaluators are replaced with stand-ins which sleep for
+a configurable amount of time so that only bugmon's own overhead is measured.
+
+Example:
+    python benchmarks/bench_pipeline.py --files 2000 --comments 500 --iterations 5
+"""
+
+import argparse
+import base64
+import io
+import json
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Generator, List
+from unittest.mock import patch
+
+from autobisect import BrowserEvaluator, JSEvaluator
+from autobisect.evaluators import EvaluatorResult
+from fuzzfetch import BuildFlags
+
+from bugmon import bug as bug_module
+from bugmon import utils
+from bugmon.bug import EnhancedBug
+from bugmon.bugmon import BugMonitor
+from bugmon.builds import BUILD_RESOLVER
+from bugmon.cache import set_cache
+from bugmon.utils import MILESTONE
+
+REV = "7bd6cb8b76c078f5e687574decdde97f1e4affce"
+BRANCHES = {"central": 81, "beta": 80, "release": 79, "esr78": 78, "esr91": 91}
+PRODUCT_DETAILS = {
+    "FIREFOX_NIGHTLY": "81.0a1",
+    "FIREFOX_ESR": "78.1.0esr",
+    "FIREFOX_ESR_NEXT": "91.0esr",
+}
+CRASH_MARKER = "// bench: crash"
+
+
+class Latency:
+    """Simulated latencies in seconds"""
+
+    resolve = 0.0
+    download = 0.0
+    evaluate = 0.0
+    flags = 0.0
+
+
+class FakeFetcher:
+    """Stand-in for fuzzfetch.Fetcher which doesn't access the network"""
+
+    def __init__(
+        self,
+        branch: str,
+        build: str,
+        flags: BuildFlags,
+        **_kwargs: Any,
+    ) -> None:
+        time.sleep(Latency.resolve)
+        self._branch = branch
+        self._flags = flags
+        self.build_flags = flags
+        self.changeset = REV
+        self.id = "20200811011203"
+        self.build = build
+
+    def get_auto_name(self) -> str:
+        """Name used by BuildManager for the build"""
+        return f"m-{self._branch[0]}-{self.id}{self._flags.build_string()}"
+
+
+class FakeBuildManager:
+    """Stand-in for autobisect.BuildManager which doesn't download builds"""
+
+    def __init__(self, *_args: Any) -> None:
+        self.build_dir = Path(tempfile.gettempdir())
+
+    @contextmanager
+    def get_build(
+        self, _build: FakeFetcher, _target: str
+    ) -> Generator[Path, None, None]:
+        """Simulate retrieving a build"""
+        time.sleep(Latency.download)
+        yield self.build_dir
+
+
+def fake_evaluate(self: Any, _build_path: Path) -> EvaluatorResult:
+    """Simulate evaluating a testcase, crashing only on marked testcases"""
+    testcase = Path(self.testcase)
+    marked = testcase.is_file() and CRASH_MARKER in testcase.read_text()
+    if marked:
+        time.sleep(Latency.evaluate)
+        return EvaluatorResult.BUILD_CRASHED
+
+    time.sleep(Latency.evaluate * self.repeat)
+    return EvaluatorResult.BUILD_PASSED
+
+
+class FakeResponse:
+    """Stand-in for responses from hg.mozilla.org and product-details"""
+
+    def __init__(self, url: str) -> None:
+        time.sleep(Latency.resolve)
+        self.url = url
+
+    def json(self) -> Dict[str, str]:
+        """Response content"""
+        if self.url == MILESTONE:
+            return PRODUCT_DETAILS
+        return {"node": REV}
+
+    def raise_for_status(self) -> None:
+        """Requests always succeed"""
+
+
+def fake_valid_flags(_rev: str) -> List[str]:
+    """Simulate retrieving the runtime flags supported by a build"""
+    time.sleep(Latency.flags)
+    return ["fuzzing-safe", "ion-eager", "baseline-eager", "no-threads"]
+
+
+def make_attachment(files: int, crash_every: int) -> Dict[str, Any]:
+    """Create a zip attachment containing the requested number of testcases
+
+    :param files: Number of files in the archive
+    :param crash_every: Every nth file crashes
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for i in range(files):
+            body = f"function f{i}() {{ return {i}; }}\n" * 20
+            if crash_every and i % crash_every == crash_every - 1:
+                body += f"{CRASH_MARKER}\n"
+            archive.writestr(f"tests/{i // 100:03d}/test_{i:05d}.js", body)
+
+    return {
+        "id": 1000,
+        "bug_id": 1,
+        "file_name": "testcases.zip",
+        "content_type": "application/zip",
+        "creation_time": "2020-08-11T01:00:00Z",
+        "last_change_time": "2020-08-11T01:00:00Z",
+        "is_obsolete": 0,
+        "is_patch": 0,
+        "is_private": 0,
+        "flags": [],
+        "size": len(buffer.getvalue()),
+        "data": base64.b64encode(buffer.getvalue()).decode("utf-8"),
+    }
+
+
+def make_comment(index: int, text: str) -> Dict[str, Any]:
+    """Create a comment
+
+    :param index: Comment number
+    :param text: Comment text
+    """
+    return {
+        "id": 10000 + index,
+        "bug_id": 1,
+        "count": index,
+        "text": text,
+        "raw_text": text,
+        "creator": "foobar@example.com",
+        "author": "foobar@example.com",
+        "time": f"2020-08-{11 + index // 1440:02d}T{index // 60 % 24:02d}:{index % 60:02d}:00Z",
+        "creation_time": f"2020-08-{11 + index // 1440:02d}T{index // 60 % 24:02d}:{index % 60:02d}:00Z",
+        "is_private": False,
+        "tags": [],
+        "attachment_id": None,
+    }
+
+
+def make_bug_data(comments: int, files: int, crash_every: int) -> Dict[str, Any]:
+    """Create a synthetic JS engine bug
+
+    :param comments: Number of comments
+    :param files: Number of testcases in the attachment
+    :param crash_every: Every nth testcase crashes
+    """
+    comment_zero = (
+        f"Built from https://hg.mozilla.org/mozilla-central/rev/{REV}\n"
+        "Configured with --enable-debug --enable-fuzzing\n"
+        "Run with --fuzzing-safe --ion-eager ASAN_OPTIONS=detect_leaks=0\n"
+    )
+    history = [make_comment(0, comment_zero)]
+    for i in range(1, comments):
+        history.append(make_comment(i, f"Comment {i}\n" + "Lorem ipsum. " * 40))
+    for i, branch in enumerate(BRANCHES):
+        if branch == "central":
+            url = f"https://hg.mozilla.org/mozilla-central/rev/{REV}"
+        else:
+            url = f"https://hg.mozilla.org/releases/mozilla-{branch}/rev/{REV}"
+        history.append(make_comment(comments + i, url))
+
+    data: Dict[str, Any] = {
+        "id": 1,
+        "summary": "Assertion failure",
+        "product": "Core",
+        "component": "JavaScript Engine",
+        "status": "ASSIGNED",
+        "resolution": "",
+        "version": "Trunk",
+        "op_sys": "Linux",
+        "platform": "x86_64",
+        "keywords": ["bugmon", "testcase"],
+        "whiteboard": "[bugmon:bisected]",
+        "creation_time": "2020-08-11T01:00:00Z",
+        "regressed_by": [],
+        "flags": [],
+        "assigned_to_detail": {"email": "foobar@example.com", "nick": "foobar"},
+        "attachments": [make_attachment(files, crash_every)],
+        "comments": history,
+    }
+    for branch, version in BRANCHES.items():
+        if branch.startswith("esr"):
+            data[f"cf_status_firefox_{branch}"] = "fixed"
+        else:
+            data[f"cf_status_firefox{version}"] = "fixed"
+
+    return data
+
+
+def reset() -> None:
+    """Clear state retained between bugs"""
+    BUILD_RESOLVER.clear()
+    bug_module._VALID_FLAGS.clear()  # pylint: disable=protected-access
+    utils._PRODUCT_DETAILS = None  # pylint: disable=protected-access
+
+
+def parse_bug(data: Dict[str, Any]) -> None:
+    """Parse all properties derived from comments"""
+    bug = EnhancedBug(None, **data)
+    for prop in ("comment_zero", "build_flags", "env", "initial_build_id"):
+        getattr(bug, prop)
+    bug.runtime_opts  # pylint: disable=pointless-statement
+    for alias in bug.branches:
+        bug.find_patch_rev(alias)
+
+
+def run_monitor(data: Dict[str, Any], action: Callable[[BugMonitor], Any]) -> None:
+    """Run an action against a new BugMonitor
+
+    :param data: Bug data
+    :param action: Action to run
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        bug = EnhancedBug(None, **data)
+        action(BugMonitor(None, bug, Path(temp_dir), dry_run=True))  # type: ignore
+
+
+def measure(func: Callable[[], None], iterations: int) -> Dict[str, float]:
+    """Measure the wall time and allocations of a phase
+
+    Allocations are measured in a separate run as tracing slows execution.
+
+    :param func: Phase to run
+    :param iterations: Number of timed runs
+    """
+    timings = []
+    for _ in range(iterations):
+        reset()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    reset()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "mean": statistics.mean(timings),
+        "min": min(timings),
+        "max": max(timings),
+        "peak_kib": peak / 1024,
+    }
+
+
+def parse_args(argv: List[str]) -> argparse.Namespace:
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--comments", type=int, default=200)
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument(
+        "--crash-every",
+        type=int,
+        default=50,
+        help="Every nth testcase crashes (0 for none)",
+    )
+    parser.add_argument("--resolve-latency", type=float, default=0.01)
+    parser.add_argument("--download-latency", type=float, default=0.05)
+    parser.add_argument("--evaluate-latency", type=float, default=0.001)
+    parser.add_argument("--flags-latency", type=float, default=0.05)
+    parser.add_argument(
+        "--cache-dir", type=Path, help="Use a persistent cache (warm runs)"
+    )
+    parser.add_argument("--json", type=Path, help="Write results to a JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv: List[str]) -> int:
+    """Run the benchmark"""
+    args = parse_args(argv)
+    Latency.resolve = args.resolve_latency
+    Latency.download = args.download_latency
+    Latency.evaluate = args.evaluate_latency
+    Latency.flags = args.flags_latency
+
+    data = make_bug_data(args.comments, args.files, args.crash_every)
+    phases: Dict[str, Callable[[], None]] = {
+        "parse": lambda: parse_bug(data),
+        "fetch_attachments": lambda: run_monitor(data, lambda m: m.fetch_attachments()),
+        "detect_config": lambda: run_monitor(data, lambda m: m.detect_config()),
+        "process": lambda: run_monitor(data, lambda m: m.process()),
+    }
+
+    results = {}
+    with ExitStack() as stack:
+        stack.enter_context(patch("bugmon.builds.Fetcher", FakeFetcher))
+        stack.enter_context(patch("bugmon.bugmon.BuildManager", FakeBuildManager))
+        stack.enter_context(patch("bugmon.prefetch.BuildManager", FakeBuildManager))
+        stack.enter_context(patch("bugmon.utils._get_url", FakeResponse))
+        stack.enter_context(
+            patch.object(JSEvaluator, "get_valid_flags", side_effect=fake_valid_flags)
+        )
+        stack.enter_context(
+            patch.object(JSEvaluator, "evaluate_testcase", fake_evaluate)
+        )
+        stack.enter_context(
+            patch.object(BrowserEvaluator, "evaluate_testcase", fake_evaluate)
+        )
+        set_cache(args.cache_dir)
+
+        for name, func in phases.items():
+            results[name] = measure(func, args.iterations)
+            print(
+                f"{name:<20} mean {results[name]['mean']:8.3f}s  "
+                f"min {results[name]['min']:8.3f}s  "
+                f"max {results[name]['max']:8.3f}s  "
+                f"peak {results[name]['peak_kib']:10.1f} KiB",
+                flush=True,
+            )
+
+        set_cache(None)
+
+    if args.json is not None:
+        args.json.write_text(json.dumps(results, indent=2))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,238 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import logging
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import Generator, Optional
+
+from bugsy import Attachment
+
+from .cache import make_key
+from .utils import decode_base64, extract_zip
+
+if sys.platform == "linux":
+    import fcntl
+
+log = logging.getLogger(__name__)
+
+# ioctl requesting a copy-on-write clone of a file (linux/fs.h)
+FICLONE = 0x40049409
+
+# Maximum total size in bytes of stored attachments
+MAX_STORE_SIZE = 1024**3
+
+# Entries used within this many seconds are never pruned as they may be in use
+PRUNE_GRACE = 3600
+
+
+def _tree_size(path: Path) -> int:
+    """Return the total size of the files within a directory
+
+    :param path: Directory to measure
+    """
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def clone_file(src: Path, dest: Path) -> None:
+    """Copy a file, sharing its blocks with the source where supported
+
+    Filesystems supporting reflinks (btrfs, xfs) clone the file without copying its
+    contents.  Otherwise the file is copied.  Unlike a hard link, changes to either
+    file never affect the other.
+
+    :param src: File to copy
+    :param dest: Destination file
+    """
+    if sys.platform == "linux":
+        with src.open("rb") as fin, dest.open("wb") as fout:
+            try:
+                fcntl.ioctl(fout.fileno(), FICLONE, fin.fileno())
+            except OSError:
+                pass
+            else:
+                shutil.copystat(src, dest)
+                return
+
+    shutil.copy2(src, dest)
+
+
+class AttachmentStore:
+    """Store of decoded attachments shared between bugs and runs
+
+    Bugzilla never changes the contents of an attachment, so attachments are stored
+    by id and digest of their immutable metadata.  This allows stored attachments to
+    be found without retrieving their contents.  Archives are stored unpacked so
+    that they only need to be extracted once.
+
+    The size and last use of each entry are recorded in an index so that the least
+    recently used entries can be removed once the store exceeds max_size.
+
+    :param path: Directory used for storing attachments
+    :param max_size: Maximum total size in bytes of stored attachments
+    """
+
+    def __init__(self, path: Path, max_size: int = MAX_STORE_SIZE) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.temp_dir = self.path / ".tmp"
+        self.temp_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.path / "index.db"
+
+        with self._connect() as con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(name TEXT PRIMARY KEY, size INTEGER, used REAL)"
+            )
+            con.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+
+    @contextmanager
+    def _connect(self) -> Generator[sqlite3.Connection, None, None]:
+        """Open a short-lived connection to the index and commit on success"""
+        with closing(sqlite3.connect(self.db_path, timeout=60)) as con:
+            with con:
+                yield con
+
+    def entry(self, attachment: Attachment, unpack: bool = True) -> Path:
+        """Return the path where the attachment contents are stored
+
+        :param attachment: The attachment
+        :param unpack: Boolean indicating if archives should be unpacked
+        """
+        digest = make_key(
+            attachment.size,
+            attachment.creation_time,
+            attachment.content_type,
+            attachment.file_name,
+        )
+        suffix = "-unpacked" if unpack and attachment.file_name.endswith(".zip") else ""
+        return self.path / f"{attachment.id}-{digest}{suffix}"
+
+    def get(
+        self, attachment: Attachment, unpack: bool = True, entry: Optional[Path] = None
+    ) -> Path:
+        """Return the stored contents of the attachment, storing them if needed
+
+        :param attachment: The attachment, which must include its contents unless
+            it is already stored
+        :param unpack: Boolean indicating if archives should be unpacked
+        :param entry: The path returned by entry(), if already known
+        :raises binascii.Error: If the attachment cannot be decoded
+        :raises zipfile.BadZipFile: If the attachment is an invalid archive
+        :raises BugmonException: If the archive is rejected by extract_zip
+        :raises OSError: If the attachment cannot be stored
+        """
+        if entry is None:
+            entry = self.entry(attachment, unpack)
+        if entry.is_dir():
+            self._record_use(entry)
+            return entry
+
+        temp = Path(tempfile.mkdtemp(dir=self.temp_dir))
+        try:
+            with decode_base64(attachment.data) as data:
+                if entry.name.endswith("-unpacked"):
+                    extract_zip(data, temp)
+                else:
+                    with (temp / attachment.file_name).open("wb") as f:
+                        shutil.copyfileobj(data, f)
+
+            size = _tree_size(temp)
+            # Another process may have stored the attachment in the meantime
+            try:
+                temp.rename(entry)
+            except OSError:
+                if not entry.is_dir():
+                    raise
+        finally:
+            shutil.rmtree(temp, ignore_errors=True)
+
+        with self._connect() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                (entry.name, size, time.time()),
+            )
+
+        self.prune()
+        return entry
+
+    def _record_use(self, entry: Path) -> None:
+        """Record the use of an entry so that it isn't pruned
+
+        Entries stored before the index existed are added to it.
+
+        :param entry: Stored attachment path
+        """
+        with self._connect() as con:
+            updated = con.execute(
+                "UPDATE entries SET used = ? WHERE name = ?", (time.time(), entry.name)
+            ).rowcount
+        if not updated:
+            with self._connect() as con:
+                con.execute(
+                    "INSERT OR IGNORE INTO entries VALUES (?, ?, ?)",
+                    (entry.name, _tree_size(entry), time.time()),
+                )
+
+    def prune(self) -> None:
+        """Remove the least recently used entries until the store fits max_size
+
+        Entries and abandoned temporary directories are only removed once they
+        haven't been used for PRUNE_GRACE seconds.
+        """
+        cutoff = time.time() - PRUNE_GRACE
+        for path in self.temp_dir.iterdir():
+            try:
+                if path.stat().st_mtime < cutoff:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                # Removed by another process
+                continue
+
+        with self._connect() as con:
+            total = con.execute("SELECT TOTAL(size) FROM entries").fetchone()[0]
+            if total <= self.max_size:
+                return
+
+            rows = con.execute(
+                "SELECT name, size FROM entries WHERE used < ? ORDER BY used",
+                (cutoff,),
+            ).fetchall()
+            removed = []
+            for name, size in rows:
+                if total <= self.max_size:
+                    break
+                log.debug("Removing stored attachment: %s", name)
+                shutil.rmtree(self.path / name, ignore_errors=True)
+                removed.append((name,))
+                total -= size
+
+            con.executemany("DELETE FROM entries WHERE name = ?", removed)
+
+    @staticmethod
+    def materialize(entry: Path, dest: Path) -> None:
+        """Clone the contents of a stored attachment into the destination
+
+        Testcases may be modified when they are evaluated so files are cloned using
+        clone_file() rather than hard linked.
+
+        :param entry: Stored attachment path
+        :param dest: Destination directory
+        """
+        for src in sorted(entry.rglob("*")):
+            target = dest / src.relative_to(entry)
+            if src.is_dir():
+                target.mkdir(parents=True, exist_ok=True)
+                continue
+
+            if target.exists():
+                log.warning("Duplicate filename: %s", src.relative_to(entry))
+                target.unlink()
+
+            target.parent.mkdir(parents=True, exist_ok=True)
+            clone_file(src, target)
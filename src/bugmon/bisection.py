@@ -0,0 +1,144 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import logging
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional
+
+from autobisect.bisect import Bisector
+from autobisect.evaluators import EvaluatorResult
+from fuzzfetch import Fetcher, FetcherException
+
+from .builds import BUILD_RESOLVER
+from .tracing import span
+
+log = logging.getLogger(__name__)
+
+
+class KnownOutcome(NamedTuple):
+    """Previously observed result of evaluating the testcase on a build"""
+
+    build_id: str
+    changeset: str
+    result: EvaluatorResult
+
+
+class StoredBuild(NamedTuple):
+    """Build attributes retained for stored bisection results"""
+
+    id: str
+    changeset: str
+    build_info: Dict[str, str]
+
+    @classmethod
+    def start(cls, bisection: Dict[str, str]) -> "StoredBuild":
+        """Return the first build of a stored bisection range
+
+        :param bisection: Stored bisection range
+        """
+        repo = {"moz_source_repo": bisection["repo"]}
+        return cls(bisection["start_id"], bisection["start_changeset"], repo)
+
+    @classmethod
+    def end(cls, bisection: Dict[str, str]) -> "StoredBuild":
+        """Return the last build of a stored bisection range
+
+        :param bisection: Stored bisection range
+        """
+        repo = {"moz_source_repo": bisection["repo"]}
+        return cls(bisection["end_id"], bisection["end_changeset"], repo)
+
+
+class SeededBisector(Bisector):
+    """Bisector which reuses known build outcomes
+
+    Builds with a known outcome aren't evaluated again and the outcome of every
+    build that is evaluated is passed to the record callback.
+
+    :param args: Arguments passed to Bisector
+    :param known: Previously observed outcomes on the bisection branch
+    :param record: Called with each evaluated build and its result
+    :param kwargs: Keyword arguments passed to Bisector
+    """
+
+    start: Fetcher
+    end: Fetcher
+
+    def __init__(
+        self,
+        *args: Any,
+        known: Iterable[KnownOutcome] = (),
+        record: Optional[Callable[[Fetcher, EvaluatorResult], Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.known = {outcome.changeset: outcome for outcome in known}
+        self.record = record
+
+    def _resolve(self, outcome: KnownOutcome) -> Optional[Fetcher]:
+        """Resolve the build of a known outcome
+
+        :param outcome: Known outcome
+        """
+        try:
+            return BUILD_RESOLVER.resolve(
+                self.branch,
+                outcome.changeset,
+                self.flags,
+                [self.evaluator.target],
+                self.platform,
+            )
+        except FetcherException as e:
+            log.warning(f"Unable to resolve known build {outcome.changeset}: {e}")
+            return None
+
+    def narrow(self) -> None:
+        """Move the bounds inwards to the closest builds with a known outcome
+
+        The start is moved to the last build known to behave like the start and the
+        end to the first subsequent build known to behave like the end.
+        """
+        if self.find_fix:
+            first, last = EvaluatorResult.BUILD_CRASHED, EvaluatorResult.BUILD_PASSED
+        else:
+            first, last = EvaluatorResult.BUILD_PASSED, EvaluatorResult.BUILD_CRASHED
+
+        known = sorted(self.known.values(), key=lambda outcome: outcome.build_id)
+        lower = self.start.id
+        for outcome in reversed(known):
+            if (
+                self.start.id < outcome.build_id < self.end.id
+                and outcome.result == first
+            ):
+                build = self._resolve(outcome)
+                if build is not None:
+                    self.start = build
+                    lower = outcome.build_id
+                break
+
+        for outcome in known:
+            if lower < outcome.build_id < self.end.id and outcome.result == last:
+                build = self._resolve(outcome)
+                if build is not None:
+                    self.end = build
+                break
+
+        log.info(f"Bisecting between {self.start.id} and {self.end.id}")
+
+    def test_build(self, build: Fetcher) -> EvaluatorResult:
+        """Test the build unless its outcome is already known
+
+        :param build: The build to test
+        """
+        with span("bisect.step", build=build.get_auto_name()) as s:
+            known = self.known.get(build.changeset)
+            if known is not None:
+                s.set(cache="hit", result=known.result.name)
+                return known.result
+
+            result = super().test_build(build)
+            s.set(cache="miss", result=result.name)
+
+        if self.record is not None:
+            self.record(build, result)
+
+        return result
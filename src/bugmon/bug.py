@@ -2,25 +2,59 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file, You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 # pylint: disable=too-many-public-methods,protected-access
+import asyncio
+import copy
 import json
 import logging
 import platform
 import re
 from datetime import datetime
-from typing import Any, Dict, List, NoReturn, Optional, Type, TypedDict, Union, cast
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    List,
+    NamedTuple,
+    NoReturn,
+    Optional,
+    Tuple,
+    Type,
+    TypedDict,
+    Union,
+    cast,
+)
 
 import requests
 from autobisect import JSEvaluator
 from bugsy import Attachment, Bug, Bugsy, Comment
-from fuzzfetch import BuildFlags, BuildSearchOrder, Fetcher, FetcherException, Platform
+from fuzzfetch import BuildFlags, BuildSearchOrder, FetcherException, Platform
 
-from .utils import HG_BASE, _get_milestone, _get_rev
+from .builds import BUILD_RESOLVER
+from .bugzilla import AsyncBugzilla
+from .cache import get_cache
+from .utils import HG_BASE, _get_esr, _get_milestone, _get_rev
 
 log = logging.getLogger(__name__)
 
 REV_MATCH = r"([a-f0-9]{12}|[a-f0-9]{40})"
 BID_MATCH = r"([0-9]{8}-)([a-f0-9]{12})"
 
+REV_PATTERN = re.compile(REV_MATCH, re.IGNORECASE)
+BID_PATTERN = re.compile(BID_MATCH, re.IGNORECASE)
+OPTION_PATTERN = re.compile(r"--[a-z0-9][a-z0-9=\-_]*", re.IGNORECASE)
+ENV_PATTERN = re.compile(r"[a-z0-9_]+=[a-z0-9]", re.IGNORECASE)
+SANITIZER_PATTERN = re.compile(r"[A-Za-z]+Sanitizer")
+WORD_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+COMMANDS_PATTERN = re.compile(r"(?<=\[bugmon:)[^]]*")
+COMMANDS_BLOCK_PATTERN = re.compile(r"(\[bugmon:.*?])")
+PATCH_REV_PATTERN = re.compile(
+    rf"(?:{HG_BASE}/(mozilla-central|releases/mozilla-[a-z0-9]+|integration/autoland)"
+    rf"/rev/){REV_MATCH}"
+)
+
+# Runtime flags supported by each revision
+_VALID_FLAGS: Dict[str, List[str]] = {}
+
 AsigneeDetail = TypedDict(
     "AsigneeDetail",
     {"id": int, "real_name": str, "nick": str, "name": str, "email": str},
@@ -28,6 +62,67 @@ AsigneeDetail = TypedDict(
 )
 
 
+class ParsedReport(NamedTuple):
+    """Structured view of the details listed in comment 0
+
+    :param options: Command line options (configure and runtime flags) in order
+    :param env: Environment variable assignments
+    :param revisions: Tokens resembling revisions or fuzzfetch build ids, in order
+    :param sanitizers: Names of the sanitizers mentioned
+    """
+
+    options: Tuple[str, ...]
+    env: Dict[str, str]
+    revisions: Tuple[str, ...]
+    sanitizers: FrozenSet[str]
+
+    @classmethod
+    def parse(cls, text: str) -> "ParsedReport":
+        """Scan the report once, retaining everything the bug properties require
+
+        :param text: Text of comment 0
+        """
+        env = {}
+        for token in text.split(" "):
+            if token.startswith("`") and token.endswith("`"):
+                token = token[1:-1]
+            if ENV_PATTERN.match(token):
+                name, value = token.split("=", 1)
+                env[name] = value
+
+        revisions = tuple(
+            word
+            for word in WORD_PATTERN.findall(text)
+            if REV_PATTERN.fullmatch(word) or BID_PATTERN.fullmatch(word)
+        )
+
+        return cls(
+            tuple(OPTION_PATTERN.findall(text)),
+            env,
+            revisions,
+            frozenset(SANITIZER_PATTERN.findall(text)),
+        )
+
+    def has_option(self, option: str) -> bool:
+        """Check whether an option, or one it prefixes, was listed
+
+        :param option: Option including leading dashes
+        """
+        return any(candidate.startswith(option) for candidate in self.options)
+
+    def find_option(self, name: str) -> Optional[str]:
+        """Return the first listed option, including any value, starting with name
+
+        :param name: Option name without leading dashes
+        """
+        prefix = f"--{name.lower()}"
+        for candidate in self.options:
+            if candidate.lower().startswith(prefix):
+                return candidate
+
+        return None
+
+
 def sanitize_bug(obj: Any) -> Any:
     """Helper method for converting Bug to JSON
     :param obj:
@@ -45,6 +140,30 @@ def sanitize_bug(obj: Any) -> Any:
     return obj
 
 
+def get_valid_flags(rev: str) -> List[str]:
+    """Retrieve the runtime flags supported by the JS shell at the supplied revision
+
+    Results are retained in memory and, if configured, in the persistent cache.
+
+    :param rev: Build revision
+    """
+    if rev in _VALID_FLAGS:
+        return _VALID_FLAGS[rev]
+
+    cache = get_cache()
+    flags = cache.get_valid_flags(rev) if cache is not None else None
+    if flags is None:
+        flags = list(JSEvaluator.get_valid_flags(rev))
+        # An empty list indicates that the flags couldn't be retrieved
+        if not flags:
+            return flags
+        if cache is not None:
+            cache.set_valid_flags(rev, flags)
+
+    _VALID_FLAGS[rev] = flags
+    return flags
+
+
 class BugException(Exception):
     """Exception for Bugmon related issues"""
 
@@ -63,9 +182,15 @@ class EnhancedBug(Bug):
             "_build_flags",
             "_central_version",
             "_comment_zero",
-            "_env_variables",
+            "_commands",
+            "_commands_synced",
             "_initial_build_id",
+            "_patch_revs",
+            "_patch_revs_count",
             "_platform",
+            "_report",
+            "_runtime_opts",
+            "_whiteboard",
             "commands",
         }
     )
@@ -83,9 +208,15 @@ class EnhancedBug(Bug):
         self._build_flags: Optional[BuildFlags] = None
         self._central_version: Optional[int] = None
         self._comment_zero: Optional[str] = None
-        self._env_variables: Optional[Dict[str, str]] = None
+        self._commands: Optional[Dict[str, Optional[str]]] = None
+        self._commands_synced: Optional[Dict[str, Optional[str]]] = None
         self._initial_build_id: Optional[str] = None
+        self._patch_revs: Optional[Dict[str, str]] = None
+        self._patch_revs_count = 0
         self._platform: Optional[Platform] = None
+        self._report: Optional[ParsedReport] = None
+        self._runtime_opts: Optional[List[str]] = None
+        self._whiteboard: Optional[str] = None
 
     def __setattr__(self, attr: str, value: Any) -> None:
         if attr in self.LOCAL_ATTRS:
@@ -127,13 +258,10 @@ class EnhancedBug(Bug):
             }
 
             for alias in ["esr-next", "esr-stable"]:
-                try:
-                    release = Fetcher.resolve_esr(alias, "firefox")
-                    if release is not None:
-                        version = int(release.strip("esr"))
-                        self._branches[release] = version
-                except FetcherException:
-                    pass
+                release = _get_esr(alias)
+                if release is not None:
+                    version = int(release.strip("esr"))
+                    self._branches[release] = version
 
         return self._branches
 
@@ -141,20 +269,19 @@ class EnhancedBug(Bug):
     def build_flags(self) -> BuildFlags:
         """Attempt to enumerate build type based on flags listed in comment 0"""
         if self._build_flags is None:
-            asan = (
-                "AddressSanitizer" in self.comment_zero
-                or "--enable-address-sanitizer" in self.comment_zero
+            report = self.report
+            asan = "AddressSanitizer" in report.sanitizers or report.has_option(
+                "--enable-address-sanitizer"
             )
-            tsan = (
-                "ThreadSanitizer" in self.comment_zero
-                or "--enable-thread-sanitizer" in self.comment_zero
+            tsan = "ThreadSanitizer" in report.sanitizers or report.has_option(
+                "--enable-thread-sanitizer"
             )
-            debug = "--enable-debug" in self.comment_zero
-            fuzzing = "--enable-fuzzing" in self.comment_zero
-            coverage = "--enable-coverage" in self.comment_zero
-            valgrind = "--enable-valgrind" in self.comment_zero
-            no_opt = "--disable-optimize" in self.comment_zero
-            fuzzilli = "--enable-js-fuzzilli" in self.comment_zero
+            debug = report.has_option("--enable-debug")
+            fuzzing = report.has_option("--enable-fuzzing")
+            coverage = report.has_option("--enable-coverage")
+            valgrind = report.has_option("--enable-valgrind")
+            no_opt = report.has_option("--disable-optimize")
+            fuzzilli = report.has_option("--enable-js-fuzzilli")
             nyx = False  # We don't support nyx builds
             self._build_flags = BuildFlags(
                 asan,
@@ -179,39 +306,69 @@ class EnhancedBug(Bug):
         return self._central_version
 
     @property
-    def commands(self) -> Dict[str, Union[str, None]]:
-        """Attempt to extract commands from whiteboard"""
-        commands: dict[str, Union[str, None]] = {}
-        if self._bug["whiteboard"]:
-            match = re.search(r"(?<=\[bugmon:)[^]]+", self._bug["whiteboard"])
+    def commands(self) -> Dict[str, Optional[str]]:
+        """Bugmon commands listed in the whiteboard
+
+        The commands are parsed once and may be modified in place.  Changes are
+        written back to the whiteboard when it's read or the bug is committed.
+        Replacing the whiteboard discards the parsed commands.
+        """
+        whiteboard = self._bug["whiteboard"]
+        if self._commands is None or whiteboard != self._whiteboard:
+            commands: Dict[str, Optional[str]] = {}
+            match = COMMANDS_PATTERN.search(whiteboard) if whiteboard else None
             if match is not None:
-                for command in match.group(0).split(","):
+                for command in filter(None, match.group(0).split(",")):
                     if "=" in command:
                         name, value = command.split("=")
                         commands[name] = value
                     else:
                         commands[command] = None
 
-        return commands
+            self._commands = commands
+            self._commands_synced = dict(commands)
+            self._whiteboard = whiteboard
+
+        return self._commands
 
     @commands.setter
-    def commands(self, value: Dict[str, Union[str, None]]) -> None:
-        parts = ",".join([f"{k}={v}" if v is not None else k for k, v in value.items()])
+    def commands(self, value: Dict[str, Optional[str]]) -> None:
+        self._commands = dict(value)
+        # Always rewrite the whiteboard, even if the commands are unchanged
+        self._commands_synced = None
+        self._whiteboard = self._bug["whiteboard"]
+
+    @property
+    def whiteboard(self) -> str:
+        """Whiteboard including any pending command changes"""
+        self._sync_commands()
+        return cast(str, self._bug["whiteboard"])
+
+    def _sync_commands(self) -> None:
+        """Write modified commands back to the whiteboard"""
+        commands = self._commands
+        if commands is None or self._bug["whiteboard"] != self._whiteboard:
+            return
+        if commands == self._commands_synced:
+            return
+
+        parts = ",".join(
+            [f"{k}={v}" if v is not None else k for k, v in commands.items()]
+        )
         if len(parts) != 0:
-            if re.search(r"(?<=\[bugmon:)([^]]*)", self._bug["whiteboard"]):
+            if COMMANDS_PATTERN.search(self._bug["whiteboard"]):
                 # Update existing bugmon command list
-                pattern = re.compile(r"(?<=\[bugmon:)([^]]*)")
-                result = pattern.sub(parts, self._bug["whiteboard"])
+                result = COMMANDS_PATTERN.sub(parts, self._bug["whiteboard"])
             else:
                 # Insert new bugmon command list
                 result = f"{self._bug['whiteboard']}[bugmon:{parts}]"
         else:
             # Remove bugmon from whiteboard
-            pattern = re.compile(r"(\[bugmon:.*?])")
-            result = pattern.sub("", self._bug["whiteboard"])
+            result = COMMANDS_BLOCK_PATTERN.sub("", self._bug["whiteboard"])
 
-        if result is not None:
-            self._bug["whiteboard"] = result
+        self._bug["whiteboard"] = result
+        self._commands_synced = dict(commands)
+        self._whiteboard = result
 
     @property
     def comment_zero(self) -> str:
@@ -222,20 +379,18 @@ class EnhancedBug(Bug):
 
         return self._comment_zero
 
+    @property
+    def report(self) -> ParsedReport:
+        """Details listed in comment 0, parsed once"""
+        if self._report is None:
+            self._report = ParsedReport.parse(self.comment_zero)
+
+        return self._report
+
     @property
     def env(self) -> Dict[str, str]:
         """Attempt to enumerate any env_variables required"""
-        if self._env_variables is None:
-            self._env_variables = {}
-            tokens = self.comment_zero.split(" ")
-            for token in tokens:
-                if token.startswith("`") and token.endswith("`"):
-                    token = token[1:-1]
-                if re.match(r"([a-z0-9_]+=[a-z0-9])", token, re.IGNORECASE):
-                    name, value = token.split("=", 1)
-                    self._env_variables[name] = value
-
-        return self._env_variables
+        return self.report.env
 
     @property
     def initial_build_id(self) -> str:
@@ -249,14 +404,11 @@ class EnhancedBug(Bug):
             if re.match(rf"^{REV_MATCH}$", original_rev):
                 tokens.append(original_rev)
             else:
-                tokens.extend(re.findall(r"([A-Za-z0-9_-]+)", self.comment_zero))
+                tokens.extend(self.report.revisions)
 
             for token in tokens:
-                if token.startswith("`") and token.endswith("`"):
-                    token = token[1:-1]
-
                 # Match 12 or 40 character revs
-                if re.match(rf"^{REV_MATCH}$", token, re.IGNORECASE):
+                if REV_PATTERN.fullmatch(token):
                     try:
                         _get_rev(self.branch, token)
                         self._initial_build_id = token[:12]
@@ -265,7 +417,7 @@ class EnhancedBug(Bug):
                         pass
 
                 # Match fuzzfetch build identifiers
-                if re.match(rf"^{BID_MATCH}$", token, re.IGNORECASE):
+                if BID_PATTERN.fullmatch(token):
                     self._initial_build_id = token.split("-")[1][:12]
                     break
             else:
@@ -273,13 +425,13 @@ class EnhancedBug(Bug):
                 assert isinstance(self.creation_time, str)
                 creation_time = self.creation_time.split("T")[0]
                 try:
-                    instance = Fetcher(
-                        branch=self.branch,
-                        build=creation_time,
-                        flags=self.build_flags,
-                        targets=[],
-                        platform=self.platform,
-                        nearest=BuildSearchOrder.ASC,
+                    instance = BUILD_RESOLVER.resolve(
+                        self.branch,
+                        creation_time,
+                        self.build_flags,
+                        [],
+                        self.platform,
+                        BuildSearchOrder.ASC,
                     )
                     self._initial_build_id = instance.changeset
                 except FetcherException as e:
@@ -325,17 +477,32 @@ class EnhancedBug(Bug):
     @property
     def runtime_opts(self) -> List[str]:
         """Attempt to enumerate the runtime flags specified in comment 0"""
-        all_flags = JSEvaluator.get_valid_flags(self.initial_build_id)
-        flags = []
-        for flag in all_flags:
-            if flag in self.comment_zero:
-                match = re.search(
-                    rf"(--{flag}[a-z0-9=\-_]*)", self.comment_zero, re.IGNORECASE
-                )
-                if match is not None:
-                    flags.append(match.group(0))
-
-        return flags
+        if self._runtime_opts is None:
+            all_flags = get_valid_flags(self.initial_build_id)
+            # Retry on the next access if the valid flags couldn't be retrieved
+            if not all_flags:
+                return []
+
+            flags = []
+            for flag in all_flags:
+                option = self.report.find_option(flag)
+                if option is not None:
+                    flags.append(option)
+
+            self._runtime_opts = flags
+
+        # Evaluators may modify the list
+        return list(self._runtime_opts)
+
+    def _fetch_details(self) -> None:
+        """Retrieve any missing comments and attachments concurrently"""
+        kinds = [
+            kind for kind in ("comment", "attachment") if f"{kind}s" not in self._bug
+        ]
+        client = AsyncBugzilla(self._bugsy)
+        details = asyncio.run(client.get_details(self._bug["id"], kinds))
+        for kind, data in details.items():
+            self._bug[f"{kind}s"] = data
 
     def get_attachments(self) -> List[Attachment]:
         """Return list of attachments"""
@@ -343,7 +510,31 @@ class EnhancedBug(Bug):
             attachments = self._bug.get("attachments", [])
             return [LocalAttachment(**a) for a in attachments]
 
-        return cast(List[Attachment], super().get_attachments())
+        if "attachments" not in self._bug:
+            self._fetch_details()
+
+        return [Attachment(self._bugsy, **a) for a in self._bug["attachments"]]
+
+    def fetch_attachment_data(self, attachments: List[Attachment]) -> None:
+        """Retrieve the contents of attachments that were hydrated without them
+
+        The contents are retained so that later calls to get_attachments() include
+        them.  Cached bugs are expected to include the contents already.
+
+        :param attachments: Attachments returned by get_attachments()
+        """
+        missing = [a for a in attachments if a.data is None]
+        if self._bugsy is None or not missing:
+            return
+
+        client = AsyncBugzilla(self._bugsy)
+        data = asyncio.run(client.get_attachment_data([a.id for a in missing]))
+        for attachment in missing:
+            # Assigned directly as setting the attribute decodes the contents
+            attachment.to_dict()["data"] = data.get(attachment.id)
+        for raw in self._bug.get("attachments", []):
+            if raw["id"] in data:
+                raw["data"] = data[raw["id"]]
 
     def add_attachment(self, attachment: Attachment) -> None:
         """Add a new attachment when a bugsy instance is present
@@ -354,6 +545,7 @@ class EnhancedBug(Bug):
         if self._bugsy is None:
             raise TypeError("Method not supported when using a cached bug")
         super().add_attachment(attachment)
+        self._bug.pop("attachments", None)
 
     def get_comments(self) -> List[Comment]:
         """Returns list of comments
@@ -363,7 +555,10 @@ class EnhancedBug(Bug):
             comments = self._bug.get("comments", [])
             return [LocalComment(**c) for c in comments]
 
-        return cast(List[Comment], super().get_comments())
+        if "comments" not in self._bug:
+            self._fetch_details()
+
+        return [Comment(bugsy=self._bugsy, **c) for c in self._bug["comments"]]
 
     def add_comment(self, comment: Comment) -> None:
         """Add a new comment when a bugsy instance is present
@@ -373,6 +568,7 @@ class EnhancedBug(Bug):
         if self._bugsy is None:
             raise TypeError("Method not supported when using a cached bug")
         super().add_comment(comment)
+        self._bug.pop("comments", None)
 
     def add_needinfo(self, user: str) -> bool:
         """Adds a needinfo request for the specified user.
@@ -396,8 +592,18 @@ class EnhancedBug(Bug):
         self._bug["flags"].append(request)
         return True
 
+    def mark_committed(self) -> None:
+        """Treat the current state of the bug as submitted
+
+        Used when changes are submitted without refreshing the bug afterwards.
+        """
+        self._sync_commands()
+        self._bug.pop("comment", None)
+        self._copy = copy.deepcopy(self._bug)
+
     def diff(self) -> Dict[str, Union[str, Dict[str, Union[str, bool]]]]:
         """Overload Bug.diff() to strip attachments and comments"""
+        self._sync_commands()
         changed = cast(
             Dict[str, Union[str, Dict[str, Union[str, bool]]]], super().diff()
         )
@@ -408,31 +614,52 @@ class EnhancedBug(Bug):
 
         return changed
 
+    @property
+    def patch_revs(self) -> Dict[str, str]:
+        """Latest revision landed in each repository, as listed in the comments
+
+        Repositories are keyed by their path relative to HG_BASE.  The index is
+        rebuilt when the number of comments changes.
+        """
+        if self._bugsy is not None and "comments" not in self._bug:
+            self._fetch_details()
+
+        comments = self._bug.get("comments", [])
+        if self._patch_revs is None or self._patch_revs_count != len(comments):
+            latest: Dict[str, Tuple[str, str]] = {}
+            for comment in comments:
+                match = PATCH_REV_PATTERN.match(comment["text"])
+                if match is None:
+                    continue
+                repo, rev = match.group(1), match.group(2)
+                created = comment["creation_time"]
+                if repo not in latest or created > latest[repo][0]:
+                    latest[repo] = (created, rev)
+
+            self._patch_revs = {repo: rev for repo, (_, rev) in latest.items()}
+            self._patch_revs_count = len(comments)
+
+        return self._patch_revs
+
     def find_patch_rev(self, branch: str) -> Optional[str]:
         """Attempt to determine patch rev for the supplied branch
 
         :param branch: Branch name
         """
-        alias = f"mozilla-{branch}"
         if branch == "central":
-            pattern = re.compile(rf"(?:{HG_BASE}/{alias}/rev/){REV_MATCH}")
+            repo = "mozilla-central"
+        elif branch == "autoland":
+            repo = "integration/autoland"
         else:
-            pattern = re.compile(rf"(?:{HG_BASE}/releases/{alias}/rev/){REV_MATCH}")
-
-        comments = self.get_comments()
-        for comment in sorted(
-            comments, key=lambda c: cast(str, c.creation_time), reverse=True
-        ):
-            match = pattern.match(comment.text)
-            if match:
-                return match.group(1)
+            repo = f"releases/mozilla-{branch}"
 
-        return None
+        return self.patch_revs.get(repo)
 
     def to_dict(self) -> Dict[str, Any]:
         """Bug.to_dict() is used via Bugsy remote methods
         To avoid sending bad data, we need to exclude attachments and comments
         """
+        self._sync_commands()
         excluded = ["attachments", "comments"]
         return {k: v for k, v in self._bug.items() if k not in excluded}
 
@@ -440,6 +667,7 @@ class EnhancedBug(Bug):
         """Export entire bug in JSON safe format
         May include attachments and comments
         """
+        self._sync_commands()
         return json.dumps(self._bug, default=sanitize_bug)
 
     def update(self) -> None:
@@ -461,6 +689,7 @@ class EnhancedBug(Bug):
 
         bug_data = bug.to_dict()
         attachments = bug.get_attachments()
+        bug.fetch_attachment_data(attachments)
         bug_data["attachments"] = [a.to_dict() for a in attachments]
 
         comments = bug.get_comments()
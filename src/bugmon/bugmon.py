@@ -4,28 +4,65 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file, You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 import abc
-import base64
+import asyncio
 import binascii
-import copy
-import io
+import functools
+import itertools
 import json
 import logging
+import multiprocessing
+import os
+import signal
+import tempfile
 import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.context import BaseContext
 from pathlib import Path
-from typing import Dict, List, Optional, Union, cast
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+    cast,
+)
 
-from autobisect.bisect import BisectionResult, Bisector
+import requests
+from autobisect.bisect import BisectionResult
 from autobisect.build_manager import BuildManager, BuildManagerException
 from autobisect.evaluators import BrowserEvaluator, EvaluatorResult, JSEvaluator
-from bugsy.bugsy import Bugsy
-from fuzzfetch import BuildSearchOrder, Fetcher, FetcherException
+from bugsy.bugsy import Bugsy, BugsyException
+from fuzzfetch import BuildFlags, BuildSearchOrder, Fetcher, FetcherException, Platform
 
+from .attachments import AttachmentStore
+from .bisection import KnownOutcome, SeededBisector, StoredBuild
 from .bug import EnhancedBug
-from .evaluator_configs import BugConfigs, BugConfiguration
+from .builds import BUILD_RESOLVER, BuildKey, get_build, is_transient
+from .bugzilla import AsyncBugzilla
+from .cache import Cache, get_cache, make_key, set_cache
+from .evaluator_configs import (
+    BugConfigs,
+    BugConfiguration,
+    ConfigRanker,
+    RepeatPolicy,
+    clear_testcase_index,
+)
 from .exceptions import BugmonException
+from .prefetch import get_prefetcher
+from .tracing import get_tracer, set_tracer, span
+from .updates import get_commit_queue
 from .utils import (
     PernoscoCreds,
+    console_init_logging,
     get_pernosco_trace,
+    hash_directory,
     is_pernosco_available,
     submit_pernosco,
 )
@@ -34,6 +71,14 @@ log = logging.getLogger(__name__)
 
 AVAILABLE_BRANCHES = ["mozilla-central", "mozilla-beta", "mozilla-release"]
 
+UNSUPPORTED_RESOLUTIONS = ("DUPLICATE", "INVALID", "WORKSFORME", "WONTFIX")
+
+# Number of candidate configurations inspected ahead for builds to prefetch
+PREFETCH_LOOKAHEAD = 8
+
+# Seconds terminated workers are given to clean up before they are killed
+WORKER_GRACE = 10
+
 TESTCASE_URL = "https://github.com/MozillaSecurity/bugmon#testcase-identification"
 
 
@@ -61,6 +106,116 @@ class ReproductionPassed(ReproductionBuildBase):
     """Reproduction result representing passes"""
 
 
+def _exit_worker(signum: int, _frame: Any) -> None:
+    """Raise SystemExit so that evaluators clean up when a worker is terminated
+
+    :param signum: Signal number
+    """
+    raise SystemExit(128 + signum)
+
+
+def _init_worker(
+    temp_root: Path, cache_dir: Optional[Path], trace: Optional[Path]
+) -> None:
+    """Prepare a worker process for evaluating builds
+
+    Workers don't inherit the state of the parent so logging, the cache and the
+    tracer are configured explicitly.  Each worker is given its own scratch space for profiles
+    and logs, and leads its own process group so that any processes launched by an
+    evaluator can be stopped along with the worker.
+
+    :param temp_root: Directory in which worker directories are created
+    :param cache_dir: Path used for persisting reproduction results
+    :param trace: Path to which timing spans are appended
+    """
+    console_init_logging()
+    set_cache(cache_dir)
+    set_tracer(trace)
+    tempfile.tempdir = tempfile.mkdtemp(dir=temp_root)
+    signal.signal(signal.SIGTERM, _exit_worker)
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+
+
+def _worker_context() -> BaseContext:
+    """Return the multiprocessing context used for evaluating builds
+
+    Workers are never forked directly from this process as prefetch and request
+    threads may be holding locks at the time.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
+
+
+def _terminate_pool(executor: ProcessPoolExecutor) -> None:
+    """Stop the pool without waiting for running evaluations to complete
+
+    Queued work is cancelled and the workers are terminated.  Workers which haven't
+    exited after WORKER_GRACE seconds are killed along with their process group.
+
+    :param executor: The pool to stop
+    """
+    # pylint: disable=protected-access
+    processes = list((getattr(executor, "_processes", None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+    for process in processes:
+        process.join(WORKER_GRACE)
+        if hasattr(os, "killpg"):
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+        if process.is_alive():
+            process.kill()
+        process.join()
+
+
+def _evaluate_candidate(
+    config: BugConfiguration, build: Fetcher
+) -> Optional[EvaluatorResult]:
+    """Evaluate a candidate configuration within a worker process
+
+    :param config: The bug configuration to use for running the testcase
+    :param build: The resolved build
+    :return: The evaluator result or None if the build could not be retrieved
+    """
+    log.info(f"Attempting to reproduce bug on {build.get_auto_name()}...")
+    try:
+        with get_build(BuildManager(), build, config.evaluator.target) as path:
+            return config.evaluate(path)
+    except (BuildManagerException, FetcherException) as e:
+        log.error(f"Error fetching build: {e}")
+        return None
+
+
+Candidate = Tuple[
+    BugConfiguration,
+    Optional[Fetcher],
+    Union[ReproductionBase, "Future[Optional[EvaluatorResult]]"],
+]
+
+
+def _shutdown_pool(
+    executor: ProcessPoolExecutor, candidates: Iterable[Candidate]
+) -> None:
+    """Stop the pool, terminating it if any of the candidates are still running
+
+    :param executor: The pool to stop
+    :param candidates: Candidates submitted to the pool
+    """
+    if any(isinstance(c[2], Future) and not c[2].done() for c in candidates):
+        _terminate_pool(executor)
+    else:
+        executor.shutdown(wait=True)
+
+
+BuildArgs = Tuple[str, str, BuildFlags, List[str], Platform, Optional[BuildSearchOrder]]
+
+
 class BugMonitor:
     """Main bugmon class"""
 
@@ -71,6 +226,8 @@ class BugMonitor:
         working_dir: Path,
         pernosco_creds: Optional[PernoscoCreds] = None,
         dry_run: Optional[bool] = False,
+        detect_jobs: int = 1,
+        verify_jobs: int = 1,
     ) -> None:
         """Initializes new BugMonitor instance
 
@@ -79,11 +236,17 @@ class BugMonitor:
         :param working_dir: Path to working directory
         :param pernosco_creds: Optional pernosco credentials.
         :param dry_run: Boolean indicating if changes should be made to the bug
+        :param detect_jobs: Number of candidate configurations evaluated concurrently
+        :param verify_jobs: Number of fixed branches verified concurrently
         :raises BugmonException: If pernosco_creds is supplied but pernosco is not configured
         """
         self.bugsy = bugsy
         self.bug = bug
 
+        self.working_dir = working_dir
+        self.detect_jobs = detect_jobs
+        self.verify_jobs = verify_jobs
+
         self.test_dir = working_dir / "testcase"
         self.test_dir.mkdir()
         self.log_dir = working_dir / "logs"
@@ -96,10 +259,17 @@ class BugMonitor:
                 raise BugmonException("pernosco-submit is not properly configured!")
 
         self.queue: List[str] = []
-        self.results: Dict[str, Dict[str, ReproductionBase]] = {}
+        # Results per branch, keyed by configuration parameters and build name
+        self.results: Dict[str, Dict[Tuple[str, str], ReproductionBase]] = {}
         self.build_manager = BuildManager()
 
         self._close_bug = False
+        self._testcase_hash: Optional[str] = None
+        self._config: Optional[BugConfiguration] = None
+        self._config_detected = False
+        self._materialized: Set[Path] = set()
+        # Builds selected by plan_reproductions(), reused for the rest of the run
+        self._pinned: Dict[BuildKey, Fetcher] = {}
 
     def _bisect(
         self, config: Optional[BugConfiguration] = None
@@ -123,25 +293,10 @@ class BugMonitor:
             start = None
             end = self.bug.initial_build_id
 
-        try:
-            bisector = Bisector(
-                config.evaluator,
-                self.bug.branch,
-                start,
-                end,
-                config.build_flags,
-                self.bug.platform,
-                find_fix,
-            )
-        except FetcherException as e:
-            if "bisected" not in self.bug.commands:
-                self.add_command("bisected")
-
-            self.report(f"Unable to bisect testcase ({str(e).lower()}).")
+        result = self._run_bisection(config, start, end, find_fix)
+        if result is None:
             return None
 
-        result = bisector.bisect()
-
         # Set bisected status and remove the bisect command
         if "bisected" not in self.bug.commands:
             self.add_command("bisected")
@@ -175,6 +330,145 @@ class BugMonitor:
 
         return result
 
+    def _run_bisection(
+        self,
+        config: BugConfiguration,
+        start: Optional[str],
+        end: Optional[str],
+        find_fix: bool,
+    ) -> Optional[BisectionResult]:
+        """Bisect the supplied range, reusing stored results where possible
+
+        Results are shared between bugs with identical testcases and configurations.
+        A stored range is reused if it lies within the requested builds.
+
+        :param config: The bug configuration to use for running the testcase
+        :param start: Start revision, date, or buildid
+        :param end: End revision, date, or buildid
+        :param find_fix: Boolean identifying whether to find a fix
+        :return: The bisection result or None if the range couldn't be resolved
+        """
+        cache = self._result_cache(config)
+        context = make_key(
+            self.testcase_hash,
+            config.params_key(self.test_dir),
+            self._platform_key,
+            self.bug.branch,
+            find_fix,
+        )
+        key = make_key(context, start, end)
+
+        with span(
+            "bisect", bug_id=self.bug.id, branch=self.bug.branch, find_fix=find_fix
+        ) as s:
+            stored = cache.get_bisection(key) if cache is not None else None
+            if stored is None:
+                try:
+                    bisector = SeededBisector(
+                        config.evaluator,
+                        self.bug.branch,
+                        start,
+                        end,
+                        config.build_flags,
+                        self.bug.platform,
+                        find_fix,
+                        known=self._known_outcomes(config, self.bug.branch),
+                        record=functools.partial(self._record_step, config),
+                    )
+                except FetcherException as e:
+                    if "bisected" not in self.bug.commands:
+                        self.add_command("bisected")
+
+                    self.report(f"Unable to bisect testcase ({str(e).lower()}).")
+                    return None
+
+                if cache is not None:
+                    stored = cache.find_bisection(
+                        context, bisector.start.id, bisector.end.id
+                    )
+
+            if stored is not None:
+                log.info("Using stored bisection result")
+                s.set(cache="hit")
+                return BisectionResult(
+                    BisectionResult.SUCCESS,
+                    cast(Fetcher, StoredBuild.start(stored)),
+                    cast(Fetcher, StoredBuild.end(stored)),
+                    self.bug.branch,
+                )
+
+            s.set(cache="miss")
+            bisector.narrow()
+            result = bisector.bisect()
+            s.set(status=result.status, message=result.message)
+
+        if cache is not None and result.status == BisectionResult.SUCCESS:
+            cache.set_bisection(
+                key,
+                context,
+                {
+                    "start_id": result.start.id,
+                    "start_changeset": result.start.changeset,
+                    "end_id": result.end.id,
+                    "end_changeset": result.end.changeset,
+                    "repo": result.start.build_info["moz_source_repo"],
+                },
+            )
+
+        return result
+
+    def _known_outcomes(
+        self, config: BugConfiguration, branch: str
+    ) -> List[KnownOutcome]:
+        """Return the outcomes observed for the testcase on the supplied branch
+
+        Includes the results of this run and, if configured, those stored for any
+        bug with an identical testcase and configuration.
+
+        :param config: The bug configuration used for running the testcase
+        :param branch: Branch the builds belong to
+        """
+        params = config.params_key(self.test_dir)
+        known = []
+        for (result_params, _), result in self.results.get(branch, {}).items():
+            # Outcomes of other configurations say nothing about this one
+            if result_params != params:
+                continue
+            if isinstance(result, ReproductionCrashed):
+                status = EvaluatorResult.BUILD_CRASHED
+            elif isinstance(result, ReproductionPassed):
+                status = EvaluatorResult.BUILD_PASSED
+            else:
+                continue
+            known.append(KnownOutcome(result.build.id, result.build.changeset, status))
+
+        cache = self._result_cache(config)
+        if cache is not None:
+            for build_id, changeset, stored in cache.get_results(
+                self.testcase_hash,
+                params,
+                self._platform_key,
+                branch,
+            ):
+                known.append(KnownOutcome(build_id, changeset, EvaluatorResult[stored]))
+
+        return known
+
+    def _record_step(
+        self, config: BugConfiguration, build: Fetcher, status: EvaluatorResult
+    ) -> None:
+        """Store the result of a build evaluated during bisection
+
+        Bisection may probe builds from other branches (e.g. autoland), so results
+        are recorded against the branch of the build itself.
+
+        :param config: The bug configuration used for running the testcase
+        :param build: The evaluated build
+        :param status: Evaluator result
+        """
+        branch = build._branch  # pylint: disable=W0212
+        self.record_result(config, branch, build, status)
+
     def _confirm_open(self) -> None:
         """Attempt to confirm open test cases"""
         config = self.detect_config()
@@ -256,11 +550,13 @@ class BugMonitor:
             else:
                 config.evaluator.timeout = 300
 
-            result = self._reproduce_bug(
-                config,
-                self.bug.branch,
-                self.bug.initial_build_id,
-            )
+            with span("pernosco.record", bug_id=self.bug.id) as s:
+                result = self._reproduce_bug(
+                    config,
+                    self.bug.branch,
+                    self.bug.initial_build_id,
+                )
+                s.set(result=type(result).__name__)
 
             if isinstance(result, ReproductionCrashed):
                 latest_trace = get_pernosco_trace(self.log_dir)
@@ -283,11 +579,12 @@ class BugMonitor:
                         return None
 
                     log.info("Uploading pernosco session...")
-                    submit_pernosco(
-                        latest_trace,
-                        self.bug.id,
-                        self.pernosco_creds,
-                    )
+                    with span("pernosco.submit", bug_id=self.bug.id):
+                        submit_pernosco(
+                            latest_trace,
+                            self.bug.id,
+                            self.pernosco_creds,
+                        )
 
                 self.report(
                     "Successfully recorded a pernosco session.  "
@@ -324,6 +621,12 @@ class BugMonitor:
         if config is None:
             return None
 
+        # Download the fixed branch builds while the bug branch is evaluated
+        for alias, _ in self._fixed_branches():
+            patch_rev = self.bug.find_patch_rev(alias)
+            if patch_rev is not None:
+                self._prefetch(config, alias, patch_rev)
+
         if self.bug.status != "VERIFIED":
             patch_rev = self.bug.find_patch_rev(self.bug.branch)
             tip = self._reproduce_bug(config, self.bug.branch, patch_rev)
@@ -364,32 +667,37 @@ class BugMonitor:
                 if "confirmed" not in self.bug.commands:
                     self.add_command("confirmed")
 
+        # Only check branches if bug is marked as fixed
+        targets: List[Tuple[str, str, str]] = []
+        for alias, flag in self._fixed_branches():
+            patch_rev = self.bug.find_patch_rev(alias)
+            if patch_rev is None:
+                # This may have been fixed in another bug.
+                log.warning(f"Unable to find commit for {alias}.  Cannot verify fix!")
+                continue
+            targets.append((alias, flag, patch_rev))
+
+        results: Iterable[ReproductionBase]
+        if self.verify_jobs > 1 and len(targets) > 1:
+            results = self._verify_parallel(config, targets)
+        else:
+            results = (
+                self._reproduce_bug(config, alias, patch_rev)
+                for alias, _, patch_rev in targets
+            )
+
         branches_verified = True
-        for alias, rel_num in self.bug.branches.items():
-            if isinstance(rel_num, int):
-                flag = f"cf_status_firefox{rel_num}"
-            else:
-                flag = f"cf_status_firefox_{rel_num}"
+        # Flags are updated in branch order regardless of completion order
+        for (alias, flag, _), branch in zip(targets, results):
+            if isinstance(branch, ReproductionPassed):
+                log.info(f"Verified fixed on {flag}")
+                setattr(self.bug, flag, "verified")
+                continue
 
-            # Only check branches if bug is marked as fixed
-            if getattr(self.bug, flag) == "fixed":
-                patch_rev = self.bug.find_patch_rev(alias)
-                if patch_rev is None:
-                    # This may have been fixed in another bug.
-                    log.warning(
-                        f"Unable to find commit for fx{rel_num}.  Cannot verify fix!"
-                    )
-                    continue
-                branch = self._reproduce_bug(config, alias, patch_rev)
-                if isinstance(branch, ReproductionPassed):
-                    log.info(f"Verified fixed on {flag}")
-                    setattr(self.bug, flag, "verified")
-                    continue
-
-                branches_verified = False
-                if isinstance(branch, ReproductionCrashed):
-                    log.info(f"Bug remains vulnerable on {flag}")
-                    setattr(self.bug, flag, "affected")
+            branches_verified = False
+            if isinstance(branch, ReproductionCrashed):
+                log.info(f"Bug remains vulnerable on {flag}")
+                setattr(self.bug, flag, "affected")
 
         if self.bug.status == "VERIFIED" and branches_verified:
             # Remove from further analysis
@@ -397,6 +705,181 @@ class BugMonitor:
 
         return None
 
+    @property
+    def testcase_hash(self) -> str:
+        """Digest of the testcase directory contents"""
+        if self._testcase_hash is None:
+            self._testcase_hash = hash_directory(self.test_dir)
+
+        return self._testcase_hash
+
+    def _build_args(
+        self,
+        config: BugConfiguration,
+        branch: str,
+        bid: Optional[str] = None,
+    ) -> BuildArgs:
+        """Arguments identifying the build lookup for the supplied branch and build id
+
+        :param config: The bug configuration to use for running the testcase
+        :param branch: Branch where build is found
+        :param bid: Build id (rev or date)
+        """
+        direction: Optional[BuildSearchOrder] = BuildSearchOrder.ASC
+        if bid is None:
+            bid = "latest"
+            direction = None
+
+        return (
+            branch,
+            bid,
+            config.build_flags,
+            [config.evaluator.target],
+            self.bug.platform,
+            direction,
+        )
+
+    def _resolve_build(
+        self,
+        config: BugConfiguration,
+        branch: str,
+        bid: Optional[str] = None,
+        pin: bool = False,
+    ) -> Optional[Fetcher]:
+        """Resolve the build matching the supplied branch and build id
+
+        Builds pinned by an earlier call are returned without being resolved again.
+
+        :param config: The bug configuration to use for running the testcase
+        :param branch: Branch where build is found
+        :param bid: Build id (rev or date)
+        :param pin: Reuse the resolved build for the remainder of the run
+        """
+        args = self._build_args(config, branch, bid)
+        key = BUILD_RESOLVER.make_key(*args)
+        if key in self._pinned:
+            return self._pinned[key]
+
+        try:
+            build = BUILD_RESOLVER.resolve(*args)
+        except FetcherException as e:
+            log.error(f"Error fetching build: {e}")
+            return None
+
+        if pin:
+            self._pinned[key] = build
+        return build
+
+    def _prefetch(
+        self,
+        config: BugConfiguration,
+        branch: str,
+        bid: Optional[str] = None,
+    ) -> None:
+        """Queue the build for download if a prefetcher is configured
+
+        :param config: The bug configuration to use for running the testcase
+        :param branch: Branch where build is found
+        :param bid: Build id (rev or date)
+        """
+        prefetcher = get_prefetcher()
+        if prefetcher is not None:
+            prefetcher.prefetch(
+                branch,
+                bid,
+                config.build_flags,
+                config.evaluator.target,
+                self.bug.platform,
+            )
+
+    def _lookup_result(
+        self,
+        config: BugConfiguration,
+        branch: str,
+        build: Fetcher,
+        use_cache: Optional[bool] = True,
+    ) -> Optional[ReproductionBase]:
+        """Retrieve a previous result for the supplied build
+
+        :param config: The bug configuration to use for running the testcase
+        :param branch: Branch where build is found
+        :param build: The resolved build
+        :param use_cache: Check for previous result using build/bid combination
+        """
+        build_name = build.get_auto_name()
+        params = config.params_key(self.test_dir)
+        # Check if this branch and build was already tested with this configuration
+        results = self.results.setdefault(branch, {})
+        if use_cache and (params, build_name) in results:
+            return results[(params, build_name)]
+
+        cache = self._result_cache(config)
+        if cache is not None:
+            stored = cache.get_result(
+                self.bug.id,
+                self.testcase_hash,
+                params,
+                self._platform_key,
+                build.changeset,
+            )
+            if stored is not None:
+                log.info(f"Using stored result for {build_name} ({stored})")
+                result = self._to_result(EvaluatorResult[stored], build)
+                results[(params, build_name)] = result
+                return result
+
+        return None
+
+    def record_result(
+        self,
+        config: BugConfiguration,
+        branch: str,
+        build: Fetcher,
+        status: EvaluatorResult,
+    ) -> ReproductionBase:
+        """Store the evaluator status for the supplied build
+
+        :param config: The bug configuration used for running the testcase
+        :param branch: Branch where build is found
+        :param build: The evaluated build
+        :param status: Evaluator result
+        """
+        result = self._to_result(status, build)
+        params = config.params_key(self.test_dir)
+        self.results.setdefault(branch, {})[(params, build.get_auto_name())] = result
+
+        cache = self._result_cache(config)
+        if cache is not None and status != EvaluatorResult.BUILD_FAILED:
+            cache.set_result(
+                self.bug.id,
+                self.testcase_hash,
+                params,
+                self._platform_key,
+                branch,
+                build.id,
+                build.changeset,
+                status.name,
+            )
+
+        return result
+
+    @staticmethod
+    def _result_cache(config: BugConfiguration) -> Optional[Cache]:
+        """Return the persistent result cache if usable for the configuration
+
+        :param config: The bug configuration to use for running the testcase
+        """
+        # Recording a pernosco session requires actually running the build
+        if getattr(config.evaluator, "pernosco", False):
+            return None
+
+        return get_cache()
+
+    @property
+    def _platform_key(self) -> str:
+        """Platform identifier used for persisting results"""
+        return f"{self.bug.platform.system}-{self.bug.platform.machine}"
+
     def _reproduce_bug(
         self,
         config: BugConfiguration,
@@ -408,56 +891,60 @@ class BugMonitor:
 
         Attempts to reproduce the bug using the specified branch.  If a build id is not
         specified, tip will be used.  Supports caching previous results unless a custom
-        evaluator has been supplied.
+        evaluator has been supplied.  When a persistent cache is configured, results
+        from previous runs are used regardless of use_cache as they are keyed on the
+        testcase and configuration.
 
         :param config: The bug configuration to use for running the testcase
         :param branch: Branch where build is found
         :param bid: Build id (rev or date)
         :param use_cache: Check for previous result using build/bid combination
         """
-        try:
-            direction: Optional[BuildSearchOrder] = BuildSearchOrder.ASC
-            if bid is None:
-                bid = "latest"
-                direction = None
-
-            build = Fetcher(
-                branch=branch,
-                build=bid,
-                flags=config.build_flags,
-                targets=[config.evaluator.target],
-                platform=self.bug.platform,
-                nearest=direction,
-            )
-        except FetcherException as e:
-            log.error(f"Error fetching build: {e}")
-            return ReproductionFailed()
+        with span("reproduce", bug_id=self.bug.id, branch=branch, bid=bid) as s:
+            build = self._resolve_build(config, branch, bid)
+            if build is None:
+                s.set(result="unavailable")
+                return ReproductionFailed()
+
+            s.set(build=build.get_auto_name(), params=dict(config.params))
+            previous = self._lookup_result(config, branch, build, use_cache)
+            if previous is not None:
+                s.set(cache="hit", result=type(previous).__name__)
+                return previous
+
+            s.set(cache="miss")
+            log.info(f"Attempting to reproduce bug on {build.get_auto_name()}...")
+
+            target = config.evaluator.target
+            try:
+                with get_build(self.build_manager, build, target) as path:
+                    status = config.evaluate(path)
+            except (BuildManagerException, FetcherException) as e:
+                log.error(f"Error fetching build: {e}")
+                BUILD_RESOLVER.mark_unavailable(
+                    *self._build_args(config, branch, bid), transient=is_transient(e)
+                )
+                s.set(result="unavailable")
+                return ReproductionFailed()
 
-        build_name = build.get_auto_name()
-        # Check if this branch and build was already tested
-        if branch in self.results:
-            if use_cache and build_name in self.results[branch]:
-                return self.results[branch][build_name]
-        else:
-            self.results[branch] = {}
+            result = self.record_result(config, branch, build, status)
+            s.set(result=type(result).__name__)
 
-        log.info(f"Attempting to reproduce bug on {build_name}...")
+        return result
 
-        try:
-            with self.build_manager.get_build(build, config.evaluator.target) as path:
-                status = config.evaluator.evaluate_testcase(path)
-                result: ReproductionBase
-                if status == EvaluatorResult.BUILD_CRASHED:
-                    result = ReproductionCrashed(build)
-                elif status == EvaluatorResult.BUILD_PASSED:
-                    result = ReproductionPassed(build)
-                else:
-                    result = ReproductionFailed()
-                self.results[branch][build_name] = result
-                return self.results[branch][build_name]
-        except BuildManagerException as e:
-            log.error(f"Error fetching build: {e}")
-            return ReproductionFailed()
+    @staticmethod
+    def _to_result(status: EvaluatorResult, build: Fetcher) -> ReproductionBase:
+        """Convert an evaluator status into a reproduction result
+
+        :param status: Evaluator result
+        :param build: The evaluated build
+        """
+        if status == EvaluatorResult.BUILD_CRASHED:
+            return ReproductionCrashed(build)
+        if status == EvaluatorResult.BUILD_PASSED:
+            return ReproductionPassed(build)
+
+        return ReproductionFailed()
 
     def add_command(self, key: str, value: None = None) -> None:
         """Add a bugmon command to the whiteboard
@@ -465,51 +952,132 @@ class BugMonitor:
         :param key: The command key name
         :param value: The command value
         """
-        commands = copy.deepcopy(self.bug.commands)
-        commands[key] = value
-        self.bug.commands = commands
+        self.bug.commands[key] = value
 
     def remove_command(self, key: str) -> None:
         """Remove a bugmon command to the whiteboard
 
         :param key: The command key name
         """
-        commands = copy.deepcopy(self.bug.commands)
-        if key in commands:
-            del commands[key]
+        self.bug.commands.pop(key, None)
+
+    def _attachment_store(self) -> AttachmentStore:
+        """Return the persistent attachment store or one local to this monitor"""
+        cache = get_cache()
+        if cache is not None:
+            return AttachmentStore(cache.path / "attachments")
 
-        self.bug.commands = commands
+        return AttachmentStore(self.working_dir / "attachments")
 
     def fetch_attachments(self, unpack: Optional[bool] = True) -> None:
         """Download all attachments and store them in self.test_dir
 
+        Attachments already present in self.test_dir are not retrieved again.
+
         :param unpack: Boolean indicating if archives should be unpacked
         """
-        attachments = filter(lambda a: not a.is_obsolete, self.bug.get_attachments())
-        for attachment in sorted(attachments, key=lambda a: cast(str, a.creation_time)):
-            # Ignore patches
-            if attachment.content_type == "text/x-phabricator-request":
+        with span("attachments.fetch", bug_id=self.bug.id) as s:
+            stored = self._fetch_attachments(bool(unpack))
+            s.set(attachments=len(stored), cached=stored.count(True))
+
+    def _fetch_attachments(self, unpack: bool) -> List[bool]:
+        """Store the attachments and link them into self.test_dir
+
+        :param unpack: Boolean indicating if archives should be unpacked
+        :return: Whether each attachment was already present in the store
+        """
+        self._testcase_hash = None
+        clear_testcase_index(self.test_dir)
+        stored: List[bool] = []
+        store = self._attachment_store()
+        # Ignore obsolete attachments and patches
+        attachments = [
+            a
+            for a in self.bug.get_attachments()
+            if not a.is_obsolete and a.content_type != "text/x-phabricator-request"
+        ]
+        entries = [
+            (attachment, store.entry(attachment, unpack))
+            for attachment in sorted(
+                attachments, key=lambda a: cast(str, a.creation_time)
+            )
+        ]
+
+        # Contents are only needed for attachments that haven't been stored
+        missing = [attachment for attachment, entry in entries if not entry.is_dir()]
+        try:
+            self.bug.fetch_attachment_data(missing)
+        except (BugsyException, requests.exceptions.RequestException) as e:
+            log.warning("Failed to retrieve attachments: %s", e)
+
+        for attachment, entry in entries:
+            cached = entry.is_dir()
+            if not cached and attachment.data is None:
                 continue
 
             try:
-                data = base64.decodebytes(attachment.data.encode("utf-8"))
+                store.get(attachment, unpack, entry)
             except binascii.Error as e:
                 log.warning("Failed to decode attachment: %s", e)
                 continue
+            except (zipfile.BadZipFile, BugmonException) as e:
+                log.warning("Failed to decompress attachment: %s", e)
+                continue
 
-            if unpack and attachment.file_name.endswith(".zip"):
-                try:
-                    with zipfile.ZipFile(io.BytesIO(data)) as z:
-                        for filename in z.namelist():
-                            if (self.test_dir / filename).exists():
-                                log.warning("Duplicate filename: %s", filename)
-                            z.extract(filename, self.test_dir)
-                except zipfile.BadZipFile as e:
-                    log.warning("Failed to decompress attachment: %s", e)
-                    continue
+            stored.append(cached)
+            if entry not in self._materialized:
+                store.materialize(entry, self.test_dir)
+                self._materialized.add(entry)
+
+        return stored
+
+    def plan_reproductions(self) -> List[Tuple[BugConfiguration, str, Fetcher]]:
+        """Enumerate reproductions that process() will require but hasn't performed
+
+        Only builds that are needed regardless of earlier outcomes are included.
+        Detects the bug configuration if it hasn't been detected yet.
+        """
+        if self.bug.resolution in UNSUPPORTED_RESOLUTIONS:
+            return []
+
+        targets: List[Tuple[str, Optional[str]]] = []
+        if self.needs_verify():
+            if self.bug.status != "VERIFIED":
+                branch = self.bug.branch
+                targets.append((branch, self.bug.find_patch_rev(branch)))
+            for alias, _ in self._fixed_branches():
+                patch_rev = self.bug.find_patch_rev(alias)
+                if patch_rev is not None:
+                    targets.append((alias, patch_rev))
+        elif self.needs_confirm() or self.needs_bisect():
+            targets.append((self.bug.branch, None))
+
+        if not targets:
+            return []
 
+        config = self.detect_config()
+        if config is None:
+            return []
+
+        planned = []
+        for branch, bid in targets:
+            # Pinned so that process() evaluates the same build once "latest" expires
+            build = self._resolve_build(config, branch, bid, pin=True)
+            if build is not None and self._lookup_result(config, branch, build) is None:
+                planned.append((config, branch, build))
+
+        return planned
+
+    def _fixed_branches(self) -> Iterator[Tuple[str, str]]:
+        """Iterate over branch aliases and status flags for branches marked fixed"""
+        for alias, rel_num in self.bug.branches.items():
+            if isinstance(rel_num, int):
+                flag = f"cf_status_firefox{rel_num}"
             else:
-                Path(self.test_dir, attachment.file_name).write_bytes(data)
+                flag = f"cf_status_firefox_{rel_num}"
+
+            if getattr(self.bug, flag) == "fixed":
+                yield alias, flag
 
     def needs_bisect(self) -> bool:
         """Helper function to determine eligibility for 'bisect'"""
@@ -549,15 +1117,7 @@ class BugMonitor:
             return True
 
         if self.bug.status == "VERIFIED":
-            for rel_num in self.bug.branches.values():
-                base = "cf_status_firefox"
-                flag = (
-                    f"{base}{rel_num}"
-                    if isinstance(rel_num, int)
-                    else f"{base}_{rel_num}"
-                )
-                if getattr(self.bug, flag) == "fixed":
-                    return True
+            return any(True for _ in self._fixed_branches())
 
         return False
 
@@ -570,15 +1130,226 @@ class BugMonitor:
             self._close_bug = True
             return False
 
-        if self.bug.resolution in ("DUPLICATE", "INVALID", "WORKSFORME", "WONTFIX"):
+        if self.bug.resolution in UNSUPPORTED_RESOLUTIONS:
             self.report(f"No valid actions for resolution ({self.bug.resolution}).")
             self._close_bug = True
             return False
 
         return True
 
+    def _repeat_policy(self, config: BugConfiguration) -> RepeatPolicy:
+        """Create the repeat policy for a candidate configuration
+
+        :param config: The candidate configuration
+        """
+        key = make_key(
+            self.bug.id, self.testcase_hash, config.params_key(self.test_dir)
+        )
+        repeat = getattr(config.evaluator, "repeat", 1)
+        return RepeatPolicy(repeat, self._result_cache(config), key)
+
+    def _ranker(self) -> Optional[ConfigRanker]:
+        """Return a configuration ranker if a persistent cache is configured"""
+        cache = get_cache()
+        if cache is None:
+            return None
+
+        return ConfigRanker(cache, self.bug, self.test_dir)
+
+    def _iter_candidates(self) -> Iterator[BugConfiguration]:
+        """Iterate over all candidate configurations in priority order"""
+        ranker = self._ranker()
+        candidates: Iterator[BugConfiguration]
+        if ranker is not None:
+            candidates = ranker.rank(BugConfigs)
+        else:
+            candidates = itertools.chain.from_iterable(
+                Config.iterate(self.bug, self.test_dir) for Config in BugConfigs
+            )
+
+        if get_prefetcher() is not None:
+            candidates = self._prefetch_ahead(candidates)
+
+        for config in candidates:
+            name = type(config).__name__
+            build_args = self._build_args(
+                config, self.bug.branch, self.bug.initial_build_id
+            )
+            if BUILD_RESOLVER.is_unavailable(*build_args):
+                log.info(f"Skipping config: {name} (build unavailable)")
+                continue
+
+            config.apply_policy(self._repeat_policy(config))
+
+            opts = ", ".join([f"{k}: {v}" for k, v in config.params.items()])
+            log.info(f"Using config: {name} ({opts})")
+            yield config
+
+    def _prefetch_ahead(
+        self, candidates: Iterator[BugConfiguration]
+    ) -> Iterator[BugConfiguration]:
+        """Download the builds of upcoming flag sets while earlier ones are evaluated
+
+        Only PREFETCH_LOOKAHEAD candidates are created ahead of those consumed.
+
+        :param candidates: Candidate configurations in priority order
+        """
+        window: Deque[BugConfiguration] = deque()
+        seen: Set[Tuple[str, Tuple[bool, ...]]] = set()
+        for config in candidates:
+            key = (config.evaluator.target, tuple(config.build_flags))
+            if seen and key not in seen:
+                self._prefetch(config, self.bug.branch, self.bug.initial_build_id)
+            seen.add(key)
+
+            window.append(config)
+            if len(window) > PREFETCH_LOOKAHEAD:
+                yield window.popleft()
+
+        yield from window
+
+    def _executor(self, jobs: int) -> ProcessPoolExecutor:
+        """Create a pool for evaluating builds in worker processes
+
+        :param jobs: Maximum number of concurrent evaluations
+        """
+        workers = self.working_dir / "workers"
+        workers.mkdir(exist_ok=True)
+        cache = get_cache()
+        tracer = get_tracer()
+        return ProcessPoolExecutor(
+            max_workers=jobs,
+            mp_context=_worker_context(),
+            initializer=_init_worker,
+            initargs=(
+                workers,
+                cache.path if cache is not None else None,
+                tracer.path if tracer is not None else None,
+            ),
+        )
+
+    def _submit_candidate(
+        self,
+        executor: ProcessPoolExecutor,
+        config: BugConfiguration,
+        branch: str,
+        bid: str,
+        use_cache: bool = False,
+    ) -> Candidate:
+        """Resolve the build for a candidate and schedule its evaluation
+
+        :param executor: Pool used for evaluating candidates
+        :param config: The candidate configuration
+        :param branch: Branch where build is found
+        :param bid: Build id (rev or date)
+        :param use_cache: Check for previous result using build/bid combination
+        """
+        build = self._resolve_build(config, branch, bid)
+        if build is None:
+            return config, None, ReproductionFailed()
+
+        previous = self._lookup_result(config, branch, build, use_cache)
+        if previous is not None:
+            return config, build, previous
+
+        return config, build, executor.submit(_evaluate_candidate, config, build)
+
+    def _collect_candidate(
+        self, candidate: Candidate, branch: str, bid: str
+    ) -> ReproductionBase:
+        """Wait for the evaluation of a submitted candidate and record its result
+
+        :param candidate: Candidate returned by _submit_candidate
+        :param branch: Branch where build is found
+        :param bid: Build id (rev or date)
+        """
+        config, build, outcome = candidate
+        if not isinstance(outcome, Future):
+            return outcome
+
+        assert build is not None
+        status = outcome.result()
+        if status is None:
+            # The build was resolved, so the download most likely failed transiently
+            BUILD_RESOLVER.mark_unavailable(
+                *self._build_args(config, branch, bid), transient=True
+            )
+            return ReproductionFailed()
+
+        return self.record_result(config, branch, build, status)
+
+    def _detect_parallel(
+        self, branch: str, bid: str
+    ) -> Generator[Tuple[BugConfiguration, ReproductionBase], None, None]:
+        """Evaluate candidate configurations concurrently
+
+        Results are yielded in the original priority order.  Once the consumer stops
+        iterating, queued candidates are cancelled and running evaluations are
+        terminated so that the first crash is returned without waiting for them.
+
+        :param branch: Branch where build is found
+        :param bid: Build id (rev or date)
+        """
+        executor = self._executor(self.detect_jobs)
+        candidates = self._iter_candidates()
+        pending: Deque[Candidate] = deque()
+        try:
+            while True:
+                for config in candidates:
+                    pending.append(
+                        self._submit_candidate(executor, config, branch, bid)
+                    )
+                    if len(pending) >= self.detect_jobs:
+                        break
+
+                if not pending:
+                    break
+
+                candidate = pending.popleft()
+                yield candidate[0], self._collect_candidate(candidate, branch, bid)
+        finally:
+            _shutdown_pool(executor, pending)
+
+    def _verify_parallel(
+        self, config: BugConfiguration, targets: List[Tuple[str, str, str]]
+    ) -> List[ReproductionBase]:
+        """Reproduce the bug on several branches concurrently
+
+        :param config: The bug configuration to use for running the testcase
+        :param targets: Branch alias, status flag and patch rev of each branch
+        :return: The reproduction result of each target, in order
+        """
+        with span("verify.branches", bug_id=self.bug.id, jobs=self.verify_jobs):
+            executor = self._executor(min(self.verify_jobs, len(targets)))
+            candidates: List[Candidate] = []
+            try:
+                for alias, _, rev in targets:
+                    candidates.append(
+                        self._submit_candidate(executor, config, alias, rev, True)
+                    )
+                return [
+                    self._collect_candidate(candidate, alias, rev)
+                    for candidate, (alias, _, rev) in zip(candidates, targets)
+                ]
+            finally:
+                _shutdown_pool(executor, candidates)
+
     def detect_config(self) -> Optional[BugConfiguration]:
-        """Detect the evaluator configuration used to reproduce the issue"""
+        """Detect the evaluator configuration used to reproduce the issue
+
+        The outcome is retained so that subsequent calls don't repeat detection.
+        """
+        if not self._config_detected:
+            with span("detect_config", bug_id=self.bug.id) as s:
+                self._config = self._detect_config()
+                if self._config is not None:
+                    s.set(params=dict(self._config.params))
+            self._config_detected = True
+
+        return self._config
+
+    def _detect_config(self) -> Optional[BugConfiguration]:
+        """Evaluate candidate configurations until one reproduces the issue"""
         bid = self.bug.initial_build_id
         branch = self.bug.branch
 
@@ -586,19 +1357,28 @@ class BugMonitor:
 
         self.fetch_attachments()
         log.info("Attempting to identify an evaluator configuration...")
-        for Config in BugConfigs:
-            for config in Config.iterate(self.bug, self.test_dir):
-                name = type(config).__name__
-                opts = ", ".join([f"{k}: {v}" for k, v in config.params.items()])
-                log.info(f"Using config: {name} ({opts})")
-                result = self._reproduce_bug(config, branch, bid, False)
-                if isinstance(result, ReproductionCrashed):
-                    log.info("Successfully identified evaluator configuration!")
-                    return config
-
-                # Record build string for reporting failed result
-                if build_str is None and isinstance(result, ReproductionBuildBase):
-                    build_str = result.build_str
+
+        results: Generator[Tuple[BugConfiguration, ReproductionBase], None, None]
+        if self.detect_jobs > 1:
+            results = self._detect_parallel(branch, bid)
+        else:
+            results = (
+                (config, self._reproduce_bug(config, branch, bid, False))
+                for config in self._iter_candidates()
+            )
+
+        for config, result in results:
+            if isinstance(result, ReproductionCrashed):
+                log.info("Successfully identified evaluator configuration!")
+                results.close()
+                ranker = self._ranker()
+                if ranker is not None:
+                    ranker.record(config)
+                return config
+
+            # Record build string for reporting failed result
+            if build_str is None and isinstance(result, ReproductionBuildBase):
+                build_str = result.build_str
 
         if build_str is not None:
             self.report(
@@ -619,6 +1399,14 @@ class BugMonitor:
         bisect - Attempt to bisect the bug regression or, if RESOLVED, the bug fix
         confirm - Attempt to confirm that testcase reproduces
 
+        :param force_confirm: Force confirmation regardless of bug state
+        """
+        with span("process", bug_id=self.bug.id, status=self.bug.status):
+            self._process(force_confirm)
+
+    def _process(self, force_confirm: bool) -> None:
+        """Process the bug without tracing
+
         :param force_confirm: Force confirmation regardless of bug state
         """
         if not self.is_supported():
@@ -659,7 +1447,10 @@ class BugMonitor:
                 log.info(line)
 
     def commit(self) -> None:
-        """Post any changes to the bug"""
+        """Post any changes to the bug
+
+        If a commit queue is configured, the changes are queued for submission.
+        """
         if self._close_bug:
             if "bugmon" in self.bug.keywords:
                 self.bug.keywords.remove("bugmon")
@@ -681,5 +1472,10 @@ class BugMonitor:
         if diff:
             log.info(f"Changes: {json.dumps(diff)}")
             if not self.dry_run:
-                self.bugsy.put(self.bug)
-                self.bug.update()
+                queue = get_commit_queue()
+                if queue is not None:
+                    queue.add(self.bug.id, diff)
+                    self.bug.mark_committed()
+                else:
+                    with span("bugzilla.put", bug_id=self.bug.id, fields=sorted(diff)):
+                        asyncio.run(AsyncBugzilla(self.bugsy).put(self.bug))
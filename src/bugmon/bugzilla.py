@@ -0,0 +1,230 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import asyncio
+import functools
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Optional, TypeVar, cast
+
+import requests
+from bugsy import Bug, Bugsy, BugsyException
+
+from .tracing import span
+
+log = logging.getLogger(__name__)
+
+# Maximum number of concurrent requests (requests.Session pools 10 per host)
+MAX_CONCURRENT = 4
+
+# Number of times failed reads are retried
+RETRIES = 3
+
+# Delay in seconds before the first retry, doubled for each subsequent one
+RETRY_BACKOFF = 1.0
+
+# Maximum number of bugs included in a single bulk request
+HYDRATE_CHUNK_SIZE = 20
+
+T = TypeVar("T")
+
+
+def _is_transient(error: Exception) -> bool:
+    """Determine whether a failed request may succeed if retried
+
+    :param error: Exception raised by the request
+    """
+    if isinstance(error, requests.exceptions.RequestException):
+        return True
+
+    # Bugsy raises errors without a code for server errors
+    return isinstance(error, BugsyException) and error.code is None
+
+
+class AsyncBugzilla:
+    """Issues concurrent Bugzilla requests through a Bugsy instance
+
+    Requests are made in worker threads using the Bugsy session so that connections
+    are pooled and authentication is shared with synchronous callers.  Reads failing
+    with transient errors are retried with exponential backoff.  Writes are never
+    retried as they may have been applied.
+
+    :param bugsy: Bugsy instance
+    :param max_concurrent: Maximum number of requests in flight
+    :param retries: Number of times failed reads are retried
+    :param backoff: Delay in seconds before the first retry
+    """
+
+    def __init__(
+        self,
+        bugsy: Bugsy,
+        max_concurrent: int = MAX_CONCURRENT,
+        retries: int = RETRIES,
+        backoff: float = RETRY_BACKOFF,
+    ) -> None:
+        self.bugsy = bugsy
+        self.max_concurrent = max_concurrent
+        self.retries = retries
+        self.backoff = backoff
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        """Semaphore limiting the requests in flight within the running loop"""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._loop = loop
+
+        return self._semaphore
+
+    async def _call(self, func: Callable[[], T], retry: bool, name: str) -> T:
+        """Call the blocking function in a worker thread
+
+        :param func: Function performing the request
+        :param retry: Whether transient errors are retried
+        :param name: Description of the request used for logging
+        """
+        attempt = 0
+        with span("bugzilla.request", request=name) as s:
+            while True:
+                async with self.semaphore:
+                    try:
+                        result = await asyncio.to_thread(func)
+                        s.set(attempts=attempt + 1)
+                        return result
+                    except (BugsyException, requests.exceptions.RequestException) as e:
+                        if not retry or attempt >= self.retries or not _is_transient(e):
+                            raise
+                        delay = self.backoff * 2**attempt
+                        log.warning(
+                            f"Request failed ({name}), retrying in {delay}s: {e}"
+                        )
+
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def request(self, path: str, method: str = "GET", **kwargs: Any) -> Any:
+        """Perform a Bugzilla API request
+
+        :param path: Path relative to the API root
+        :param method: HTTP method
+        :param kwargs: Arguments passed to Bugsy.request
+        :raises BugsyException: If Bugzilla rejects the request
+        :raises requests.exceptions.RequestException: If the request fails
+        """
+        if method != "GET":
+            kwargs["method"] = method
+        func = functools.partial(self.bugsy.request, path, **kwargs)
+        return await self._call(func, method == "GET", f"{method} {path}")
+
+    async def search(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Retrieve the data of all bugs matching the search parameters
+
+        :param params: Search parameters
+        """
+        result = await self.request("bug", params=params)
+        return cast(List[Dict[str, Any]], result["bugs"])
+
+    async def get_details(
+        self,
+        bug_id: int,
+        kinds: Iterable[str] = ("comment", "attachment"),
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Retrieve the comments and attachments of a single bug concurrently
+
+        :param bug_id: Bug number
+        :param kinds: Details to retrieve (comment and/or attachment)
+        :return: The retrieved data keyed by kind
+        """
+        kinds = list(kinds)
+        results = await asyncio.gather(
+            *(self.request(f"bug/{bug_id}/{kind}") for kind in kinds)
+        )
+
+        details = {}
+        for kind, result in zip(kinds, results):
+            data = result["bugs"][str(bug_id)]
+            details[kind] = data["comments"] if kind == "comment" else data
+
+        return details
+
+    async def get_attachment_data(self, ids: List[int]) -> Dict[int, str]:
+        """Retrieve the contents of several attachments in a single request
+
+        :param ids: Attachment ids
+        :return: The base64 encoded contents keyed by attachment id
+        :raises BugsyException: If Bugzilla rejects the request
+        :raises requests.exceptions.RequestException: If the request fails
+        """
+        # Additional attachments are requested using the attachment_ids parameter
+        params = {"attachment_ids": ids[1:], "include_fields": "id,data"}
+        result = await self.request(f"bug/attachment/{ids[0]}", params=params)
+        return {
+            int(attachment_id): data["data"]
+            for attachment_id, data in result.get("attachments", {}).items()
+        }
+
+    async def _hydrate_chunk(
+        self,
+        kind: str,
+        chunk: List[str],
+        by_id: Dict[str, Dict[str, Any]],
+    ) -> None:
+        """Retrieve the comments or attachments of a chunk of bugs
+
+        :param kind: Either comment or attachment
+        :param chunk: Bug numbers
+        :param by_id: Bug data keyed by bug number
+        """
+        # Additional bugs are requested using the ids parameter
+        params: Dict[str, Any] = {"ids": chunk[1:]}
+        if kind == "attachment":
+            # Contents are only retrieved for the attachments that are used
+            params["exclude_fields"] = "data"
+
+        try:
+            result = await self.request(f"bug/{chunk[0]}/{kind}", params=params)
+        except (BugsyException, requests.exceptions.RequestException) as e:
+            log.warning(f"Failed to retrieve {kind}s: {e}")
+            return
+
+        for bug_id, data in result.get("bugs", {}).items():
+            if bug_id in by_id:
+                if kind == "comment":
+                    by_id[bug_id]["comments"] = data["comments"]
+                else:
+                    by_id[bug_id]["attachments"] = data
+
+    async def hydrate(self, bugs: List[Dict[str, Any]]) -> None:
+        """Retrieve the comments and attachments of many bugs at once
+
+        The data is stored alongside the supplied bug data.  Attachment contents are
+        excluded and retrieved using get_attachment_data() when needed.  Bugs that
+        couldn't be hydrated are left unchanged.
+
+        :param bugs: Bug data as returned by the Bugzilla API
+        """
+        by_id = {str(bug["id"]): bug for bug in bugs}
+        ids = list(by_id)
+        chunks = [
+            ids[i : i + HYDRATE_CHUNK_SIZE]
+            for i in range(0, len(ids), HYDRATE_CHUNK_SIZE)
+        ]
+        await asyncio.gather(
+            *(
+                self._hydrate_chunk(kind, chunk, by_id)
+                for kind in ("comment", "attachment")
+                for chunk in chunks
+            )
+        )
+
+    async def put(self, bug: Bug) -> None:
+        """Submit the pending changes to the bug and refresh it
+
+        :param bug: Bug with pending changes
+        :raises BugsyException: If Bugzilla rejects the changes
+        :raises requests.exceptions.RequestException: If the request fails
+        """
+        await self.request(f"bug/{bug.id}", "PUT", json=bug.diff())
+        await self._call(bug.update, True, f"GET bug/{bug.id}")
@@ -0,0 +1,270 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import Any, Dict, Generator, Optional, Sequence, Tuple
+
+import requests
+from autobisect.build_manager import BuildManager
+from fuzzfetch import BuildFlags, BuildSearchOrder, Fetcher, FetcherException, Platform
+
+from .cache import get_cache, make_key
+from .tracing import span
+
+log = logging.getLogger(__name__)
+
+# Builds resolved from "latest" are refreshed after this many seconds
+LATEST_TTL = 30 * 60
+
+# Builds which couldn't be retrieved are retried after this many seconds
+UNAVAILABLE_TTL = 24 * 60 * 60
+
+# Builds which failed due to network or server errors are retried after this many
+# seconds
+TRANSIENT_TTL = 60
+
+BuildKey = Tuple[Any, ...]
+
+
+def is_transient(error: Exception) -> bool:
+    """Check whether a failed build lookup or download may succeed when retried
+
+    fuzzfetch wraps request errors in FetcherException.  Errors other than client
+    errors (e.g. timeouts, connection failures and 5xx responses) are transient.
+
+    :param error: The exception raised while retrieving the build
+    """
+    if not isinstance(error, FetcherException):
+        return True
+
+    cause = error.args[0] if error.args else None
+    if isinstance(cause, requests.exceptions.HTTPError):
+        response = cause.response
+        if response is None or response.status_code == 429:
+            return True
+        return not 400 <= response.status_code < 500
+
+    return isinstance(cause, requests.exceptions.RequestException)
+
+
+class BuildResolver:
+    """Memoizes build resolution so that identical lookups only hit TaskCluster once
+
+    Lookups which fail are remembered as well, both in memory and, if configured,
+    in the persistent cache, so that missing builds aren't requested repeatedly.
+    Transient failures are only remembered in memory, for a short period.
+
+    :param latest_ttl: Seconds before builds resolved from "latest" are refreshed
+    :param unavailable_ttl: Seconds before unavailable builds are retried
+    """
+
+    def __init__(
+        self,
+        latest_ttl: float = LATEST_TTL,
+        unavailable_ttl: float = UNAVAILABLE_TTL,
+    ) -> None:
+        self.latest_ttl = latest_ttl
+        self.unavailable_ttl = unavailable_ttl
+        self._builds: Dict[BuildKey, Tuple[float, Fetcher]] = {}
+        self._unavailable: Dict[BuildKey, float] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(
+        branch: str,
+        bid: str,
+        flags: BuildFlags,
+        targets: Sequence[str],
+        platform: Platform,
+        nearest: Optional[BuildSearchOrder] = None,
+    ) -> BuildKey:
+        """Create the memoization key for a build lookup
+
+        :param branch: Branch where build is found
+        :param bid: Build id (rev or date)
+        :param flags: Build flags
+        :param targets: Build targets
+        :param platform: Build platform
+        :param nearest: Search order when the exact build is unavailable
+        """
+        return (
+            branch,
+            bid,
+            tuple(flags),
+            tuple(targets),
+            platform.system,
+            platform.machine,
+            nearest,
+        )
+
+    def resolve(
+        self,
+        branch: str,
+        bid: str,
+        flags: BuildFlags,
+        targets: Sequence[str],
+        platform: Platform,
+        nearest: Optional[BuildSearchOrder] = None,
+    ) -> Fetcher:
+        """Return the build matching the supplied parameters
+
+        :param branch: Branch where build is found
+        :param bid: Build id (rev or date)
+        :param flags: Build flags
+        :param targets: Build targets
+        :param platform: Build platform
+        :param nearest: Search order when the exact build is unavailable
+        :raises FetcherException: If the build cannot be resolved
+        """
+        key = self.make_key(branch, bid, flags, targets, platform, nearest)
+        with span(
+            "build.resolve", branch=branch, bid=bid, flags=flags.build_string()
+        ) as s:
+            if self._is_unavailable(key):
+                s.set(cache="unavailable")
+                raise FetcherException(f"Build previously unavailable ({branch} {bid})")
+
+            with self._lock:
+                entry = self._builds.get(key)
+            if entry is not None:
+                resolved, build = entry
+                if bid != "latest" or time.monotonic() - resolved < self.latest_ttl:
+                    log.debug(f"Using resolved build {build.get_auto_name()}")
+                    s.set(cache="hit")
+                    return build
+
+            s.set(cache="miss")
+            try:
+                build = Fetcher(
+                    branch=branch,
+                    build=bid,
+                    flags=flags,
+                    targets=targets,
+                    platform=platform,
+                    nearest=nearest,
+                )
+            except FetcherException as e:
+                self._mark_unavailable(key, bid, is_transient(e))
+                raise
+
+        with self._lock:
+            self._builds[key] = (time.monotonic(), build)
+
+        return build
+
+    def is_unavailable(
+        self,
+        branch: str,
+        bid: str,
+        flags: BuildFlags,
+        targets: Sequence[str],
+        platform: Platform,
+        nearest: Optional[BuildSearchOrder] = None,
+    ) -> bool:
+        """Check whether the build was recently found to be unavailable
+
+        :param branch: Branch where build is found
+        :param bid: Build id (rev or date)
+        :param flags: Build flags
+        :param targets: Build targets
+        :param platform: Build platform
+        :param nearest: Search order when the exact build is unavailable
+        """
+        key = self.make_key(branch, bid, flags, targets, platform, nearest)
+        return self._is_unavailable(key)
+
+    def mark_unavailable(
+        self,
+        branch: str,
+        bid: str,
+        flags: BuildFlags,
+        targets: Sequence[str],
+        platform: Platform,
+        nearest: Optional[BuildSearchOrder] = None,
+        transient: bool = False,
+    ) -> None:
+        """Record that the build could not be retrieved
+
+        :param branch: Branch where build is found
+        :param bid: Build id (rev or date)
+        :param flags: Build flags
+        :param targets: Build targets
+        :param platform: Build platform
+        :param nearest: Search order when the exact build is unavailable
+        :param transient: Whether the failure may succeed when retried
+        """
+        key = self.make_key(branch, bid, flags, targets, platform, nearest)
+        self._mark_unavailable(key, bid, transient)
+
+    def _is_unavailable(self, key: BuildKey) -> bool:
+        """Check the in-memory and persistent records of unavailable builds
+
+        :param key: Memoization key of the build lookup
+        """
+        with self._lock:
+            expires = self._unavailable.get(key)
+        if expires is not None and expires > time.time():
+            return True
+
+        cache = get_cache()
+        return cache is not None and cache.is_unavailable(make_key(*key))
+
+    def _mark_unavailable(self, key: BuildKey, bid: str, transient: bool) -> None:
+        """Record an unavailable build in memory and in the persistent cache
+
+        Transient failures are only recorded in memory.
+
+        :param key: Memoization key of the build lookup
+        :param bid: Build id (rev or date)
+        :param transient: Whether the failure may succeed when retried
+        """
+        ttl: float
+        if transient:
+            ttl = TRANSIENT_TTL
+        elif bid == "latest":
+            # Tip builds are expected to become available shortly
+            ttl = self.latest_ttl
+        else:
+            ttl = self.unavailable_ttl
+        with self._lock:
+            self._builds.pop(key, None)
+            self._unavailable[key] = time.time() + ttl
+
+        if transient:
+            return
+
+        cache = get_cache()
+        if cache is not None:
+            cache.set_unavailable(make_key(*key), ttl)
+
+    def clear(self) -> None:
+        """Remove all resolved and unavailable builds"""
+        with self._lock:
+            self._builds.clear()
+            self._unavailable.clear()
+
+
+BUILD_RESOLVER = BuildResolver()
+
+
+@contextmanager
+def get_build(
+    manager: BuildManager, build: Fetcher, target: str
+) -> Generator[Path, None, None]:
+    """Retrieve the build using the supplied BuildManager
+
+    The download and unpacking of the build is traced separately from its use.
+
+    :param manager: BuildManager used to store the build
+    :param build: The resolved build
+    :param target: Build target
+    :raises BuildManagerException: If the build cannot be retrieved
+    """
+    with ExitStack() as stack:
+        with span("build.get", build=build.get_auto_name(), target=target):
+            path = stack.enter_context(manager.get_build(build, target))
+        yield path
@@ -0,0 +1,342 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import Any, Dict, Generator, Iterable, List, Optional, Tuple
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS results ("
+    "key TEXT PRIMARY KEY, "
+    "bug_id INTEGER, "
+    "testcase TEXT, "
+    "params TEXT, "
+    "platform TEXT, "
+    "branch TEXT, "
+    "build_id TEXT, "
+    "changeset TEXT, "
+    "status TEXT, "
+    "created REAL)",
+    "CREATE TABLE IF NOT EXISTS rankings ("
+    "context TEXT, "
+    "signature TEXT, "
+    "wins INTEGER, "
+    "PRIMARY KEY (context, signature))",
+    "CREATE TABLE IF NOT EXISTS unavailable (key TEXT PRIMARY KEY, expires REAL)",
+    "CREATE TABLE IF NOT EXISTS valid_flags (rev TEXT PRIMARY KEY, flags TEXT)",
+    "CREATE TABLE IF NOT EXISTS repeats ("
+    "key TEXT PRIMARY KEY, "
+    "first INTEGER, "
+    "later INTEGER)",
+    "CREATE TABLE IF NOT EXISTS bisections ("
+    "key TEXT PRIMARY KEY, "
+    "context TEXT, "
+    "start_id TEXT, "
+    "start_changeset TEXT, "
+    "end_id TEXT, "
+    "end_changeset TEXT, "
+    "repo TEXT, "
+    "created REAL)",
+    "CREATE INDEX IF NOT EXISTS bisections_context ON bisections (context)",
+)
+
+BISECTION_FIELDS = (
+    "start_id",
+    "start_changeset",
+    "end_id",
+    "end_changeset",
+    "repo",
+)
+
+_CACHE: Optional["Cache"] = None
+
+
+def make_key(*parts: Any) -> str:
+    """Create a stable digest from the supplied parts
+
+    :param parts: JSON serializable values identifying an entry
+    """
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class Cache:
+    """Persistent store shared between bugmon runs
+
+    :param path: Directory used for storing cached data
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.db_path = self.path / "bugmon.db"
+
+        with self._connect() as con:
+            for statement in SCHEMA:
+                con.execute(statement)
+
+    @contextmanager
+    def _connect(self) -> Generator[sqlite3.Connection, None, None]:
+        """Open a short-lived connection and commit on success"""
+        with closing(sqlite3.connect(self.db_path, timeout=60)) as con:
+            with con:
+                yield con
+
+    def get_result(
+        self,
+        bug_id: int,
+        testcase: str,
+        params: str,
+        platform: str,
+        changeset: str,
+    ) -> Optional[str]:
+        """Retrieve a stored reproduction status
+
+        :param bug_id: Bug number
+        :param testcase: Digest of the testcase contents
+        :param params: Serialized configuration parameters
+        :param platform: Platform identifier
+        :param changeset: Resolved build changeset
+        """
+        key = make_key(bug_id, testcase, params, platform, changeset)
+        with self._connect() as con:
+            row = con.execute(
+                "SELECT status FROM results WHERE key = ?", (key,)
+            ).fetchone()
+
+        return None if row is None else str(row[0])
+
+    def set_result(
+        self,
+        bug_id: int,
+        testcase: str,
+        params: str,
+        platform: str,
+        branch: str,
+        build_id: str,
+        changeset: str,
+        status: str,
+    ) -> None:
+        """Store a reproduction status
+
+        :param bug_id: Bug number
+        :param testcase: Digest of the testcase contents
+        :param params: Serialized configuration parameters
+        :param platform: Platform identifier
+        :param branch: Branch the build belongs to
+        :param build_id: Build identifier (timestamp)
+        :param changeset: Resolved build changeset
+        :param status: Reproduction status
+        """
+        key = make_key(bug_id, testcase, params, platform, changeset)
+        with self._connect() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    bug_id,
+                    testcase,
+                    params,
+                    platform,
+                    branch,
+                    build_id,
+                    changeset,
+                    status,
+                    time.time(),
+                ),
+            )
+
+    def get_results(
+        self,
+        testcase: str,
+        params: str,
+        platform: str,
+        branch: str,
+    ) -> List[Tuple[str, str, str]]:
+        """Retrieve the reproduction statuses stored for a testcase by any bug
+
+        :param testcase: Digest of the testcase contents
+        :param params: Serialized configuration parameters
+        :param platform: Platform identifier
+        :param branch: Branch the builds belong to
+        :return: Build identifier, changeset and status of each result
+        """
+        with self._connect() as con:
+            rows = con.execute(
+                "SELECT build_id, changeset, status FROM results "
+                "WHERE testcase = ? AND params = ? AND platform = ? AND branch = ?",
+                (testcase, params, platform, branch),
+            ).fetchall()
+
+        return [
+            (str(build_id), str(changeset), str(status))
+            for build_id, changeset, status in rows
+        ]
+
+    def get_wins(self, context: str) -> Dict[str, int]:
+        """Retrieve the number of reproductions per configuration signature
+
+        :param context: Bug property the wins were recorded against
+        """
+        with self._connect() as con:
+            rows = con.execute(
+                "SELECT signature, wins FROM rankings WHERE context = ?", (context,)
+            ).fetchall()
+
+        return {str(signature): int(wins) for signature, wins in rows}
+
+    def record_win(self, contexts: Iterable[str], signature: str) -> None:
+        """Record that a configuration signature reproduced a bug
+
+        :param contexts: Bug properties to record the win against
+        :param signature: Configuration signature
+        """
+        with self._connect() as con:
+            con.executemany(
+                "INSERT INTO rankings VALUES (?, ?, 1) "
+                "ON CONFLICT (context, signature) DO UPDATE SET wins = wins + 1",
+                [(context, signature) for context in contexts],
+            )
+
+    def is_unavailable(self, key: str) -> bool:
+        """Check whether a build was recently found to be unavailable
+
+        :param key: Digest identifying the build lookup
+        """
+        with self._connect() as con:
+            row = con.execute(
+                "SELECT expires FROM unavailable WHERE key = ?", (key,)
+            ).fetchone()
+
+        return row is not None and float(row[0]) > time.time()
+
+    def set_unavailable(self, key: str, ttl: float) -> None:
+        """Record that a build is unavailable
+
+        :param key: Digest identifying the build lookup
+        :param ttl: Seconds before the build should be retried
+        """
+        with self._connect() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO unavailable VALUES (?, ?)",
+                (key, time.time() + ttl),
+            )
+
+    def get_valid_flags(self, rev: str) -> Optional[List[str]]:
+        """Retrieve the runtime flags supported by a JS shell revision
+
+        :param rev: Build revision
+        """
+        with self._connect() as con:
+            row = con.execute(
+                "SELECT flags FROM valid_flags WHERE rev = ?", (rev,)
+            ).fetchone()
+
+        return None if row is None else list(json.loads(row[0]))
+
+    def set_valid_flags(self, rev: str, flags: List[str]) -> None:
+        """Store the runtime flags supported by a JS shell revision
+
+        :param rev: Build revision
+        :param flags: Supported runtime flags
+        """
+        with self._connect() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO valid_flags VALUES (?, ?)",
+                (rev, json.dumps(flags)),
+            )
+
+    def get_repeat_history(self, key: str) -> Tuple[int, int]:
+        """Retrieve how often a testcase crashed on the first or a later attempt
+
+        :param key: Key identifying the testcase and configuration
+        """
+        with self._connect() as con:
+            row = con.execute(
+                "SELECT first, later FROM repeats WHERE key = ?", (key,)
+            ).fetchone()
+
+        return (0, 0) if row is None else (int(row[0]), int(row[1]))
+
+    def record_repeat(self, key: str, first: bool) -> None:
+        """Record whether a testcase crashed on the first attempt
+
+        :param key: Key identifying the testcase and configuration
+        :param first: Whether the crash occurred on the first attempt
+        """
+        with self._connect() as con:
+            con.execute(
+                "INSERT INTO repeats VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET "
+                "first = first + excluded.first, later = later + excluded.later",
+                (key, int(first), int(not first)),
+            )
+
+    def get_bisection(self, key: str) -> Optional[Dict[str, str]]:
+        """Retrieve a stored bisection range
+
+        :param key: Key identifying the bisection inputs including the build range
+        """
+        with self._connect() as con:
+            row = con.execute(
+                f"SELECT {', '.join(BISECTION_FIELDS)} FROM bisections WHERE key = ?",
+                (key,),
+            ).fetchone()
+
+        return None if row is None else dict(zip(BISECTION_FIELDS, row))
+
+    def find_bisection(
+        self, context: str, start_id: str, end_id: str
+    ) -> Optional[Dict[str, str]]:
+        """Retrieve a stored bisection range lying within the supplied builds
+
+        :param context: Key identifying the bisection inputs excluding the build range
+        :param start_id: Build identifier (timestamp) of the first build
+        :param end_id: Build identifier (timestamp) of the last build
+        """
+        with self._connect() as con:
+            row = con.execute(
+                f"SELECT {', '.join(BISECTION_FIELDS)} FROM bisections "
+                "WHERE context = ? AND start_id >= ? AND end_id <= ? "
+                "ORDER BY created DESC LIMIT 1",
+                (context, start_id, end_id),
+            ).fetchone()
+
+        return None if row is None else dict(zip(BISECTION_FIELDS, row))
+
+    def set_bisection(self, key: str, context: str, bisection: Dict[str, str]) -> None:
+        """Store a bisection range
+
+        :param key: Key identifying the bisection inputs including the build range
+        :param context: Key identifying the bisection inputs excluding the build range
+        :param bisection: Range endpoints keyed by BISECTION_FIELDS
+        """
+        with self._connect() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO bisections VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    context,
+                    *(bisection[field] for field in BISECTION_FIELDS),
+                    time.time(),
+                ),
+            )
+
+
+def get_cache() -> Optional[Cache]:
+    """Return the process-wide cache if one was configured"""
+    return _CACHE
+
+
+def set_cache(path: Optional[Path]) -> Optional[Cache]:
+    """Configure the process-wide cache
+
+    :param path: Cache directory or None to disable caching
+    """
+    global _CACHE  # pylint: disable=global-statement
+    _CACHE = Cache(path) if path is not None else None
+    return _CACHE
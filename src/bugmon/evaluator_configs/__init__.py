@@ -7,5 +7,8 @@ from typing import List, Type
 from .base import BugConfiguration
 from .browser import BrowserConfiguration
 from .js import JSConfiguration
+from .policy import RepeatPolicy
+from .ranking import ConfigRanker
+from .testcases import TestcaseIndex, clear_testcase_index, get_testcase_index
 
 BugConfigs: List[Type[BugConfiguration]] = [BrowserConfiguration, JSConfiguration]
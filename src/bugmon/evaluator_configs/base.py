@@ -2,15 +2,24 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 import itertools
+import json
 from abc import ABC, abstractmethod
 from dataclasses import fields
 from pathlib import Path
-from typing import Any, Dict, Iterator, Tuple, cast
+from typing import Any, Dict, Iterator, List, Optional, Tuple, cast
 
 from autobisect import Evaluator
+from autobisect.evaluators import EvaluatorResult
 from fuzzfetch import BuildFlags
 
 from bugmon.bug import EnhancedBug
+from bugmon.tracing import span
+
+from .policy import RepeatPolicy
+from .testcases import get_testcase_index
+
+# Candidate values of each parameter, keyed by parameter name
+Axes = Dict[str, List[Any]]
 
 
 class BugConfiguration(ABC):
@@ -26,6 +35,72 @@ class BugConfiguration(ABC):
         self.build_flags = build_flags
         self.evaluator = evaluator
         self.params = {"flags": build_flags.build_string()[1:]}
+        self.policy: Optional[RepeatPolicy] = None
+
+    def apply_policy(self, policy: RepeatPolicy) -> None:
+        """Evaluate the testcase using the supplied repeat policy
+
+        :param policy: The repeat policy
+        """
+        self.policy = policy
+        self.params["repeat"] = policy.name
+
+    def evaluate(self, build_path: Path) -> EvaluatorResult:
+        """Evaluate the testcase in stages according to the repeat policy
+
+        Pernosco sessions always use the configured number of attempts.
+
+        :param build_path: Path to the unpacked build
+        """
+        evaluator = type(self.evaluator).__name__
+        with span("evaluate", evaluator=evaluator, params=dict(self.params)) as s:
+            result = self._evaluate_stages(build_path)
+            s.set(result=result.name)
+
+        return result
+
+    def _evaluate_stages(self, build_path: Path) -> EvaluatorResult:
+        """Run each stage of the repeat policy until the result is conclusive
+
+        :param build_path: Path to the unpacked build
+        """
+        # Both evaluators support repeat although it isn't part of the base class
+        evaluator = cast(Any, self.evaluator)
+        if self.policy is None or getattr(evaluator, "pernosco", False):
+            return self.evaluator.evaluate_testcase(build_path)
+
+        repeat = evaluator.repeat
+        try:
+            for stage, attempts in enumerate(self.policy.stages):
+                evaluator.repeat = attempts
+                result = self.evaluator.evaluate_testcase(build_path)
+                if result == EvaluatorResult.BUILD_CRASHED:
+                    self.policy.record(stage)
+                if result != EvaluatorResult.BUILD_PASSED:
+                    return result
+        finally:
+            evaluator.repeat = repeat
+
+        return EvaluatorResult.BUILD_PASSED
+
+    def params_key(self, working_dir: Path) -> str:
+        """Serialize params with paths relative to the working directory
+
+        :param working_dir: Directory containing bug attachments.
+        """
+        params: Dict[str, Any] = {}
+        for key, value in self.params.items():
+            # The repeat policy changes as testcases are evaluated
+            if key == "repeat":
+                continue
+            if isinstance(value, (str, Path)):
+                try:
+                    value = Path(value).relative_to(working_dir).as_posix()
+                except ValueError:
+                    pass
+            params[key] = value
+
+        return json.dumps(params, sort_keys=True, default=str)
 
     @classmethod
     def iter_build_flags(cls, bug: EnhancedBug) -> Iterator[BuildFlags]:
@@ -58,33 +133,47 @@ class BugConfiguration(ABC):
     def iter_tests(cls, working_dir: Path) -> Iterator[Path]:
         """Iterate over possible testcases
 
+        Files matching earlier ALLOWED patterns are yielded first.  The directory is
+        only walked once and shared with other configuration classes.
+
         :param working_dir: Path to iterate over.
         """
-        processed = []
-        for allowed_pattern in cls.ALLOWED:
-            for filename in working_dir.rglob(f"{allowed_pattern}"):
-                if not filename.is_file():
-                    continue
+        index = get_testcase_index(working_dir)
+        yield from index.select(cls.ALLOWED, cls.EXCLUDED)
 
-                is_excluded = False
-                for excluded_pattern in cls.EXCLUDED:
-                    if filename.match(excluded_pattern):
-                        is_excluded = True
-                        break
+    @classmethod
+    @abstractmethod
+    def axes(cls, bug: EnhancedBug, working_dir: Path) -> Axes:
+        """Candidate values of each parameter in order of preference
 
-                if is_excluded or filename in processed:
-                    continue
+        Parameters are ordered from the outermost to the innermost when combined.
 
-                processed.append(filename)
-                yield filename
+        :param bug: The bug to evaluate
+        :param working_dir: Directory containing bug attachments
+        """
 
     @classmethod
     @abstractmethod
+    def create(cls, bug: EnhancedBug, values: Dict[str, Any]) -> "BugConfiguration":
+        """Create the configuration using a single value of each parameter
+
+        :param bug: The bug to evaluate
+        :param values: The value of each parameter returned by axes()
+        """
+
+    @classmethod
     def iterate(
-        cls, bug: EnhancedBug, working_dir: Path
+        cls, bug: EnhancedBug, working_dir: Path, axes: Optional[Axes] = None
     ) -> Iterator["BugConfiguration"]:
         """Generator for iterating over possible Evaluator configurations
+
+        Configurations are only created as they are consumed.
+
         :param bug: The bug to evaluate
         :param working_dir: Directory containing bug attachments
+        :param axes: Parameter values to combine, if they were reordered
         :return: Class instance
         """
+        axes = cls.axes(bug, working_dir) if axes is None else axes
+        for values in itertools.product(*axes.values()):
+            yield cls.create(bug, dict(zip(axes, values)))
@@ -2,16 +2,16 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 import copy
-from itertools import product
 from pathlib import Path
 from platform import system
-from typing import Dict, Iterator, Union
+from typing import Any, Dict, Iterator, Union
 
 from autobisect import BrowserEvaluator
 from fuzzfetch import BuildFlags
 
 from ..bug import EnhancedBug
-from .base import BugConfiguration
+from .base import Axes, BugConfiguration
+from .testcases import get_testcase_index
 
 
 def identify_prefs(attachment_dir: Path) -> Union[Path, None]:
@@ -21,7 +21,7 @@ def identify_prefs(attachment_dir: Path) -> Union[Path, None]:
     :return:
     """
     prefs_path = None
-    for file in attachment_dir.rglob("*"):
+    for file in get_testcase_index(attachment_dir).files:
         if file.suffix == ".js":
             if "user_pref" in file.read_text(encoding="utf-8"):
                 prefs_path = file
@@ -48,13 +48,14 @@ class BrowserConfiguration(BugConfiguration):
 
         :param working_dir: Path to iterate over.
         """
-        testcases = list(super().iter_tests(working_dir))
-        for i, path in enumerate(testcases):
-            # If test_info exists, prefer it and use the parent directory
-            if path.name == "test_info.json":
-                new_path = testcases.pop(i).parent
-                testcases.insert(0, new_path)
-                break
+        testcases = super().iter_tests(working_dir)
+        # If test_info exists, prefer it and use the parent directory
+        test_info = get_testcase_index(working_dir).test_info
+        if test_info:
+            yield test_info[0]
+            testcases = (
+                path for path in testcases if path != test_info[0] / "test_info.json"
+            )
 
         yield from testcases
 
@@ -75,36 +76,43 @@ class BrowserConfiguration(BugConfiguration):
             yield env_variables
 
     @classmethod
-    def iterate(
-        cls, bug: EnhancedBug, working_dir: Path
-    ) -> Iterator["BrowserConfiguration"]:
-        """Generator for iterating over possible BrowserEvaluator configurations
+    def axes(cls, bug: EnhancedBug, working_dir: Path) -> Axes:
+        """Candidate build flags, env variables, testcases, harness and prefs usage
 
         :param bug: The bug to evaluate
         :param working_dir: Directory containing bug attachments
         """
         prefs = identify_prefs(working_dir)
 
-        for build_flags, env_variables, testcase in product(
-            BrowserConfiguration.iter_build_flags(bug),
-            BrowserConfiguration.iter_env(bug),
-            BrowserConfiguration.iter_tests(working_dir),
-        ):
-            if prefs and prefs == testcase:
-                continue
-
-            for use_harness in [True, False]:
-                # Don't always use prefs if they exist as they might be invalid
-                for pref_path in [prefs, None] if prefs is not None else [None]:
-                    evaluator = BrowserEvaluator(
-                        testcase,
-                        env=env_variables,
-                        display="default" if system() == "Windows" else "xvfb",
-                        prefs=pref_path,
-                        repeat=10,
-                        relaunch=1,
-                        scan_dir=True,
-                        use_harness=use_harness,
-                    )
-
-                    yield cls(build_flags, evaluator)
+        return {
+            "flags": list(BrowserConfiguration.iter_build_flags(bug)),
+            "env_variables": list(BrowserConfiguration.iter_env(bug)),
+            "entry_point": [
+                testcase
+                for testcase in BrowserConfiguration.iter_tests(working_dir)
+                if not prefs or prefs != testcase
+            ],
+            "use_harness": [True, False],
+            # Don't always use prefs if they exist as they might be invalid
+            "use_prefs": [prefs, None] if prefs is not None else [None],
+        }
+
+    @classmethod
+    def create(cls, bug: EnhancedBug, values: Dict[str, Any]) -> "BrowserConfiguration":
+        """Create a BrowserEvaluator configuration
+
+        :param bug: The bug to evaluate
+        :param values: The value of each parameter returned by axes()
+        """
+        evaluator = BrowserEvaluator(
+            values["entry_point"],
+            env=values["env_variables"],
+            display="default" if system() == "Windows" else "xvfb",
+            prefs=values["use_prefs"],
+            repeat=10,
+            relaunch=1,
+            scan_dir=True,
+            use_harness=values["use_harness"],
+        )
+
+        return cls(values["flags"], evaluator)
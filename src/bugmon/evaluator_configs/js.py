@@ -2,13 +2,13 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https://mozilla.org/MPL/2.0/.
 from pathlib import Path
-from typing import Iterator
+from typing import Any, Dict
 
 from autobisect import JSEvaluator
 from fuzzfetch import BuildFlags
 
 from ..bug import EnhancedBug
-from .base import BugConfiguration
+from .base import Axes, BugConfiguration
 
 
 class JSConfiguration(BugConfiguration):
@@ -22,23 +22,31 @@ class JSConfiguration(BugConfiguration):
         self.params["run_flags"] = evaluator.flags
 
     @classmethod
-    def iterate(
-        cls, bug: EnhancedBug, working_dir: Path
-    ) -> Iterator["JSConfiguration"]:
-        """Generator for iterating over possible JSEvaluator configurations
+    def axes(cls, bug: EnhancedBug, working_dir: Path) -> Axes:
+        """Candidate build flags and entry-points
 
         Iterates over file attachments to determine the correct entry-point.
 
         :param bug: The bug to evaluate
         :param working_dir: Directory containing bug attachments
         """
-        for build_flags in JSConfiguration.iter_build_flags(bug):
-            for filename in JSConfiguration.iter_tests(working_dir):
-                evaluator = JSEvaluator(
-                    filename,
-                    flags=bug.runtime_opts,
-                    repeat=10,
-                    timeout=60,
-                )
-
-                yield cls(build_flags, evaluator)
+        return {
+            "flags": list(JSConfiguration.iter_build_flags(bug)),
+            "entry_point": list(JSConfiguration.iter_tests(working_dir)),
+        }
+
+    @classmethod
+    def create(cls, bug: EnhancedBug, values: Dict[str, Any]) -> "JSConfiguration":
+        """Create a JSEvaluator configuration
+
+        :param bug: The bug to evaluate
+        :param values: The value of each parameter returned by axes()
+        """
+        evaluator = JSEvaluator(
+            values["entry_point"],
+            flags=bug.runtime_opts,
+            repeat=10,
+            timeout=60,
+        )
+
+        return cls(values["flags"], evaluator)
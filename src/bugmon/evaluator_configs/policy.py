@@ -0,0 +1,74 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+from typing import List, Optional
+
+from bugmon.cache import Cache
+
+# Number of first attempt crashes required before a testcase is deemed deterministic
+DETERMINISTIC_MIN = 2
+
+# Multiplier applied to the number of attempts for intermittent testcases
+INTERMITTENT_FACTOR = 2
+
+
+class RepeatPolicy:
+    """Determines how many attempts are made when evaluating a testcase
+
+    A single attempt is made first.  If it doesn't crash, the remaining attempts are
+    only made if previous runs haven't shown the testcase to be deterministic.
+    Testcases which previously required more than one attempt are given additional
+    attempts.
+
+    :param repeat: Number of attempts for testcases without history
+    :param cache: Cache used for storing the outcome of previous evaluations
+    :param key: Key identifying the testcase and configuration within the cache
+    """
+
+    def __init__(
+        self,
+        repeat: int,
+        cache: Optional[Cache] = None,
+        key: Optional[str] = None,
+    ) -> None:
+        self.repeat = repeat
+        self.cache = cache
+        self.key = key
+
+        self.first = 0
+        self.later = 0
+        if cache is not None and key is not None:
+            self.first, self.later = cache.get_repeat_history(key)
+
+    @property
+    def name(self) -> str:
+        """Description of the policy applied to the testcase"""
+        if self.later:
+            return "intermittent"
+        if self.first >= DETERMINISTIC_MIN:
+            return "deterministic"
+
+        return "default"
+
+    @property
+    def stages(self) -> List[int]:
+        """Number of attempts made in each stage of the evaluation"""
+        if self.name == "intermittent":
+            return [1, self.repeat * INTERMITTENT_FACTOR - 1]
+        if self.name == "deterministic" or self.repeat <= 1:
+            return [1]
+
+        return [1, self.repeat - 1]
+
+    def record(self, stage: int) -> None:
+        """Record the stage in which the testcase crashed
+
+        :param stage: Index of the stage
+        """
+        if stage == 0:
+            self.first += 1
+        else:
+            self.later += 1
+
+        if self.cache is not None and self.key is not None:
+            self.cache.record_repeat(self.key, stage == 0)
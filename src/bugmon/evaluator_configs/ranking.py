@@ -0,0 +1,155 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+import json
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+from fuzzfetch import BuildFlags
+
+from bugmon.bug import EnhancedBug
+from bugmon.cache import Cache
+
+from .base import Axes, BugConfiguration
+from .testcases import get_testcase_index
+
+# Matches on more specific bug properties are a stronger signal
+WEIGHTS = {
+    "component": 4,
+    "attachments": 2,
+    "keyword": 1,
+    "product": 1,
+}
+
+
+def _summarize(key: str, value: Any) -> Any:
+    """Reduce a parameter value to the part that generalizes across bugs
+
+    :param key: Parameter name
+    :param value: Parameter value, either from params or from axes()
+    """
+    if isinstance(value, BuildFlags):
+        return value.build_string()[1:]
+    if key == "entry_point":
+        path = Path(value)
+        return "<dir>" if path.is_dir() else path.suffix
+    if key == "env_variables":
+        return sorted(value or {})
+    if key == "use_prefs":
+        return bool(value)
+    return value
+
+
+class ConfigRanker:
+    """Reorders candidate configurations based on previous reproductions
+
+    :param cache: Cache used for storing reproduction statistics
+    :param bug: The bug being evaluated
+    :param working_dir: Directory containing bug attachments
+    """
+
+    def __init__(self, cache: Cache, bug: EnhancedBug, working_dir: Path):
+        self.cache = cache
+        self.bug = bug
+        self.working_dir = working_dir
+        self._scores: Optional[Dict[str, int]] = None
+
+    @property
+    def contexts(self) -> List[Tuple[str, str]]:
+        """Bug properties used for grouping reproduction statistics"""
+        suffixes = get_testcase_index(self.working_dir).suffixes
+        contexts = [
+            ("product", f"product:{self.bug.product}"),
+            ("component", f"component:{self.bug.product}::{self.bug.component}"),
+            ("attachments", f"attachments:{','.join(sorted(suffixes))}"),
+        ]
+        for keyword in sorted(self.bug.keywords or []):
+            if keyword != "bugmon":
+                contexts.append(("keyword", f"keyword:{keyword}"))
+
+        return contexts
+
+    @property
+    def scores(self) -> Dict[str, int]:
+        """Weighted number of reproductions of each configuration signature"""
+        if self._scores is None:
+            self._scores = {}
+            for kind, context in self.contexts:
+                for signature, wins in self.cache.get_wins(context).items():
+                    score = self._scores.get(signature, 0) + wins * WEIGHTS[kind]
+                    self._scores[signature] = score
+
+        return self._scores
+
+    def signature(self, config: BugConfiguration) -> str:
+        """Reduce a configuration to the parameters that generalize across bugs
+
+        :param config: The configuration to summarize
+        """
+        signature: Dict[str, Any] = {"config": type(config).__name__}
+        for key, value in config.params.items():
+            if key not in ("repeat", "run_flags"):
+                signature[key] = _summarize(key, value)
+
+        return json.dumps(signature, sort_keys=True, default=str)
+
+    def rank(
+        self, configs: Iterable[Type[BugConfiguration]]
+    ) -> Iterator[BugConfiguration]:
+        """Yield configurations ordered by historical likelihood of reproducing
+
+        Rather than scoring every combination, the values of each parameter are
+        ordered by the scores of the signatures they appear in and combinations are
+        created lazily from the ordered values.  Values without any history retain
+        their original order.
+
+        :param configs: Configuration classes in their default order
+        """
+        totals: Dict[str, int] = {}
+        parts: Dict[Tuple[str, str, str], int] = {}
+        for signature, score in self.scores.items():
+            params = json.loads(signature)
+            name = params.pop("config")
+            totals[name] = totals.get(name, 0) + score
+            for key, value in params.items():
+                part = (name, key, json.dumps(value, sort_keys=True))
+                parts[part] = parts.get(part, 0) + score
+
+        for config in sorted(
+            configs, key=lambda c: totals.get(c.__name__, 0), reverse=True
+        ):
+            axes = config.axes(self.bug, self.working_dir)
+            if totals.get(config.__name__):
+                axes = self._rank_axes(config.__name__, axes, parts)
+            yield from config.iterate(self.bug, self.working_dir, axes)
+
+    @staticmethod
+    def _rank_axes(
+        name: str, axes: Axes, parts: Dict[Tuple[str, str, str], int]
+    ) -> Axes:
+        """Order the values of each parameter by their scores
+
+        :param name: Name of the configuration class
+        :param axes: Candidate values of each parameter
+        :param parts: Scores keyed by class name, parameter and summarized value
+        """
+        ranked: Axes = {}
+        for key, values in axes.items():
+            scores = [
+                parts.get(
+                    (name, key, json.dumps(_summarize(key, v), sort_keys=True)), 0
+                )
+                for v in values
+            ]
+            order = sorted(range(len(values)), key=scores.__getitem__, reverse=True)
+            ranked[key] = [values[i] for i in order]
+
+        return ranked
+
+    def record(self, config: BugConfiguration) -> None:
+        """Record that the configuration reproduced the bug
+
+        :param config: The configuration which reproduced the bug
+        """
+        contexts = [context for _, context in self.contexts]
+        self.cache.record_win(contexts, self.signature(config))
@@ -0,0 +1,102 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at https://mozilla.org/MPL/2.0/.
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+# Number of directories for which indexes are retained
+MAX_INDEXES = 4
+
+_INDEXES: Dict[Path, "TestcaseIndex"] = {}
+
+
+class TestcaseIndex:
+    """Files within a testcase directory, collected in a single walk
+
+    Files are retained in walk order so that selections match the order in which
+    Path.rglob returns them.
+
+    :param working_dir: Directory containing bug attachments
+    """
+
+    # Not a test class, despite the name
+    __test__ = False
+
+    def __init__(self, working_dir: Path):
+        self.working_dir = working_dir
+        self.files: List[Path] = []
+        self.suffixes: Set[str] = set()
+        self.test_info: List[Path] = []
+        self._selections: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], List[Path]] = {}
+
+        stat = working_dir.stat()
+        self._stamp = (stat.st_ino, stat.st_mtime_ns)
+
+        for path in working_dir.rglob("*"):
+            if not path.is_file():
+                continue
+            self.files.append(path)
+            self.suffixes.add(path.suffix)
+            if path.name == "test_info.json":
+                self.test_info.append(path.parent)
+
+    @property
+    def stale(self) -> bool:
+        """Whether the directory was replaced or entries were added to it"""
+        try:
+            stat = self.working_dir.stat()
+        except OSError:
+            return True
+
+        return (stat.st_ino, stat.st_mtime_ns) != self._stamp
+
+    def select(self, allowed: Tuple[str, ...], excluded: Tuple[str, ...]) -> List[Path]:
+        """Return the files matching the allowed patterns
+
+        Files are ordered by the first allowed pattern they match and then by walk
+        order.  Files matching any excluded pattern are omitted.
+
+        :param allowed: Patterns in order of preference
+        :param excluded: Patterns of files which are never testcases
+        """
+        key = (allowed, excluded)
+        if key not in self._selections:
+            buckets: List[List[Path]] = [[] for _ in allowed]
+            for path in self.files:
+                if any(path.match(pattern) for pattern in excluded):
+                    continue
+                for bucket, pattern in zip(buckets, allowed):
+                    if path.match(pattern):
+                        bucket.append(path)
+                        break
+
+            self._selections[key] = [path for bucket in buckets for path in bucket]
+
+        return self._selections[key]
+
+
+def get_testcase_index(working_dir: Path) -> TestcaseIndex:
+    """Return the index of the supplied directory, walking it if required
+
+    :param working_dir: Directory containing bug attachments
+    """
+    index = _INDEXES.get(working_dir)
+    if index is None or index.stale:
+        index = TestcaseIndex(working_dir)
+        _INDEXES.pop(working_dir, None)
+        _INDEXES[working_dir] = index
+        while len(_INDEXES) > MAX_INDEXES:
+            del _INDEXES[next(iter(_INDEXES))]
+
+    return index
+
+
+def clear_testcase_index(working_dir: Optional[Path] = None) -> None:
+    """Discard the index of a directory whose contents have changed
+
+    :param working_dir: Directory to discard or None to discard all indexes
+    """
+    if working_dir is None:
+        _INDEXES.clear()
+    else:
+        _INDEXES.pop(working_dir, None)
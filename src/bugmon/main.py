@@ -4,25 +4,44 @@
 # v. 2.0. If a copy of the MPL was not distributed with this file, You can
 # obtain one at http://mozilla.org/MPL/2.0/.
 import argparse
+import asyncio
 import json
 import logging
 import os
 import sys
 import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
 from pathlib import Path
-from typing import Optional, cast, List
+from typing import Any, Dict, List, Optional, TypedDict, cast
 
 from bugsy import Bugsy
 
 from bugmon import PernoscoCreds
 
 from .bug import EnhancedBug
+from .bugzilla import AsyncBugzilla
 from .bugmon import BugMonitor
+from .cache import set_cache
 from .exceptions import BugmonException
+from .prefetch import set_prefetcher
+from .scheduler import BuildScheduler
+from .tracing import set_tracer, span
+from .updates import get_commit_queue, set_commit_queue
+from .utils import console_init_logging
 
 log = logging.getLogger("bugmon")
 
 
+class BugOutcome(TypedDict):
+    """Result of processing a single bug"""
+
+    bug_id: int
+    error: Optional[str]
+    elapsed: float
+
+
 def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     """Arg parser
 
@@ -42,6 +61,45 @@ def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
         action="store_true",
         help="Force bug confirmation regardless of status",
     )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        help="Path used for persisting reproduction results between runs",
+    )
+    parser.add_argument(
+        "--prefetch",
+        action="store_true",
+        help="Download upcoming builds in the background",
+    )
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        help="Path to which timing spans are appended as JSON lines",
+    )
+    parser.add_argument(
+        "--detect-jobs",
+        type=int,
+        default=1,
+        help="Number of candidate configurations to evaluate concurrently",
+    )
+    parser.add_argument(
+        "--verify-jobs",
+        type=int,
+        default=1,
+        help="Number of fixed branches to verify concurrently",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of bugs to process concurrently",
+    )
+    parser.add_argument(
+        "--group-builds",
+        action="store_true",
+        help="Evaluate builds shared between bugs once before processing the batch",
+    )
 
     # Bug selection
     bugs = parser.add_mutually_exclusive_group(required=True)
@@ -57,24 +115,230 @@ def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
     if args.search and not args.search.is_file():
         parser.error("Search parameter path does not exist!")
 
+    if args.detect_jobs < 1:
+        parser.error("--detect-jobs must be at least 1")
+
+    if args.verify_jobs < 1:
+        parser.error("--verify-jobs must be at least 1")
+
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+
+    if args.jobs > 1 and args.group_builds:
+        parser.error("--group-builds cannot be combined with --jobs")
+
     return args
 
 
-def console_init_logging() -> None:
-    """Enable logging when called from console"""
-    log_level = logging.INFO
-    log_fmt = "[%(asctime)s] %(message)s"
-    if bool(os.getenv("DEBUG")):
-        log_level = logging.DEBUG
-        log_fmt = "%(levelname).1s %(name)s [%(asctime)s] %(message)s"
-    logging.basicConfig(format=log_fmt, datefmt="%Y-%m-%d %H:%M:%S", level=log_level)
+def _run_monitor(bugmon: BugMonitor, force_confirm: bool) -> Optional[str]:
+    """Process a monitored bug and describe any error encountered
+
+    :param bugmon: Monitor of the bug to analyze
+    :param force_confirm: Force bug confirmation regardless of status
+    """
+    bug = bugmon.bug
+    try:
+        log.info(
+            f"Analyzing bug {bug.id} "
+            f"(Status: {bug.status}, "
+            f"Resolution: {bug.resolution})"
+        )
+        bugmon.process(force_confirm)
+    except BugmonException as e:
+        log.error(f"Error processing bug {bug.id}: {e}")
+        return str(e)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        log.exception(f"Unexpected error processing bug {bug.id}")
+        return f"{type(e).__name__}: {e}"
+
+    return None
+
+
+def _create_monitor(
+    bugsy: Bugsy,
+    bug: EnhancedBug,
+    working_dir: Path,
+    args: argparse.Namespace,
+    pernosco_creds: Optional[PernoscoCreds] = None,
+) -> BugMonitor:
+    """Create a BugMonitor using the supplied command line arguments
+
+    :param bugsy: Bugsy instance used for retrieving bugs
+    :param bug: Bug to analyze
+    :param working_dir: Path to working directory
+    :param args: Parsed command line arguments
+    :param pernosco_creds: Optional pernosco credentials
+    """
+    return BugMonitor(
+        bugsy,
+        bug,
+        working_dir,
+        pernosco_creds,
+        args.dry_run,
+        args.detect_jobs,
+        args.verify_jobs,
+    )
+
+
+def process_bug(
+    bugsy: Bugsy,
+    bug: EnhancedBug,
+    args: argparse.Namespace,
+    pernosco_creds: Optional[PernoscoCreds] = None,
+) -> BugOutcome:
+    """Analyze a single bug in its own working directory
+
+    :param bugsy: Bugsy instance used for retrieving bugs
+    :param bug: Bug to analyze
+    :param args: Parsed command line arguments
+    :param pernosco_creds: Optional pernosco credentials
+    """
+    start = time.monotonic()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        try:
+            bugmon = _create_monitor(bugsy, bug, Path(temp_dir), args, pernosco_creds)
+        except BugmonException as e:
+            log.error(f"Error processing bug {bug.id}: {e}")
+            error: Optional[str] = str(e)
+        else:
+            error = _run_monitor(bugmon, args.force_confirm)
+
+    return {"bug_id": bug.id, "error": error, "elapsed": time.monotonic() - start}
+
+
+def process_batch(
+    bugsy: Bugsy,
+    bugs: List[EnhancedBug],
+    args: argparse.Namespace,
+    pernosco_creds: Optional[PernoscoCreds] = None,
+) -> List[BugOutcome]:
+    """Analyze a batch of bugs after evaluating builds shared between them
+
+    Reproductions needed by multiple bugs are evaluated once per build before the
+    individual bugs are processed.  The reported wall time excludes the shared stage.
+
+    :param bugsy: Bugsy instance used for retrieving bugs
+    :param bugs: Bugs to analyze
+    :param args: Parsed command line arguments
+    :param pernosco_creds: Optional pernosco credentials
+    """
+    outcomes: List[BugOutcome] = []
+    monitors = []
+    with ExitStack() as stack:
+        for bug in bugs:
+            working_dir = Path(stack.enter_context(tempfile.TemporaryDirectory()))
+            try:
+                monitors.append(
+                    _create_monitor(bugsy, bug, working_dir, args, pernosco_creds)
+                )
+            except BugmonException as e:
+                log.error(f"Error processing bug {bug.id}: {e}")
+                outcomes.append({"bug_id": bug.id, "error": str(e), "elapsed": 0})
+
+        BuildScheduler(monitors).run()
+
+        for bugmon in monitors:
+            start = time.monotonic()
+            error = _run_monitor(bugmon, args.force_confirm)
+            outcomes.append(
+                {
+                    "bug_id": bugmon.bug.id,
+                    "error": error,
+                    "elapsed": time.monotonic() - start,
+                }
+            )
+
+    return outcomes
+
+
+def _init_worker(
+    cache_dir: Optional[Path],
+    prefetch: bool,
+    trace: Optional[Path] = None,
+    updates_dir: Optional[Path] = None,
+) -> None:
+    """Prepare a worker process for processing bugs
+
+    :param cache_dir: Path used for persisting reproduction results
+    :param prefetch: Whether builds should be prefetched
+    :param trace: Path to which timing spans are appended
+    :param updates_dir: Path used for queueing bug updates or None to submit directly
+    """
+    console_init_logging()
+    set_cache(cache_dir)
+    set_prefetcher(prefetch)
+    set_tracer(trace)
+    set_commit_queue(updates_dir is not None, updates_dir)
+
+
+def _process_bug_worker(
+    bug_data: Dict[str, Any],
+    args: argparse.Namespace,
+    api_root: str,
+    api_key: str,
+    pernosco_creds: Optional[PernoscoCreds] = None,
+) -> BugOutcome:
+    """Process a bug within a worker process
+
+    :param bug_data: Raw bug data as returned by Bugzilla
+    :param args: Parsed command line arguments
+    :param api_root: Bugzilla API root
+    :param api_key: Bugzilla API key
+    :param pernosco_creds: Optional pernosco credentials
+    """
+    bugsy = Bugsy(api_key=api_key, bugzilla_url=api_root)
+    bug = EnhancedBug(bugsy, **bug_data)
+    return process_bug(bugsy, bug, args, pernosco_creds)
+
+
+async def _fetch_bugs(
+    client: AsyncBugzilla, params: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """Retrieve the bugs matching the search along with their comments and attachments
+
+    :param client: Bugzilla client
+    :param params: Search parameters
+    """
+    bugs = await client.search(params)
+    await client.hydrate(bugs)
+    return bugs
+
+
+def flush_updates(client: AsyncBugzilla, force: bool = True) -> None:
+    """Submit queued bug updates
+
+    :param client: Bugzilla client
+    :param force: Submit the updates even if the queue isn't full
+    """
+    queue = get_commit_queue()
+    if queue is None or not (force or queue.full):
+        return
+
+    with span("bugzilla.flush") as s:
+        remaining = queue.flush(client)
+        s.set(remaining=remaining)
+
+    if remaining:
+        log.error(f"Unable to submit {remaining} bug update(s)")
+
+
+def log_summary(outcomes: List[BugOutcome]) -> None:
+    """Output the per-bug outcome of a run
+
+    :param outcomes: Processed bug outcomes
+    """
+    log.info(f"Processed {len(outcomes)} bug(s):")
+    for outcome in outcomes:
+        minutes, seconds = divmod(int(outcome["elapsed"]), 60)
+        status = "OK" if outcome["error"] is None else f"FAILED ({outcome['error']})"
+        log.info(f"> {outcome['bug_id']}: {status} [{minutes}m {seconds:02d}s]")
 
 
 def main(argv: Optional[List[str]] = None) -> int:
     """Launch Bugmon
 
     :param argv: Command line to use instead of sys.argv (optional)
-    :raises BugmonException: Re-raises any error encountered by BugMonitor
+    :raises BugmonException: If the Bugzilla API root or key are not set
     """
     console_init_logging()
     args = parse_args(argv)
@@ -104,6 +368,9 @@ def main(argv: Optional[List[str]] = None) -> int:
         for key in ("PERNOSCO_USER", "PERNOSCO_GROUP", "PERNOSCO_USER_SECRET_KEY"):
             os.environ.pop(key)
 
+    set_cache(args.cache_dir)
+    set_prefetcher(args.prefetch)
+    set_tracer(args.trace)
     bugsy = Bugsy(api_key=api_key, bugzilla_url=api_root)
 
     if args.bugs:
@@ -113,31 +380,67 @@ def main(argv: Optional[List[str]] = None) -> int:
         params = json.loads(args.search.read_text())
         params["include_fields"] = "_default"
 
-    response = bugsy.request("bug", params=params)
-    bugs = [EnhancedBug(bugsy, **bug) for bug in response["bugs"]]
+    client = AsyncBugzilla(bugsy)
+    with span("bugzilla.search") as s:
+        results = asyncio.run(_fetch_bugs(client, params))
+        s.set(bugs=len(results))
 
-    for bug in bugs:
-        with tempfile.TemporaryDirectory() as temp_dir:
-            try:
-                working_dir = Path(temp_dir)
-                bugmon = BugMonitor(
-                    bugsy,
-                    bug,
-                    working_dir,
-                    pernosco_creds,
-                    args.dry_run,
-                )
-                log.info(
-                    f"Analyzing bug {bug.id} "
-                    f"(Status: {bugmon.bug.status}, "
-                    f"Resolution: {bugmon.bug.resolution})"
-                )
-                bugmon.process(args.force_confirm)
-            except BugmonException as e:
-                log.error(f"Error processing bug {bug.id}: {e}")
-                return 1
+    outcomes: List[BugOutcome] = []
+    with ExitStack() as stack:
+        # Pending updates are kept between runs when a cache is configured
+        if args.cache_dir is not None:
+            updates_dir = args.cache_dir / "updates"
+        else:
+            updates_dir = Path(stack.enter_context(tempfile.TemporaryDirectory()))
+        queue = set_commit_queue(not args.dry_run, updates_dir)
+
+        if args.jobs > 1:
+            with ProcessPoolExecutor(
+                max_workers=args.jobs,
+                initializer=_init_worker,
+                initargs=(
+                    args.cache_dir,
+                    args.prefetch,
+                    args.trace,
+                    queue.path if queue is not None else None,
+                ),
+            ) as executor:
+                futures = {
+                    bug_data["id"]: executor.submit(
+                        _process_bug_worker,
+                        bug_data,
+                        args,
+                        api_root,
+                        api_key,
+                        pernosco_creds,
+                    )
+                    for bug_data in results
+                }
+                for bug_id, future in futures.items():
+                    try:
+                        outcomes.append(future.result())
+                    except Exception as e:  # pylint: disable=broad-exception-caught
+                        log.error(f"Worker failed while processing bug {bug_id}: {e}")
+                        outcomes.append(
+                            {"bug_id": bug_id, "error": str(e), "elapsed": 0}
+                        )
+                    flush_updates(client, force=False)
+        elif args.group_builds:
+            bugs = [EnhancedBug(bugsy, **bug_data) for bug_data in results]
+            outcomes = process_batch(bugsy, bugs, args, pernosco_creds)
+        else:
+            for bug_data in results:
+                bug = EnhancedBug(bugsy, **bug_data)
+                outcomes.append(process_bug(bugsy, bug, args, pernosco_creds))
+                flush_updates(client, force=False)
+
+        flush_updates(client)
+        set_commit_queue(False)
+
+    set_prefetcher(False)
+    log_summary(outcomes)
 
-    return 0
+    return 1 if any(outcome["error"] is not None for outcome in outcomes) else 0
 
 
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import logging
+import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Hashable, Optional
+
+from autobisect.build_manager import BuildManager, BuildManagerException
+from fuzzfetch import BuildFlags, BuildSearchOrder, FetcherException, Platform
+
+from .builds import BUILD_RESOLVER, get_build
+
+log = logging.getLogger(__name__)
+
+# Downloads are skipped when less than this many bytes are free
+MIN_FREE_SPACE = 10 * 1024**3
+
+_PREFETCHER: Optional["BuildPrefetcher"] = None
+
+
+class BuildPrefetcher:
+    """Downloads upcoming builds into the BuildManager cache in the background
+
+    :param max_workers: Number of concurrent downloads
+    :param max_queued: Maximum number of builds waiting to be downloaded
+    :param min_free: Minimum free disk space required to start a download
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 1,
+        max_queued: int = 4,
+        min_free: int = MIN_FREE_SPACE,
+    ) -> None:
+        self.max_queued = max_queued
+        self.min_free = min_free
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="prefetch"
+        )
+        self._queued: Dict[Hashable, "Future[None]"] = {}
+        self._lock = threading.Lock()
+
+    def prefetch(
+        self,
+        branch: str,
+        bid: Optional[str],
+        flags: BuildFlags,
+        target: str,
+        platform: Platform,
+    ) -> bool:
+        """Queue a build for download
+
+        :param branch: Branch where build is found
+        :param bid: Build id (rev or date) or None for tip
+        :param flags: Build flags
+        :param target: Build target
+        :param platform: Build platform
+        :return: True if the build was queued
+        """
+        nearest: Optional[BuildSearchOrder] = BuildSearchOrder.ASC
+        if bid is None:
+            bid = "latest"
+            nearest = None
+
+        # Copy the flags as configurations may be modified while queued
+        flags = BuildFlags(*flags)
+        key = BUILD_RESOLVER.make_key(branch, bid, flags, [target], platform, nearest)
+        with self._lock:
+            # Completed downloads no longer need to be tracked
+            for done in [k for k, future in self._queued.items() if future.done()]:
+                del self._queued[done]
+
+            if key in self._queued:
+                return False
+            if len(self._queued) >= self.max_queued:
+                log.debug(f"Prefetch queue full, skipping {branch} {bid}")
+                return False
+
+            self._queued[key] = self._executor.submit(
+                self._download, branch, bid, flags, target, platform, nearest
+            )
+
+        return True
+
+    def _download(
+        self,
+        branch: str,
+        bid: str,
+        flags: BuildFlags,
+        target: str,
+        platform: Platform,
+        nearest: Optional[BuildSearchOrder],
+    ) -> None:
+        """Resolve and download a build
+
+        :param branch: Branch where build is found
+        :param bid: Build id (rev or date)
+        :param flags: Build flags
+        :param target: Build target
+        :param platform: Build platform
+        :param nearest: Search order when the exact build is unavailable
+        """
+        try:
+            build = BUILD_RESOLVER.resolve(
+                branch, bid, flags, [target], platform, nearest
+            )
+        except FetcherException as e:
+            log.debug(f"Unable to prefetch {branch} {bid}: {e}")
+            return
+
+        # BuildManager connections can't be shared between threads.  Builds are
+        # reserved by (path, pid) so the reservation is owned by this thread to
+        # avoid releasing one held by the main thread for the same build.
+        build_manager = BuildManager()
+        build_manager.pid = threading.get_native_id()
+        free = shutil.disk_usage(build_manager.build_dir).free
+        if free < self.min_free:
+            log.warning(f"Skipping prefetch of {build.get_auto_name()} (low disk)")
+            return
+
+        log.info(f"Prefetching {build.get_auto_name()}...")
+        try:
+            with get_build(build_manager, build, target):
+                pass
+        except (BuildManagerException, FetcherException) as e:
+            log.debug(f"Unable to prefetch {build.get_auto_name()}: {e}")
+
+    def close(self) -> None:
+        """Cancel queued downloads and wait for running ones to complete"""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def get_prefetcher() -> Optional[BuildPrefetcher]:
+    """Return the process-wide prefetcher if one was configured"""
+    return _PREFETCHER
+
+
+def set_prefetcher(enabled: bool) -> Optional[BuildPrefetcher]:
+    """Configure the process-wide prefetcher
+
+    Any previously configured prefetcher is closed.
+
+    :param enabled: Whether builds should be prefetched
+    """
+    global _PREFETCHER  # pylint: disable=global-statement
+    if _PREFETCHER is not None:
+        _PREFETCHER.close()
+    _PREFETCHER = BuildPrefetcher() if enabled else None
+    return _PREFETCHER
@@ -0,0 +1,90 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import logging
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+from autobisect.build_manager import BuildManager, BuildManagerException
+from fuzzfetch import Fetcher, FetcherException
+
+from .bugmon import BugMonitor
+from .builds import get_build
+from .evaluator_configs import BugConfiguration
+
+log = logging.getLogger(__name__)
+
+Reproduction = Tuple[BugMonitor, BugConfiguration, str]
+
+
+class BuildScheduler:
+    """Evaluates pending reproductions of many bugs grouped by build
+
+    Each build is retrieved once and every bug needing it is evaluated while the
+    build is unpacked.  Results are recorded on the individual monitors so that
+    BugMonitor.process() can use them without retrieving the build again.
+
+    :param monitors: Monitors for the bugs in the batch
+    """
+
+    def __init__(self, monitors: Iterable[BugMonitor]) -> None:
+        self.monitors = list(monitors)
+        self.build_manager = BuildManager()
+
+    def plan(self) -> List[Tuple[Fetcher, str, List[Reproduction]]]:
+        """Group the pending reproductions of all monitors by build
+
+        Groups shared by the most bugs are returned first.
+        """
+        groups: Dict[Tuple[str, str], Tuple[Fetcher, List[Reproduction]]] = {}
+        for monitor in self.monitors:
+            try:
+                planned = monitor.plan_reproductions()
+            except Exception:  # pylint: disable=broad-exception-caught
+                log.exception(f"Unable to plan reproductions for bug {monitor.bug.id}")
+                continue
+
+            for config, branch, build in planned:
+                key = (config.evaluator.target, build.get_auto_name())
+                if key not in groups:
+                    groups[key] = (build, [])
+                groups[key][1].append((monitor, config, branch))
+
+        ordered = sorted(groups.items(), key=lambda item: len(item[1][1]), reverse=True)
+        return [(build, target, items) for (target, _), (build, items) in ordered]
+
+    def run(self) -> None:
+        """Evaluate all pending reproductions"""
+        for build, target, reproductions in self.plan():
+            log.info(
+                f"Evaluating {len(reproductions)} bug(s) using {build.get_auto_name()}"
+            )
+            try:
+                with get_build(self.build_manager, build, target) as path:
+                    for monitor, config, branch in reproductions:
+                        self._evaluate(monitor, config, branch, build, path)
+            except (BuildManagerException, FetcherException) as e:
+                log.error(f"Error fetching build: {e}")
+
+    @staticmethod
+    def _evaluate(
+        monitor: BugMonitor,
+        config: BugConfiguration,
+        branch: str,
+        build: Fetcher,
+        path: Path,
+    ) -> None:
+        """Evaluate a single reproduction, isolating failures from the group
+
+        :param monitor: Monitor of the bug being reproduced
+        :param config: The bug configuration to use for running the testcase
+        :param branch: Branch where build is found
+        :param build: The resolved build
+        :param path: Path to the unpacked build
+        """
+        log.info(f"Attempting to reproduce bug {monitor.bug.id}...")
+        try:
+            status = config.evaluate(path)
+            monitor.record_result(config, branch, build, status)
+        except Exception:  # pylint: disable=broad-exception-caught
+            log.exception(f"Unable to evaluate bug {monitor.bug.id}")
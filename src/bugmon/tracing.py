@@ -0,0 +1,128 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Generator, Optional
+
+log = logging.getLogger(__name__)
+
+_TRACER: Optional["Tracer"] = None
+_CURRENT: ContextVar[Optional["Span"]] = ContextVar("span", default=None)
+
+
+class Span:
+    """A timed operation
+
+    :param name: Name of the operation
+    :param attrs: Attributes describing the operation
+    :param parent: Enclosing span
+    """
+
+    def __init__(
+        self,
+        name: str,
+        attrs: Dict[str, Any],
+        parent: Optional["Span"] = None,
+    ) -> None:
+        self.name = name
+        self.attrs = attrs
+        self.parent = parent
+        self.span_id = uuid.uuid4().hex[:16]
+        self.start = time.time()
+        self.duration = 0.0
+
+    def set(self, **attrs: Any) -> None:
+        """Add attributes to the span
+
+        :param attrs: Attributes describing the operation
+        """
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializable representation of the span"""
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "start": self.start,
+            "duration": self.duration,
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+            "attrs": self.attrs,
+        }
+
+
+class Tracer:
+    """Exports completed spans as JSON lines
+
+    Each span is appended using a single write so that multiple processes can share
+    the same file.
+
+    :param path: File that spans are appended to
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def export(self, completed: Span) -> None:
+        """Write the span to the trace file
+
+        :param completed: Completed span
+        """
+        line = json.dumps(completed.to_dict(), default=str) + "\n"
+        with self._lock:
+            try:
+                with self.path.open("a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                log.warning(f"Failed to export span: {e}")
+
+
+def get_tracer() -> Optional[Tracer]:
+    """Return the configured tracer, if any"""
+    return _TRACER
+
+
+def set_tracer(path: Optional[Path]) -> None:
+    """Configure the tracer used by spans
+
+    :param path: File that spans are appended to or None to disable tracing
+    """
+    global _TRACER  # pylint: disable=global-statement
+    _TRACER = Tracer(path) if path is not None else None
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Generator[Span, None, None]:
+    """Time the enclosed operation
+
+    Spans are only exported when a tracer is configured.  Exceptions are recorded
+    in the span attributes and re-raised.
+
+    :param name: Name of the operation
+    :param attrs: Attributes describing the operation
+    """
+    current = Span(name, attrs, _CURRENT.get())
+    token = _CURRENT.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        current.duration = time.perf_counter() - start
+        _CURRENT.reset(token)
+        tracer = get_tracer()
+        if tracer is not None:
+            tracer.export(current)
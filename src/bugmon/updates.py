@@ -0,0 +1,176 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import asyncio
+import json
+import logging
+import os
+import time
+from itertools import groupby
+from pathlib import Path
+from typing import Any, Dict, List, Optional, TypedDict
+
+import requests
+from bugsy import BugsyException
+
+from .bugzilla import AsyncBugzilla, _is_transient
+
+log = logging.getLogger(__name__)
+
+# Number of pending updates after which callers should flush the queue
+MAX_PENDING = 20
+
+_QUEUE: Optional["CommitQueue"] = None
+
+
+class PendingUpdate(TypedDict):
+    """Changes to a bug which haven't been submitted yet"""
+
+    bug_id: int
+    diff: Dict[str, Any]
+    created: int
+
+
+class CommitQueue:
+    """Collects bug changes so that they can be submitted together
+
+    If a path is supplied, pending updates are written to it so that they survive
+    crashes and can be submitted by other processes.  Updates are only removed once
+    submitted or rejected by Bugzilla.
+
+    :param path: Directory used for persisting pending updates
+    :param max_pending: Number of pending updates after which the queue is full
+    """
+
+    def __init__(self, path: Optional[Path] = None, max_pending: int = MAX_PENDING):
+        self.path = path
+        self.max_pending = max_pending
+        self._pending: List[PendingUpdate] = []
+        self._created = 0
+        if self.path is not None:
+            self.path.mkdir(parents=True, exist_ok=True)
+
+    def _entry(self, update: PendingUpdate) -> Path:
+        """Path of the file storing the update
+
+        :param update: Pending update
+        """
+        assert self.path is not None
+        return self.path / f"{update['bug_id']}-{update['created']}.json"
+
+    def add(self, bug_id: int, diff: Dict[str, Any]) -> None:
+        """Queue changes for submission
+
+        :param bug_id: Bug number
+        :param diff: Changes as returned by EnhancedBug.diff
+        """
+        # Ensure that updates queued in quick succession retain their order
+        self._created = max(time.time_ns(), self._created + 1)
+        update: PendingUpdate = {
+            "bug_id": bug_id,
+            "diff": diff,
+            "created": self._created,
+        }
+        if self.path is None:
+            self._pending.append(update)
+            return
+
+        # Write atomically as other processes may be flushing the queue
+        entry = self._entry(update)
+        temp = entry.with_name(f".{entry.name}.{os.getpid()}")
+        temp.write_text(json.dumps(update))
+        temp.replace(entry)
+
+    @property
+    def pending(self) -> List[PendingUpdate]:
+        """Updates waiting to be submitted, oldest first"""
+        if self.path is None:
+            return list(self._pending)
+
+        updates = []
+        for entry in self.path.glob("*.json"):
+            try:
+                updates.append(json.loads(entry.read_text()))
+            except (OSError, ValueError) as e:
+                log.warning(f"Unable to read pending update {entry.name}: {e}")
+
+        return sorted(updates, key=lambda update: update["created"])
+
+    @property
+    def full(self) -> bool:
+        """Whether enough updates are pending to warrant a flush"""
+        return len(self.pending) >= self.max_pending
+
+    def _remove(self, update: PendingUpdate) -> None:
+        """Discard an update
+
+        :param update: Pending update
+        """
+        if self.path is None:
+            self._pending.remove(update)
+        else:
+            self._entry(update).unlink(missing_ok=True)
+
+    async def _submit(self, client: AsyncBugzilla, updates: List[PendingUpdate]) -> int:
+        """Submit the updates of a single bug in order
+
+        :param client: Bugzilla client
+        :param updates: Pending updates of the bug
+        :return: Number of updates which remain pending
+        """
+        for i, update in enumerate(updates):
+            bug_id = update["bug_id"]
+            try:
+                await client.request(f"bug/{bug_id}", "PUT", json=update["diff"])
+            except (BugsyException, requests.exceptions.RequestException) as e:
+                if _is_transient(e):
+                    log.error(f"Failed to update bug {bug_id}, will retry: {e}")
+                    return len(updates) - i
+                log.error(f"Bugzilla rejected update to bug {bug_id}: {e}")
+
+            self._remove(update)
+
+        return 0
+
+    async def _flush(self, client: AsyncBugzilla) -> int:
+        """Submit all pending updates, bugs concurrently
+
+        :param client: Bugzilla client
+        :return: Number of updates which remain pending
+        """
+        by_bug = groupby(
+            sorted(self.pending, key=lambda update: update["bug_id"]),
+            key=lambda update: update["bug_id"],
+        )
+        remaining = await asyncio.gather(
+            *(self._submit(client, list(updates)) for _, updates in by_bug)
+        )
+        return sum(remaining)
+
+    def flush(self, client: AsyncBugzilla) -> int:
+        """Submit all pending updates
+
+        Updates which fail with transient errors are kept for the next flush.
+
+        :param client: Bugzilla client
+        :return: Number of updates which remain pending
+        """
+        return asyncio.run(self._flush(client))
+
+
+def get_commit_queue() -> Optional[CommitQueue]:
+    """Return the configured commit queue, if any"""
+    return _QUEUE
+
+
+def set_commit_queue(
+    enabled: bool, path: Optional[Path] = None
+) -> Optional[CommitQueue]:
+    """Configure the commit queue used by BugMonitor
+
+    :param enabled: Whether changes should be queued rather than submitted directly
+    :param path: Directory used for persisting pending updates
+    """
+    global _QUEUE  # pylint: disable=global-statement
+    _QUEUE = CommitQueue(path) if enabled else None
+    return _QUEUE
@@ -1,26 +1,32 @@
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file, You can
 # obtain one at http://mozilla.org/MPL/2.0/.
+import base64
+import hashlib
+import json
 import logging
 import os
+import re
 import shutil
 import subprocess
 import tempfile
+import time
 import zipfile
 from contextlib import contextmanager
 from pathlib import Path, PurePosixPath
 from urllib.parse import urlparse
 
 try:
-    from typing import IO, Any, Dict, Generator, Optional, TypedDict, cast
+    from typing import IO, Any, Dict, Generator, List, Optional, Tuple, TypedDict, cast
 except ImportError:
-    from typing import IO, Any, Dict, Generator, Optional, cast
+    from typing import IO, Any, Dict, Generator, List, Optional, Tuple, cast
     from typing_extensions import TypedDict
 
 import requests
 from requests.adapters import HTTPAdapter, Retry
 from requests.models import Response
 
+from bugmon.cache import get_cache
 from bugmon.exceptions import BugmonException
 
 HTTP_SESSION = requests.Session()
@@ -31,10 +37,25 @@ HTTP_SESSION.mount("https://", HTTPAdapter(max_retries=HTTP_RETRIES))
 HG_BASE = "https://hg.mozilla.org"
 MILESTONE = "https://product-details.mozilla.org/1.0/firefox_versions.json"
 
+# Product details are refreshed after this many seconds
+PRODUCT_DETAILS_TTL = 6 * 60 * 60
+
 PERNOSCO = shutil.which("pernosco-submit")
 
+# Decoded attachments larger than this are written to disk
+SPOOL_SIZE = 8 * 1024**2
+# Number of base64 characters decoded at a time
+DECODE_CHUNK_SIZE = 4 * 1024**2
+# Characters outside of the base64 alphabet, which are discarded when decoding
+BASE64_DISCARD = re.compile(r"[^A-Za-z0-9+/=]")
+# Limits applied when extracting attachment archives
+MAX_EXTRACT_SIZE = 2 * 1024**3
+MAX_EXTRACT_FILES = 10000
+
 log = logging.getLogger(__name__)
 
+_PRODUCT_DETAILS: Optional[Tuple[float, Dict[str, str]]] = None
+
 
 class PernoscoCreds(TypedDict):
     """Interface representing required pernosco creds"""
@@ -44,6 +65,16 @@ class PernoscoCreds(TypedDict):
     PERNOSCO_USER_SECRET_KEY: str
 
 
+def console_init_logging() -> None:
+    """Enable logging when called from console"""
+    log_level = logging.INFO
+    log_fmt = "[%(asctime)s] %(message)s"
+    if bool(os.getenv("DEBUG")):
+        log_level = logging.DEBUG
+        log_fmt = "%(levelname).1s %(name)s [%(asctime)s] %(message)s"
+    logging.basicConfig(format=log_fmt, datefmt="%Y-%m-%d %H:%M:%S", level=log_level)
+
+
 def _get_url(url: str) -> Response:
     """Retrieve requested URL"""
     data = HTTP_SESSION.get(url, stream=True)
@@ -51,11 +82,55 @@ def _get_url(url: str) -> Response:
     return data
 
 
+def _get_product_details() -> Dict[str, str]:
+    """Fetch Firefox product details
+
+    The data is shared by all bugs in a run and, if a persistent cache is
+    configured, by consecutive runs until it expires.
+    """
+    global _PRODUCT_DETAILS  # pylint: disable=global-statement
+    now = time.time()
+    if _PRODUCT_DETAILS is not None:
+        fetched, data = _PRODUCT_DETAILS
+        if now - fetched < PRODUCT_DETAILS_TTL:
+            return data
+
+    cache = get_cache()
+    path = cache.path / "firefox_versions.json" if cache is not None else None
+    if path is not None and path.exists():
+        fetched = path.stat().st_mtime
+        if now - fetched < PRODUCT_DETAILS_TTL:
+            data = cast(Dict[str, str], json.loads(path.read_text()))
+            _PRODUCT_DETAILS = (fetched, data)
+            return data
+
+    data = cast(Dict[str, str], _get_url(MILESTONE).json())
+    if path is not None:
+        # Write atomically as other processes may be reading the file
+        temp = path.with_name(f"{path.name}.{os.getpid()}")
+        temp.write_text(json.dumps(data))
+        temp.replace(path)
+
+    _PRODUCT_DETAILS = (now, data)
+    return data
+
+
 def _get_milestone() -> int:
     """Fetch current milestone"""
-    resp = _get_url(MILESTONE)
-    json = resp.json()
-    return int(json["FIREFOX_NIGHTLY"].split(".")[0])
+    return int(_get_product_details()["FIREFOX_NIGHTLY"].split(".")[0])
+
+
+def _get_esr(alias: str) -> Optional[str]:
+    """Resolve an ESR alias to the corresponding branch name
+
+    :param alias: Either esr-stable or esr-next
+    """
+    key = "FIREFOX_ESR" if alias == "esr-stable" else "FIREFOX_ESR_NEXT"
+    match = re.search(r"^\d+", _get_product_details().get(key) or "")
+    if match is None:
+        return None
+
+    return f"esr{match.group(0)}"
 
 
 def _get_rev(branch: str, rev: str) -> Response:
@@ -114,6 +189,103 @@ def download_zip_archive(url: str) -> Generator[Path, None, None]:
                 yield Path(tempdir)
 
 
+@contextmanager
+def decode_base64(data: str) -> Generator[IO[bytes], None, None]:
+    """Decode base64 data into a temporary file without holding a decoded copy
+
+    :param data: Base64 encoded data
+    :raises binascii.Error: If the data is not valid base64
+    """
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as temp:
+        pending = ""
+        for start in range(0, len(data), DECODE_CHUNK_SIZE):
+            # Like decodebytes(), stray characters are discarded and decoding stops
+            # at the first padding, so chunks must be realigned to 4 characters
+            pending += BASE64_DISCARD.sub("", data[start : start + DECODE_CHUNK_SIZE])
+            if "=" in pending:
+                break
+            usable = len(pending) - len(pending) % 4
+            temp.write(base64.b64decode(pending[:usable]))
+            pending = pending[usable:]
+
+        if pending:
+            temp.write(base64.b64decode(pending))
+
+        temp.seek(0)
+        yield cast(IO[bytes], temp)
+
+
+def extract_zip(
+    file: IO[bytes],
+    dest: Path,
+    max_size: int = MAX_EXTRACT_SIZE,
+    max_files: int = MAX_EXTRACT_FILES,
+) -> List[str]:
+    """Extract a zip archive while guarding against malicious contents
+
+    :param file: The zip archive
+    :param dest: Directory to extract into
+    :param max_size: Maximum total uncompressed size
+    :param max_files: Maximum number of members
+    :raises BugmonException: If the archive exceeds the limits or escapes dest
+    :raises zipfile.BadZipFile: If the archive is invalid
+    :return: Names of the extracted files
+    """
+    root = dest.resolve()
+    with zipfile.ZipFile(file) as archive:
+        members = archive.infolist()
+        if len(members) > max_files:
+            raise BugmonException(f"Archive contains too many files ({len(members)})")
+
+        for member in members:
+            if not (root / member.filename).resolve().is_relative_to(root):
+                raise BugmonException(f"Unsafe path in archive ({member.filename})")
+
+        if sum(member.file_size for member in members) > max_size:
+            raise BugmonException("Archive exceeds the maximum extracted size")
+
+        # Declared sizes can't be trusted so the limit is enforced while extracting
+        extracted = 0
+        names = []
+        for member in members:
+            target = root / member.filename
+            if member.is_dir():
+                target.mkdir(parents=True, exist_ok=True)
+                continue
+
+            if target.exists():
+                log.warning("Duplicate filename: %s", member.filename)
+
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with archive.open(member) as src, target.open("wb") as dst:
+                while chunk := src.read(128 * 1024):
+                    extracted += len(chunk)
+                    if extracted > max_size:
+                        raise BugmonException(
+                            "Archive exceeds the maximum extracted size"
+                        )
+                    dst.write(chunk)
+
+            names.append(member.filename)
+
+    return names
+
+
+def hash_directory(path: Path) -> str:
+    """Create a digest of all file names and contents within a directory
+
+    :param path: Directory to hash
+    """
+    digest = hashlib.sha256()
+    for file in sorted(p for p in path.rglob("*") if p.is_file()):
+        digest.update(file.relative_to(path).as_posix().encode("utf-8"))
+        with file.open("rb") as fp:
+            while chunk := fp.read(128 * 1024):
+                digest.update(chunk)
+
+    return digest.hexdigest()
+
+
 def is_pernosco_available() -> bool:
     """Determines if pernosco-submit is properly configured"""
     result = subprocess.run(
@@ -11,6 +11,10 @@ from bugsy import Bugsy
 from fuzzfetch import BuildFlags, Fetcher
 
 from bugmon import BugMonitor, EnhancedBug
+from bugmon import bug as bug_module
+from bugmon import utils
+from bugmon.builds import BUILD_RESOLVER
+from bugmon.cache import set_cache
 from bugmon.evaluator_configs import BrowserConfiguration, JSConfiguration
 
 REV = "7bd6cb8b76c078f5e687574decdde97f1e4affce"
@@ -18,6 +22,15 @@ SHORT_REV = REV[:12]
 BUILD_ID = f"20200811-{SHORT_REV}"
 
 
+@pytest.fixture(autouse=True)
+def clear_memoized():
+    """Prevent memoized lookups from leaking between tests"""
+    yield
+    BUILD_RESOLVER.clear()
+    bug_module._VALID_FLAGS.clear()
+    utils._PRODUCT_DETAILS = None
+
+
 @pytest.fixture
 def attachment_data():
     """Simple attachment"""
@@ -191,6 +204,13 @@ def working_dir(tmp_path):
     return working_dir
 
 
+@pytest.fixture
+def cache(tmp_path):
+    """Configures a process-wide cache for the duration of the test"""
+    yield set_cache(tmp_path / "cache")
+    set_cache(None)
+
+
 @pytest.fixture
 def pernosco_creds():
     """Mock pernosco creds"""
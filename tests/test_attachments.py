@@ -0,0 +1,106 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import base64
+import io
+import sqlite3
+import sys
+import time
+import zipfile
+from contextlib import closing
+
+import pytest
+
+from bugmon.attachments import PRUNE_GRACE, AttachmentStore, clone_file
+from bugmon.bug import LocalAttachment
+from bugmon.utils import decode_base64
+
+
+def test_store_reuses_entries(mocker, tmp_path, attachment_data):
+    """Verify that stored attachments are only decoded once"""
+    decode = mocker.patch("bugmon.attachments.decode_base64", wraps=decode_base64)
+    attachment = LocalAttachment(**attachment_data)
+
+    first = AttachmentStore(tmp_path / "store").get(attachment)
+    second = AttachmentStore(tmp_path / "store").get(attachment)
+
+    assert first == second
+    assert (first / "test.js").read_text() == "alert(1)\n"
+    assert decode.call_count == 1
+
+
+def test_store_unpacks_archives(tmp_path, attachment_data):
+    """Verify that archives are stored unpacked unless requested otherwise"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("dir/test.js", "alert(1)")
+    data = dict(attachment_data, file_name="testcase.zip")
+    data["data"] = base64.b64encode(buffer.getvalue()).decode("utf-8")
+    attachment = LocalAttachment(**data)
+    store = AttachmentStore(tmp_path)
+
+    assert (store.get(attachment) / "dir" / "test.js").exists()
+    assert (store.get(attachment, unpack=False) / "testcase.zip").exists()
+
+
+def test_store_materialize_copies(tmp_path, attachment_data):
+    """Verify that stored files are copied into the destination"""
+    store = AttachmentStore(tmp_path / "store")
+    entry = store.get(LocalAttachment(**attachment_data))
+    dest = tmp_path / "dest"
+    dest.mkdir()
+
+    store.materialize(entry, dest)
+    (dest / "test.js").write_text("modified")
+
+    assert not (dest / "test.js").samefile(entry / "test.js")
+    assert (entry / "test.js").read_text() == "alert(1)\n"
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="reflinks are only tried on linux")
+def test_clone_file_falls_back_to_copy(mocker, tmp_path):
+    """Verify that files are copied when the filesystem can't clone them"""
+    src = tmp_path / "src.js"
+    src.write_text("alert(1)")
+    mocker.patch("bugmon.attachments.fcntl.ioctl", side_effect=OSError)
+
+    clone_file(src, tmp_path / "dest.js")
+
+    assert (tmp_path / "dest.js").read_text() == "alert(1)"
+
+
+def test_store_reuses_known_entry(mocker, tmp_path, attachment_data):
+    """Verify that a previously computed entry isn't hashed again"""
+    attachment = LocalAttachment(**attachment_data)
+    store = AttachmentStore(tmp_path)
+    entry = store.entry(attachment)
+    spy = mocker.spy(store, "entry")
+
+    assert store.get(attachment, entry=entry) == entry
+    spy.assert_not_called()
+
+
+def test_store_prunes_least_recently_used(tmp_path, attachment_data):
+    """Verify that the least recently used entries are removed when over the limit"""
+    store = AttachmentStore(tmp_path, max_size=len("alert(1)\n"))
+    old = store.get(LocalAttachment(**dict(attachment_data, id=1)))
+    used = store.get(LocalAttachment(**dict(attachment_data, id=2)))
+    with closing(sqlite3.connect(store.db_path)) as con, con:
+        con.execute("UPDATE entries SET used = ?", (time.time() - 2 * PRUNE_GRACE,))
+
+    store.get(LocalAttachment(**dict(attachment_data, id=2)))
+    store.prune()
+
+    assert not old.exists()
+    assert used.exists()
+
+
+def test_store_prunes_from_recorded_sizes(mocker, tmp_path, attachment_data):
+    """Verify that pruning doesn't walk the stored entries"""
+    store = AttachmentStore(tmp_path, max_size=0)
+    store.get(LocalAttachment(**attachment_data))
+    tree_size = mocker.patch("bugmon.attachments._tree_size")
+
+    store.prune()
+
+    tree_size.assert_not_called()
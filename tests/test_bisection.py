@@ -0,0 +1,85 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+from types import SimpleNamespace
+
+import pytest
+from autobisect.bisect import Bisector
+from autobisect.evaluators import EvaluatorResult
+from fuzzfetch import BuildFlags, Platform
+
+from bugmon.bisection import KnownOutcome, SeededBisector
+
+CRASHED = EvaluatorResult.BUILD_CRASHED
+PASSED = EvaluatorResult.BUILD_PASSED
+
+
+@pytest.fixture(name="make_bisector")
+def fixture_make_bisector(mocker):
+    """Create a SeededBisector without resolving any builds"""
+    mocker.patch("autobisect.bisect.Fetcher")
+    mocker.patch("autobisect.bisect.BuildManager")
+    evaluator = mocker.Mock(target="js")
+
+    def make(known, find_fix=False, record=None):
+        bisector = SeededBisector(
+            evaluator,
+            "central",
+            None,
+            None,
+            BuildFlags(),
+            Platform("Linux", "x86_64"),
+            find_fix,
+            known=known,
+            record=record,
+        )
+        bisector.start = SimpleNamespace(id="20200101000000", changeset="start")
+        bisector.end = SimpleNamespace(id="20200110000000", changeset="end")
+        return bisector
+
+    return make
+
+
+@pytest.mark.parametrize(
+    "find_fix, outcomes, expected",
+    [
+        (False, [PASSED, PASSED, CRASHED, CRASHED], ("b", "c")),
+        (True, [CRASHED, CRASHED, PASSED, PASSED], ("b", "c")),
+        (False, [CRASHED, CRASHED, CRASHED, CRASHED], ("start", "a")),
+    ],
+)
+def test_narrow_uses_known_outcomes(
+    mocker, make_bisector, find_fix, outcomes, expected
+):
+    """Verify that the bounds are moved to the closest known builds"""
+    known = [
+        KnownOutcome(f"2020010{i + 2}000000", changeset, result)
+        for i, (changeset, result) in enumerate(zip("abcd", outcomes))
+    ]
+    mocker.patch(
+        "bugmon.bisection.BUILD_RESOLVER.resolve",
+        side_effect=lambda branch, rev, *_: SimpleNamespace(
+            id=next(k.build_id for k in known if k.changeset == rev), changeset=rev
+        ),
+    )
+    bisector = make_bisector(known, find_fix)
+
+    bisector.narrow()
+
+    assert (bisector.start.changeset, bisector.end.changeset) == expected
+
+
+def test_test_build_skips_known_builds(mocker, make_bisector):
+    """Verify that only builds without a known outcome are evaluated and recorded"""
+    test_build = mocker.patch.object(Bisector, "test_build", return_value=PASSED)
+    record = mocker.Mock()
+    bisector = make_bisector(
+        [KnownOutcome("20200105000000", "a", CRASHED)], record=record
+    )
+    known = mocker.Mock(changeset="a")
+    unknown = mocker.Mock(changeset="b")
+
+    assert bisector.test_build(known) == CRASHED
+    assert bisector.test_build(unknown) == PASSED
+    test_build.assert_called_once_with(unknown)
+    record.assert_called_once_with(unknown, PASSED)
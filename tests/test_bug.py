@@ -10,12 +10,16 @@ import json
 from types import SimpleNamespace
 
 import pytest
+from bugsy import Bugsy
 
+from bugmon import bug as bug_module
 from bugmon.bug import (
     BugException,
     EnhancedBug,
     LocalAttachment,
     LocalComment,
+    ParsedReport,
+    get_valid_flags,
     sanitize_bug,
 )
 
@@ -129,7 +133,7 @@ def test_attachment_remote_methods(attachment_data, method):
 @pytest.mark.parametrize("alias, version", BRANCH_ALIAS_PAIRS)
 def test_bug_branch(mocker, bug_data, alias, version):
     """Test that branch matches alias of current version"""
-    mocker.patch("bugmon.bug.Fetcher.resolve_esr", side_effect=["esr78", "esr68"])
+    mocker.patch("bugmon.bug._get_esr", side_effect=["esr78", "esr68"])
     bug = EnhancedBug(bugsy=None, **bug_data)
 
     # Set fixed central version and bug version
@@ -141,7 +145,7 @@ def test_bug_branch(mocker, bug_data, alias, version):
 
 def test_bug_branches(mocker, bug_data):
     """Test branch enumeration"""
-    mocker.patch("bugmon.bug.Fetcher.resolve_esr", side_effect=["esr78", "esr68"])
+    mocker.patch("bugmon.bug._get_esr", side_effect=["esr78", "esr68"])
     bug = EnhancedBug(bugsy=None, **bug_data)
     # Set fixed central version
     bug._central_version = 81
@@ -171,6 +175,23 @@ def test_bug_build_flags(bug_data):
     assert bug.build_flags.valgrind is False
 
 
+def test_parsed_report():
+    """Test that comment 0 is parsed into its components in a single pass"""
+    report = ParsedReport.parse(
+        "==1==ERROR: AddressSanitizer: SEGV\n"
+        f"Built from `{BUILD_ID}` (see {REV}) with --enable-debug\n"
+        "Run with `ASAN_OPTIONS=detect_leaks=0` js --fuzzing-safe --ion-eager t.js"
+    )
+
+    assert report.sanitizers == {"AddressSanitizer"}
+    assert report.env == {"ASAN_OPTIONS": "detect_leaks=0"}
+    assert report.revisions == (BUILD_ID, REV)
+    assert report.has_option("--enable-debug")
+    assert not report.has_option("--enable-valgrind")
+    assert report.find_option("ion") == "--ion-eager"
+    assert report.find_option("baseline-eager") is None
+
+
 def test_bug_central_version(mocker, bug_data):
     """Simple test of bug.central_version"""
     mocker.patch("bugmon.bug._get_milestone", return_value=81)
@@ -210,12 +231,12 @@ def test_bug_initial_build_id_comment(mocker, bug_data, code_wrap, bid):
     elif bid in (REV, SHORT_REV):
         assert bug.initial_build_id == SHORT_REV
     elif bid == DATE:
-        mocker.patch("bugmon.bug.Fetcher").return_value = SimpleNamespace(
+        mocker.patch("bugmon.builds.Fetcher").return_value = SimpleNamespace(
             **{"changeset": REV}
         )
         assert bug.initial_build_id == REV
     else:
-        mocker.patch("bugmon.bug.Fetcher").side_effect = BugException
+        mocker.patch("bugmon.builds.Fetcher").side_effect = BugException
         with pytest.raises(BugException):
             _ = bug.initial_build_id
 
@@ -259,6 +280,33 @@ def test_bug_command_setter_append(bug_data):
     assert bug.whiteboard == "[bugmon:bisected,confirmed,verified,fake_command]"
 
 
+def test_bug_commands_modified_in_place(bug_data):
+    """Test that in-place command changes are written back when committing"""
+    bug = EnhancedBug(bugsy=None, **bug_data)
+    assert bug.commands is bug.commands
+
+    bug.commands.pop("verified")
+    bug.commands["origRev"] = "0e384d802c84"
+    assert bug._bug["whiteboard"] == "[bugmon:bisected,confirmed,verified]"
+    assert bug.diff() == {
+        "whiteboard": "[bugmon:bisected,confirmed,origRev=0e384d802c84]"
+    }
+
+    # Replacing the whiteboard discards the parsed commands
+    bug.whiteboard = "[bugmon:verify]"
+    assert bug.commands == {"verify": None}
+
+
+def test_bug_commands_unmodified(bug_data):
+    """Test that reading commands doesn't rewrite the whiteboard"""
+    data = copy.deepcopy(bug_data)
+    data["whiteboard"] = "[bugmon:]"
+    bug = EnhancedBug(bugsy=None, **data)
+
+    assert not bug.commands
+    assert not bug.diff()
+
+
 def test_bug_command_setter_replace(bug_data):
     """Test replacing commands"""
     bug = EnhancedBug(bugsy=None, **bug_data)
@@ -362,6 +410,85 @@ def test_bug_runtime_opts_not_present(mocker, bug_data):
     assert bug.runtime_opts == []
 
 
+def test_bug_runtime_opts_memoized(mocker, bug_data, cache):
+    """Test that valid flags are only retrieved once per revision"""
+    data = copy.deepcopy(bug_data)
+    data["comments"][0]["text"] = "--ion-regalloc=backtracking"
+    get_valid_flags = mocker.patch(
+        "bugmon.bug.JSEvaluator.get_valid_flags", return_value=["ion-regalloc"]
+    )
+
+    bug = EnhancedBug(bugsy=None, **data)
+    bug._initial_build_id = "72f0cfd2cd42"
+    assert bug.runtime_opts == bug.runtime_opts == ["--ion-regalloc=backtracking"]
+    assert get_valid_flags.call_count == 1
+
+    # Subsequent runs use the persistent cache
+    bug_module._VALID_FLAGS.clear()
+    bug = EnhancedBug(bugsy=None, **data)
+    bug._initial_build_id = "72f0cfd2cd42"
+    assert bug.runtime_opts == ["--ion-regalloc=backtracking"]
+    assert get_valid_flags.call_count == 1
+
+
+def test_get_valid_flags_keeps_order(mocker, cache):
+    """Test that valid flags are retained in the order returned by the evaluator"""
+    flags = ["ion-regalloc", "baseline-eager", "ion-eager"]
+    mocker.patch("bugmon.bug.JSEvaluator.get_valid_flags", return_value=flags)
+
+    assert get_valid_flags("72f0cfd2cd42") == flags
+    bug_module._VALID_FLAGS.clear()
+    assert get_valid_flags("72f0cfd2cd42") == flags
+
+
+def test_bug_find_patch_rev(bug_data, comment_data):
+    """Test that the latest landed revision is returned for each branch"""
+    base = "https://hg.mozilla.org"
+    data = copy.deepcopy(bug_data)
+    for time, text in [
+        ("2020-07-02T00:00:00Z", f"{base}/mozilla-central/rev/{'b' * 12}"),
+        ("2020-07-01T00:00:00Z", f"{base}/mozilla-central/rev/{'a' * 12}"),
+        ("2020-07-01T00:00:00Z", f"{base}/integration/autoland/rev/{REV}"),
+        ("2020-07-03T00:00:00Z", f"See {base}/releases/mozilla-beta/rev/{REV}"),
+    ]:
+        data["comments"].append(dict(comment_data, creation_time=time, text=text))
+    bug = EnhancedBug(bugsy=None, **data)
+
+    assert bug.find_patch_rev("central") == "b" * 12
+    assert bug.find_patch_rev("autoland") == SHORT_REV
+    assert bug.find_patch_rev("beta") is None
+
+    # The index is rebuilt once new comments arrive
+    bug._bug["comments"].append(
+        dict(
+            comment_data,
+            creation_time="2020-07-04T00:00:00Z",
+            text=f"{base}/releases/mozilla-beta/rev/{REV}",
+        )
+    )
+    assert bug.find_patch_rev("beta") == SHORT_REV
+
+
+def test_bug_fetch_attachment_data(mocker, bug_data_base, attachment_data):
+    """Test that attachment contents are retrieved once for hydrated bugs"""
+    metadata = {k: v for k, v in attachment_data.items() if k != "data"}
+    bugsy = mocker.Mock(spec=Bugsy)
+    bugsy.request.return_value = {
+        "attachments": {str(metadata["id"]): {"data": attachment_data["data"]}}
+    }
+    bug = EnhancedBug(bugsy, **dict(bug_data_base, attachments=[metadata]))
+
+    attachments = bug.get_attachments()
+    bug.fetch_attachment_data(attachments)
+    bug.fetch_attachment_data(bug.get_attachments())
+
+    assert attachments[0].data == attachment_data["data"]
+    bugsy.request.assert_called_once_with(
+        f"bug/attachment/{metadata['id']}",
+        params={"attachment_ids": [], "include_fields": "id,data"},
+    )
+
+
 def test_bug_add_needinfo(bug_data):
     """Test that needinfo can be added to a bug"""
     data = copy.deepcopy(bug_data)
@@ -2,13 +2,41 @@
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file, You can
 # obtain one at http://mozilla.org/MPL/2.0/.
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
 import pytest
 from autobisect.bisect import BisectionResult
+from autobisect.build_manager import BuildManagerException
+from autobisect.evaluators import EvaluatorResult
 from fuzzfetch import Platform
 
-from bugmon import BugMonitor, ReproductionCrashed, ReproductionPassed
-from bugmon.bug import EnhancedBug
+from bugmon import (
+    BugMonitor,
+    ReproductionCrashed,
+    ReproductionFailed,
+    ReproductionPassed,
+)
+from bugmon.bug import EnhancedBug, LocalAttachment
+from bugmon.bugmon import (
+    PREFETCH_LOOKAHEAD,
+    WORKER_GRACE,
+    _init_worker,
+    _terminate_pool,
+)
+from bugmon.builds import BUILD_RESOLVER
 from bugmon.exceptions import BugmonException
+from bugmon.tracing import set_tracer
+
+
+@pytest.fixture
+def thread_pool(mocker):
+    """Evaluate candidates in threads rather than initialized worker processes"""
+    return mocker.patch(
+        "bugmon.bugmon.ProcessPoolExecutor",
+        side_effect=lambda max_workers, **_: ThreadPoolExecutor(max_workers),
+    )
 
 
 def test_bugmon_need_info_on_bisect_fix(mocker, bugmon, build):
@@ -248,3 +276,314 @@ def test_bugmon_already_verified_but_not_branches(bugmon):
         "release": 78,
     }
     assert bugmon.needs_verify() is True
+
+
+def test_bugmon_reproduce_uses_stored_result(mocker, bugmon, build, js_config, cache):
+    """Verify that stored results are used without retrieving the build"""
+    mocker.patch("bugmon.builds.Fetcher", return_value=build)
+    mocker.patch.object(
+        js_config.evaluator,
+        "evaluate_testcase",
+        return_value=EvaluatorResult.BUILD_CRASHED,
+    )
+    get_build = mocker.patch.object(bugmon.build_manager, "get_build")
+
+    first = bugmon._reproduce_bug(js_config, "central", use_cache=False)
+    assert isinstance(first, ReproductionCrashed)
+    assert get_build.call_count == 1
+
+    bugmon.results = {}
+    second = bugmon._reproduce_bug(js_config, "central", use_cache=False)
+    assert isinstance(second, ReproductionCrashed)
+    assert get_build.call_count == 1
+
+
+def test_bugmon_fetch_attachments_once(mocker, bugmon, attachment_data, caplog):
+    """Verify that attachments are only materialized once per monitor"""
+    attachment = LocalAttachment(**attachment_data)
+    mocker.patch("bugmon.bug.EnhancedBug.get_attachments", return_value=[attachment])
+
+    bugmon.fetch_attachments()
+    bugmon.fetch_attachments()
+
+    assert (bugmon.test_dir / "test.js").read_text() == "alert(1)\n"
+    assert "Duplicate filename" not in caplog.text
+
+
+def test_bugmon_fetch_attachments_stored_without_data(
+    mocker, bugmon, attachment_data, cache
+):
+    """Verify that contents are only retrieved for attachments not yet stored"""
+    mocker.patch(
+        "bugmon.bug.EnhancedBug.get_attachments",
+        return_value=[LocalAttachment(**attachment_data)],
+    )
+    bugmon.fetch_attachments()
+
+    metadata = {k: v for k, v in attachment_data.items() if k != "data"}
+    mocker.patch(
+        "bugmon.bug.EnhancedBug.get_attachments",
+        return_value=[LocalAttachment(**metadata)],
+    )
+    fetch = mocker.patch("bugmon.bug.EnhancedBug.fetch_attachment_data")
+    other_dir = bugmon.working_dir.parent / "other"
+    other_dir.mkdir()
+    other = BugMonitor(bugmon.bugsy, bugmon.bug, other_dir, dry_run=True)
+    other.fetch_attachments()
+
+    fetch.assert_called_once_with([])
+    assert (other.test_dir / "test.js").read_text() == "alert(1)\n"
+
+
+def test_bugmon_unavailable_build_is_not_retried(mocker, bugmon, build, js_config):
+    """Verify that builds which couldn't be retrieved aren't requested again"""
+    mocker.patch("bugmon.builds.Fetcher", return_value=build)
+    get_build = mocker.patch.object(
+        bugmon.build_manager, "get_build", side_effect=BuildManagerException
+    )
+
+    for _ in range(2):
+        result = bugmon._reproduce_bug(js_config, "central", "20200101", False)
+        assert isinstance(result, ReproductionFailed)
+    assert get_build.call_count == 1
+
+
+def test_bugmon_detect_config_parallel_keeps_priority(
+    mocker, bugmon, build, thread_pool
+):
+    """Verify that parallel detection selects the highest priority crash"""
+    configs = [mocker.Mock(params={}) for _ in range(4)]
+    statuses = [
+        EvaluatorResult.BUILD_PASSED,
+        EvaluatorResult.BUILD_CRASHED,
+        EvaluatorResult.BUILD_CRASHED,
+        EvaluatorResult.BUILD_PASSED,
+    ]
+    mocker.patch.object(bugmon, "fetch_attachments")
+    mocker.patch.object(bugmon, "_iter_candidates", return_value=iter(configs))
+    mocker.patch.object(bugmon, "_resolve_build", return_value=build)
+    mocker.patch(
+        "bugmon.bugmon._evaluate_candidate",
+        side_effect=lambda config, _: statuses[configs.index(config)],
+    )
+    bugmon.detect_jobs = 3
+    bugmon.bug._branch = "central"
+
+    assert bugmon.detect_config() is configs[1]
+    assert bugmon._close_bug is False
+
+
+def test_bugmon_detect_config_parallel_returns_first_crash(
+    mocker, bugmon, build, thread_pool
+):
+    """Verify that parallel detection doesn't wait for running evaluations"""
+    configs = [mocker.Mock(params={}) for _ in range(2)]
+    release = threading.Event()
+    finished = []
+
+    def evaluate(config, _):
+        if config is configs[0]:
+            return EvaluatorResult.BUILD_CRASHED
+        release.wait(5)
+        finished.append(config)
+        return EvaluatorResult.BUILD_PASSED
+
+    mocker.patch.object(bugmon, "fetch_attachments")
+    mocker.patch.object(bugmon, "_iter_candidates", return_value=iter(configs))
+    mocker.patch.object(bugmon, "_resolve_build", return_value=build)
+    mocker.patch("bugmon.bugmon._evaluate_candidate", side_effect=evaluate)
+    bugmon.detect_jobs = 2
+    bugmon.bug._branch = "central"
+
+    assert bugmon.detect_config() is configs[0]
+    assert not finished
+    release.set()
+
+
+def test_terminate_pool_stops_running_workers(bugmon):
+    """Verify that running evaluations are terminated rather than awaited"""
+    executor = bugmon._executor(1)
+    future = executor.submit(time.sleep, 60)
+    while not future.running():
+        time.sleep(0.01)
+    processes = list(executor._processes.values())
+
+    start = time.monotonic()
+    _terminate_pool(executor)
+
+    assert time.monotonic() - start < WORKER_GRACE
+    assert not any(process.is_alive() for process in processes)
+
+
+def test_bugmon_verify_branches_interrupted(mocker, bugmon, js_config, build):
+    """Verify that branch verifications are terminated if collection is interrupted"""
+    pool = mocker.patch("bugmon.bugmon.ProcessPoolExecutor")
+    pool.return_value.submit.return_value = Future()
+    terminate = mocker.patch("bugmon.bugmon._terminate_pool")
+    mocker.patch.object(bugmon, "_resolve_build", return_value=build)
+    mocker.patch.object(bugmon, "_collect_candidate", side_effect=KeyboardInterrupt)
+
+    with pytest.raises(KeyboardInterrupt):
+        bugmon._verify_parallel(js_config, [("beta", "cf_status_beta", "abcdef")])
+
+    terminate.assert_called_once_with(pool.return_value)
+
+
+def test_bugmon_executor_initializes_workers(mocker, bugmon, cache, tmp_path):
+    """Verify that workers are started fresh and configured by the initializer"""
+    pool = mocker.patch("bugmon.bugmon.ProcessPoolExecutor")
+    set_tracer(tmp_path / "trace.jsonl")
+
+    try:
+        bugmon._executor(2)
+    finally:
+        set_tracer(None)
+
+    kwargs = pool.call_args.kwargs
+    assert kwargs["mp_context"].get_start_method() in ("forkserver", "spawn")
+    assert kwargs["initargs"] == (
+        bugmon.working_dir / "workers",
+        cache.path,
+        tmp_path / "trace.jsonl",
+    )
+
+
+def test_bugmon_verify_branches_parallel(mocker, bugmon, js_config, thread_pool):
+    """Verify that fixed branches are evaluated concurrently and flagged in order"""
+    statuses = {
+        "beta": EvaluatorResult.BUILD_PASSED,
+        "release": EvaluatorResult.BUILD_CRASHED,
+        "esr78": EvaluatorResult.BUILD_FAILED,
+    }
+    builds = {
+        alias: mocker.Mock(_branch=alias, id="20200101", changeset=alias * 4)
+        for alias in statuses
+    }
+    mocker.patch.object(bugmon, "detect_config", return_value=js_config)
+    mocker.patch.object(
+        bugmon,
+        "_fixed_branches",
+        side_effect=lambda: iter([(alias, f"cf_status_{alias}") for alias in statuses]),
+    )
+    mocker.patch.object(bugmon, "_prefetch")
+    mocker.patch("bugmon.bug.EnhancedBug.find_patch_rev", return_value="abcdef")
+    mocker.patch.object(
+        bugmon, "_resolve_build", side_effect=lambda _, branch, __: builds[branch]
+    )
+    mocker.patch(
+        "bugmon.bugmon._evaluate_candidate",
+        side_effect=lambda _, build: statuses[build._branch],
+    )
+    bugmon.verify_jobs = 2
+    bugmon.bug.status = "VERIFIED"
+
+    bugmon._verify_fixed()
+
+    assert thread_pool.call_args.kwargs["max_workers"] == 2
+    assert thread_pool.call_args.kwargs["initializer"] is _init_worker
+    assert bugmon.bug.cf_status_beta == "verified"
+    assert bugmon.bug.cf_status_release == "affected"
+    assert bugmon.bug.cf_status_esr78 is None
+    assert bugmon._close_bug is False
+
+
+def test_bugmon_plan_reproductions_confirm(mocker, bugmon, build, js_config):
+    """Verify that confirmation plans the tip build of the bug branch"""
+    bugmon.remove_command("confirmed")
+    bugmon.bug._branch = "central"
+    detect = mocker.patch.object(bugmon, "detect_config", return_value=js_config)
+    resolve = mocker.patch.object(bugmon, "_resolve_build", return_value=build)
+
+    assert bugmon.plan_reproductions() == [(js_config, "central", build)]
+    assert detect.call_count == 1
+    resolve.assert_called_once_with(js_config, "central", None, pin=True)
+
+
+def test_bugmon_planned_build_pinned(mocker, bugmon, build, js_config):
+    """Verify that process() uses the planned build after "latest" expires"""
+    bugmon.remove_command("confirmed")
+    bugmon.bug._branch = "central"
+    mocker.patch.object(bugmon, "detect_config", return_value=js_config)
+    newer = mocker.Mock(_branch="central")
+    fetcher = mocker.patch("bugmon.builds.Fetcher", side_effect=[build, newer])
+    mocker.patch.object(BUILD_RESOLVER, "latest_ttl", 0)
+
+    assert bugmon.plan_reproductions() == [(js_config, "central", build)]
+    assert bugmon._resolve_build(js_config, "central") is build
+    assert fetcher.call_count == 1
+
+
+def test_bugmon_detect_config_is_retained(mocker, bugmon, js_config):
+    """Verify that detection only runs once per monitor"""
+    detect = mocker.patch.object(bugmon, "_detect_config", return_value=js_config)
+
+    assert bugmon.detect_config() is js_config
+    assert bugmon.detect_config() is js_config
+    assert detect.call_count == 1
+
+
+def test_bugmon_bisection_reused_across_bugs(
+    mocker, bugmon, bug, bugsy, build, js_config, cache
+):
+    """Verify that bugs with identical testcases reuse a stored bisection"""
+    bug._branch = "central"
+    build.build_info = {"moz_source_repo": "https://hg.mozilla.org/mozilla-central"}
+    bisector = mocker.patch("bugmon.bugmon.SeededBisector")
+    bisector.return_value.start = bisector.return_value.end = build
+    bisector.return_value.bisect.return_value = BisectionResult(
+        BisectionResult.SUCCESS, build, build, "central"
+    )
+
+    first = bugmon._run_bisection(js_config, None, "20200101", False)
+
+    other_dir = bugmon.working_dir.parent / "other"
+    other_dir.mkdir()
+    other = BugMonitor(bugsy, bug, other_dir, dry_run=True)
+    second = other._run_bisection(js_config, None, "20200101", False)
+
+    assert bisector.call_count == 1
+    assert second.status == BisectionResult.SUCCESS
+    assert second.pushlog == first.pushlog
+    assert second.end.id == build.id
+
+
+def test_bugmon_known_outcomes_per_config(bugmon, build, js_config, browser_config):
+    """Verify that bisection is only seeded with results of the same configuration"""
+    bugmon.record_result(js_config, "central", build, EvaluatorResult.BUILD_CRASHED)
+    bugmon.record_result(browser_config, "central", build, EvaluatorResult.BUILD_PASSED)
+
+    known = bugmon._known_outcomes(js_config, "central")
+
+    assert [outcome.result for outcome in known] == [EvaluatorResult.BUILD_CRASHED]
+
+
+def test_bugmon_bisection_steps_recorded_on_build_branch(bugmon, build, js_config):
+    """Verify that builds probed on other branches aren't recorded as the bug branch"""
+    build._branch = "autoland"
+
+    bugmon._record_step(js_config, build, EvaluatorResult.BUILD_CRASHED)
+
+    assert not bugmon._known_outcomes(js_config, "central")
+    assert len(bugmon._known_outcomes(js_config, "autoland")) == 1
+
+
+def test_bugmon_prefetch_ahead_is_bounded(mocker, bugmon):
+    """Verify that only a window of candidates is created to find builds to prefetch"""
+    prefetch = mocker.patch.object(bugmon, "_prefetch")
+    bugmon.bug._branch = "central"
+    bugmon.bug._initial_build_id = "20221004040915"
+    created = []
+
+    def candidates():
+        for i in range(20):
+            created.append(i)
+            flags = (True, i >= PREFETCH_LOOKAHEAD)
+            yield mocker.Mock(evaluator=mocker.Mock(target="js"), build_flags=flags)
+
+    ahead = bugmon._prefetch_ahead(candidates())
+    first = next(ahead)
+
+    assert first.build_flags == (True, False)
+    assert len(created) == PREFETCH_LOOKAHEAD + 1
+    assert prefetch.call_count == 1
+    assert len(list(ahead)) == 19
@@ -0,0 +1,101 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import asyncio
+
+import pytest
+import requests
+from bugsy import BugsyException
+
+from bugmon.bug import EnhancedBug
+from bugmon.bugzilla import AsyncBugzilla
+
+
+def test_request_retries_transient_errors(bugsy):
+    """Verify that reads are retried after transient errors"""
+    bugsy.request.side_effect = [
+        requests.exceptions.ConnectionError("reset"),
+        BugsyException("We received a 502 error"),
+        {"bugs": []},
+    ]
+    client = AsyncBugzilla(bugsy, backoff=0)
+
+    assert asyncio.run(client.search({"id": "1"})) == []
+    assert bugsy.request.call_count == 3
+
+
+def test_request_raises_rejected(bugsy):
+    """Verify that errors reported by Bugzilla are not retried"""
+    bugsy.request.side_effect = BugsyException("Invalid bug", 101)
+    client = AsyncBugzilla(bugsy, backoff=0)
+
+    with pytest.raises(BugsyException):
+        asyncio.run(client.request("bug/1"))
+    assert bugsy.request.call_count == 1
+
+
+def test_request_does_not_retry_writes(bugsy):
+    """Verify that failed writes are not retried"""
+    bugsy.request.side_effect = requests.exceptions.ConnectionError("reset")
+    client = AsyncBugzilla(bugsy, backoff=0)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        asyncio.run(client.request("bug/1", "PUT", json={}))
+    assert bugsy.request.call_count == 1
+
+
+def test_put_submits_diff(bug_data, bugsy):
+    """Verify that only the changes are submitted before refreshing the bug"""
+    bug = EnhancedBug(bugsy, **bug_data)
+    bug.status = "RESOLVED"
+    bugsy.request.return_value = {"bugs": [dict(bug_data, status="RESOLVED")]}
+
+    asyncio.run(AsyncBugzilla(bugsy).put(bug))
+
+    bugsy.request.assert_any_call(
+        f"bug/{bug.id}", method="PUT", json={"status": "RESOLVED"}
+    )
+    assert bug.status == "RESOLVED"
+    assert not bug.diff()
+
+
+def test_bug_fetches_details_together(bug_data_base, bugsy, comment_data):
+    """Verify that comments and attachments are retrieved together on first use"""
+
+    def request(path):
+        if path.endswith("comment"):
+            return {"bugs": {"1": {"comments": [comment_data]}}}
+        return {"bugs": {"1": []}}
+
+    bugsy.request.side_effect = request
+    bug = EnhancedBug(bugsy, **dict(bug_data_base, id=1))
+
+    assert bug.get_attachments() == []
+    assert bug.comment_zero == comment_data["text"]
+    assert bugsy.request.call_count == 2
+
+
+def test_hydrate_retrieves_details_in_bulk(
+    bugsy, bug_data_base, comment_data, attachment_data
+):
+    """Test that comments and attachments are retrieved in bulk"""
+    bugs = [dict(bug_data_base, id=1), dict(bug_data_base, id=2)]
+    metadata = {k: v for k, v in attachment_data.items() if k != "data"}
+
+    def request(path, params):
+        assert path in ("bug/1/comment", "bug/1/attachment")
+        if path.endswith("comment"):
+            assert params == {"ids": ["2"]}
+            return {"bugs": {"1": {"comments": [comment_data]}, "2": {"comments": []}}}
+        assert params == {"ids": ["2"], "exclude_fields": "data"}
+        return {"bugs": {"1": [metadata], "2": []}}
+
+    bugsy.request.side_effect = request
+    asyncio.run(AsyncBugzilla(bugsy).hydrate(bugs))
+    assert bugsy.request.call_count == 2
+
+    bug = EnhancedBug(bugsy, **bugs[0])
+    assert bug.comment_zero == comment_data["text"]
+    assert bug.get_attachments()[0].file_name == attachment_data["file_name"]
+    assert EnhancedBug(bugsy, **bugs[1]).get_attachments() == []
+    assert bugsy.request.call_count == 2
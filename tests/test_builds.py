@@ -0,0 +1,79 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+import requests
+from fuzzfetch import BuildFlags, BuildSearchOrder, FetcherException, Platform
+
+from bugmon.builds import BuildResolver, is_transient
+
+
+def test_resolver_memoizes_builds(mocker):
+    """Verify that identical lookups only construct a single Fetcher"""
+    fetcher = mocker.patch("bugmon.builds.Fetcher")
+    resolver = BuildResolver()
+    args = ("central", "72f0cfd2cd42", BuildFlags(asan=True), ["js"])
+    platform = Platform("Linux", "x86_64")
+
+    first = resolver.resolve(*args, platform, BuildSearchOrder.ASC)
+    second = resolver.resolve(*args, platform, BuildSearchOrder.ASC)
+    assert first is second
+    assert fetcher.call_count == 1
+
+    resolver.resolve(*args, platform, BuildSearchOrder.DESC)
+    assert fetcher.call_count == 2
+
+
+def test_resolver_refreshes_latest(mocker):
+    """Verify that builds resolved from latest expire"""
+    fetcher = mocker.patch("bugmon.builds.Fetcher")
+    resolver = BuildResolver(latest_ttl=0)
+    args = ("central", "latest", BuildFlags(debug=True), ["js"])
+
+    resolver.resolve(*args, Platform("Linux", "x86_64"))
+    resolver.resolve(*args, Platform("Linux", "x86_64"))
+    assert fetcher.call_count == 2
+
+
+def test_resolver_remembers_unavailable_builds(mocker, cache):
+    """Verify that failed lookups aren't repeated within or between runs"""
+    fetcher = mocker.patch("bugmon.builds.Fetcher", side_effect=FetcherException)
+    args = ("central", "72f0cfd2cd42", BuildFlags(asan=True), ["js"])
+    platform = Platform("Linux", "x86_64")
+
+    resolver = BuildResolver()
+    for _ in range(2):
+        with pytest.raises(FetcherException):
+            resolver.resolve(*args, platform, BuildSearchOrder.ASC)
+    assert fetcher.call_count == 1
+
+    assert BuildResolver().is_unavailable(*args, platform, BuildSearchOrder.ASC)
+    assert not BuildResolver().is_unavailable(*args, platform, BuildSearchOrder.DESC)
+
+
+def test_resolver_transient_failures_not_persisted(mocker, cache):
+    """Verify that network errors are only remembered briefly and in memory"""
+    error = FetcherException(requests.exceptions.ConnectionError("reset"))
+    mocker.patch("bugmon.builds.Fetcher", side_effect=error)
+    args = ("central", "72f0cfd2cd42", BuildFlags(asan=True), ["js"])
+    platform = Platform("Linux", "x86_64")
+
+    resolver = BuildResolver()
+    with pytest.raises(FetcherException):
+        resolver.resolve(*args, platform)
+
+    assert resolver.is_unavailable(*args, platform)
+    assert not BuildResolver().is_unavailable(*args, platform)
+
+
+@pytest.mark.parametrize(
+    "error, transient",
+    [
+        (FetcherException("Unable to find usable archive"), False),
+        (FetcherException(requests.exceptions.Timeout()), True),
+        (FetcherException(requests.exceptions.HTTPError(response=None)), True),
+    ],
+)
+def test_is_transient(error, transient):
+    """Verify that only network and server errors are considered transient"""
+    assert is_transient(error) is transient
@@ -0,0 +1,58 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+from bugmon.cache import Cache, get_cache, make_key
+
+
+def test_make_key_is_stable():
+    """Verify that make_key ignores dict ordering"""
+    assert make_key({"a": 1, "b": 2}) == make_key({"b": 2, "a": 1})
+    assert make_key("a", "b") != make_key("b", "a")
+
+
+def test_cache_result_roundtrip(tmp_path):
+    """Verify that stored results can be retrieved from a new instance"""
+    args = (123456, "abcdef", '{"flags": "fuzzing-asan"}', "Linux-x86_64")
+    Cache(tmp_path).set_result(
+        *args, "central", "20200101", "0e384d802c84", "BUILD_CRASHED"
+    )
+
+    cache = Cache(tmp_path)
+    assert cache.get_result(*args, "0e384d802c84") == "BUILD_CRASHED"
+    assert cache.get_result(*args, "123456789abc") is None
+
+
+def test_cache_results_shared_across_bugs(tmp_path):
+    """Verify that results stored by any bug are returned for a testcase"""
+    key = ("abcdef", "{}", "Linux-x86_64", "central")
+    cache = Cache(tmp_path)
+    cache.set_result(1, *key, "20200101", "0e384d802c84", "BUILD_CRASHED")
+    cache.set_result(2, *key, "20200102", "123456789abc", "BUILD_PASSED")
+
+    assert sorted(cache.get_results(*key)) == [
+        ("20200101", "0e384d802c84", "BUILD_CRASHED"),
+        ("20200102", "123456789abc", "BUILD_PASSED"),
+    ]
+
+
+def test_cache_fixture_configures_process_cache(cache):
+    """Verify that the process-wide cache can be configured"""
+    assert get_cache() is cache
+
+
+def test_cache_finds_contained_bisection(tmp_path):
+    """Verify that stored bisections are found when within the requested builds"""
+    bisection = {
+        "start_id": "20200105000000",
+        "start_changeset": "aaaaaaaaaaaa",
+        "end_id": "20200106000000",
+        "end_changeset": "bbbbbbbbbbbb",
+        "repo": "https://hg.mozilla.org/mozilla-central",
+    }
+    cache = Cache(tmp_path)
+    cache.set_bisection("key", "context", bisection)
+
+    assert cache.get_bisection("key") == bisection
+    assert cache.find_bisection("context", "20200101", "20200110") == bisection
+    assert cache.find_bisection("context", "20200106", "20200110") is None
+    assert cache.find_bisection("other", "20200101", "20200110") is None
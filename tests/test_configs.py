@@ -7,13 +7,19 @@ import copy
 import tempfile
 from pathlib import Path
 
+import pytest
+from autobisect.evaluators import EvaluatorResult
 from fuzzfetch import BuildFlags
 
 from bugmon.bug import EnhancedBug
 from bugmon.evaluator_configs import (
     BrowserConfiguration,
     BugConfiguration,
+    ConfigRanker,
     JSConfiguration,
+    RepeatPolicy,
+    clear_testcase_index,
+    get_testcase_index,
 )
 
 
@@ -89,6 +95,37 @@ def test_browser_configuration_iter_tests_002():
         assert tests[0] == tmp_path
 
 
+def test_testcase_index_shared(mocker, tmp_path):
+    """Test that the directory is walked once for all configuration classes"""
+    (tmp_path / "sub").mkdir()
+    for name in ("sub/a.js", "b.txt", "c.html", "sub/d.svg"):
+        (tmp_path / name).touch()
+    rglob = mocker.spy(Path, "rglob")
+
+    browser = list(BrowserConfiguration.iter_tests(tmp_path))
+    js = list(JSConfiguration.iter_tests(tmp_path))
+
+    assert browser == [tmp_path / "c.html", tmp_path / "sub" / "d.svg"]
+    assert js[0] == tmp_path / "sub" / "a.js"
+    assert sorted(js[1:]) == [
+        tmp_path / "b.txt",
+        tmp_path / "c.html",
+        tmp_path / "sub" / "d.svg",
+    ]
+    assert rglob.call_count == 1
+
+
+def test_testcase_index_cleared(tmp_path):
+    """Test that the index is rebuilt once cleared"""
+    (tmp_path / "a.html").touch()
+    index = get_testcase_index(tmp_path)
+    assert get_testcase_index(tmp_path) is index
+
+    (tmp_path / "b.html").touch()
+    clear_testcase_index(tmp_path)
+    assert len(get_testcase_index(tmp_path).files) == 2
+
+
 def test_browser_configuration_env_iter_001(bug_data):
     """Test BugConfiguration.env_iter() with Accessibility component"""
     bug = copy.deepcopy(bug_data)
@@ -127,3 +164,97 @@ def test_js_configuration_iterate_001(mocker, bug_data):
         mock.return_value = []
         bug = EnhancedBug(None, **bug_data)
         assert len(list(JSConfiguration.iterate(bug, tmp_path))) == 6
+
+
+def test_config_ranker_prefers_previous_winners(bug_data, cache, working_dir):
+    """Verify that ConfigRanker moves previously successful configurations first"""
+    Path(working_dir / "1.html").touch()
+    bug = EnhancedBug(None, **bug_data)
+    ranker = ConfigRanker(cache, bug, working_dir)
+
+    configs = list(BrowserConfiguration.iterate(bug, working_dir))
+    winner = next(c for c in configs if not c.params["use_harness"])
+    assert configs[0] is not winner
+
+    ranker.record(winner)
+    ranked = list(ConfigRanker(cache, bug, working_dir).rank([BrowserConfiguration]))
+    assert ranker.signature(ranked[0]) == ranker.signature(winner)
+    assert len(ranked) == len(configs)
+
+
+def test_config_ranker_without_history_keeps_order(bug_data, cache, working_dir):
+    """Verify that ConfigRanker retains the default order without history"""
+    Path(working_dir / "1.html").touch()
+    bug = EnhancedBug(None, **bug_data)
+    configs = list(BrowserConfiguration.iterate(bug, working_dir))
+
+    ranked = ConfigRanker(cache, bug, working_dir).rank([BrowserConfiguration])
+    assert [c.params for c in ranked] == [c.params for c in configs]
+
+
+def test_config_ranker_creates_lazily(mocker, bug_data, cache, working_dir):
+    """Verify that ConfigRanker only creates the configurations consumed"""
+    Path(working_dir / "1.html").touch()
+    bug = EnhancedBug(None, **bug_data)
+    ranker = ConfigRanker(cache, bug, working_dir)
+    ranker.record(next(BrowserConfiguration.iterate(bug, working_dir)))
+    create = mocker.spy(BrowserConfiguration, "create")
+
+    next(ranker.rank([JSConfiguration, BrowserConfiguration]))
+
+    assert create.call_count == 1
+
+
+@pytest.mark.parametrize(
+    "history, name, stages",
+    [
+        ((0, 0), "default", [1, 9]),
+        ((2, 0), "deterministic", [1]),
+        ((2, 1), "intermittent", [1, 19]),
+    ],
+)
+def test_repeat_policy_stages(cache, history, name, stages):
+    """Verify that the number of attempts depends on previous evaluations"""
+    for _ in range(history[0]):
+        cache.record_repeat("key", True)
+    for _ in range(history[1]):
+        cache.record_repeat("key", False)
+
+    policy = RepeatPolicy(10, cache, "key")
+    assert policy.name == name
+    assert policy.stages == stages
+
+
+def test_configuration_evaluate_stops_on_crash(mocker, js_config, tmp_path):
+    """Verify that later stages are skipped once the testcase crashes"""
+    evaluate = mocker.patch.object(
+        js_config.evaluator,
+        "evaluate_testcase",
+        return_value=EvaluatorResult.BUILD_CRASHED,
+    )
+    js_config.evaluator.repeat = 10
+    js_config.apply_policy(RepeatPolicy(10))
+
+    assert js_config.evaluate(tmp_path) == EvaluatorResult.BUILD_CRASHED
+    assert evaluate.call_count == 1
+    assert js_config.policy.first == 1
+    assert js_config.evaluator.repeat == 10
+    assert "repeat" not in js_config.params_key(tmp_path)
+
+
+def test_configuration_evaluate_escalates(mocker, js_config, tmp_path):
+    """Verify that the remaining attempts are made if the first attempt passes"""
+    attempts = []
+
+    def evaluate_testcase(_):
+        attempts.append(js_config.evaluator.repeat)
+        return EvaluatorResult.BUILD_PASSED
+
+    mocker.patch.object(
+        js_config.evaluator, "evaluate_testcase", side_effect=evaluate_testcase
+    )
+    js_config.evaluator.repeat = 10
+    js_config.apply_policy(RepeatPolicy(10))
+
+    assert js_config.evaluate(tmp_path) == EvaluatorResult.BUILD_PASSED
+    assert attempts == [1, 9]
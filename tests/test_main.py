@@ -0,0 +1,47 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import pytest
+
+from bugmon.exceptions import BugmonException
+from bugmon.main import main, parse_args, process_bug
+
+
+def test_parse_args_rejects_invalid_jobs():
+    """Verify that the number of jobs must be positive"""
+    with pytest.raises(SystemExit):
+        parse_args(["--bugs", "1", "--jobs", "0"])
+
+
+def test_process_bug_collects_errors(mocker, bug, bugsy):
+    """Verify that errors are recorded instead of raised"""
+    monitor = mocker.patch("bugmon.main.BugMonitor", autospec=True)
+    monitor.return_value.bug = bug
+    monitor.return_value.process.side_effect = BugmonException("Boom")
+    args = parse_args(["--bugs", "1"])
+
+    outcome = process_bug(bugsy, bug, args)
+
+    assert outcome["bug_id"] == bug.id
+    assert outcome["error"] == "Boom"
+
+
+def test_main_continues_after_failure(mocker, monkeypatch, bug_data_base):
+    """Verify that a failing bug doesn't abort the remaining batch"""
+    monkeypatch.setenv("BZ_API_ROOT", "https://bugzilla.example.com/rest")
+    monkeypatch.setenv("BZ_API_KEY", "key")
+    bugs = [dict(bug_data_base, id=1), dict(bug_data_base, id=2)]
+    bugsy = mocker.patch("bugmon.main.Bugsy", autospec=True)
+    bugsy.return_value.request.return_value = {"bugs": bugs}
+    mocker.patch("bugmon.main.AsyncBugzilla.hydrate")
+    monitor = mocker.patch("bugmon.main.BugMonitor")
+    monitor.return_value.process.side_effect = [BugmonException("Boom"), None]
+
+    assert main(["--bugs", "1", "2"]) == 1
+    assert monitor.return_value.process.call_count == 2
+
+
+def test_parse_args_rejects_grouped_jobs():
+    """Verify that build grouping cannot be combined with worker processes"""
+    with pytest.raises(SystemExit):
+        parse_args(["--bugs", "1", "--jobs", "2", "--group-builds"])
@@ -0,0 +1,86 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import os
+import threading
+from collections import namedtuple
+
+from fuzzfetch import BuildFlags, Platform
+
+from bugmon.prefetch import BuildPrefetcher
+
+Usage = namedtuple("Usage", ["total", "used", "free"])
+
+
+def test_prefetcher_downloads_once(mocker):
+    """Verify that duplicate requests only download the build once"""
+    release = threading.Event()
+    mocker.patch("bugmon.builds.Fetcher")
+    mocker.patch("bugmon.prefetch.shutil.disk_usage", return_value=Usage(0, 0, 1))
+    manager = mocker.patch("bugmon.prefetch.BuildManager")
+    manager.return_value.get_build.side_effect = lambda *_: release.wait()
+    prefetcher = BuildPrefetcher(min_free=0)
+
+    args = ("central", "72f0cfd2cd42", BuildFlags(debug=True), "js")
+    assert prefetcher.prefetch(*args, Platform("Linux", "x86_64"))
+    assert not prefetcher.prefetch(*args, Platform("Linux", "x86_64"))
+    release.set()
+    prefetcher.close()
+
+    assert manager.return_value.get_build.call_count == 1
+
+
+def test_prefetcher_respects_free_space(mocker):
+    """Verify that builds are not downloaded when disk space is low"""
+    mocker.patch("bugmon.builds.Fetcher")
+    mocker.patch("bugmon.prefetch.shutil.disk_usage", return_value=Usage(0, 0, 1))
+    manager = mocker.patch("bugmon.prefetch.BuildManager")
+    prefetcher = BuildPrefetcher(min_free=2)
+
+    prefetcher.prefetch(
+        "central", None, BuildFlags(), "firefox", Platform("Linux", "x86_64")
+    )
+    prefetcher.close()
+
+    manager.return_value.get_build.assert_not_called()
+
+
+def test_prefetcher_bounds_queue(mocker):
+    """Verify that requests beyond the queue limit are dropped"""
+    prefetcher = BuildPrefetcher(max_queued=1)
+    executor = mocker.patch.object(prefetcher, "_executor")
+    executor.submit.return_value.done.return_value = False
+
+    platform = Platform("Linux", "x86_64")
+    assert prefetcher.prefetch("central", "a", BuildFlags(), "js", platform)
+    assert not prefetcher.prefetch("central", "b", BuildFlags(), "js", platform)
+    assert executor.submit.call_count == 1
+
+
+def test_prefetcher_prunes_completed(mocker):
+    """Verify that completed downloads are no longer tracked"""
+    prefetcher = BuildPrefetcher(max_queued=1)
+    executor = mocker.patch.object(prefetcher, "_executor")
+    executor.submit.return_value.done.return_value = True
+
+    platform = Platform("Linux", "x86_64")
+    assert prefetcher.prefetch("central", "a", BuildFlags(), "js", platform)
+    assert prefetcher.prefetch("central", "b", BuildFlags(), "js", platform)
+    assert len(prefetcher._queued) == 1
+
+
+def test_prefetcher_owns_reservation(mocker):
+    """Verify that prefetched builds are reserved by the download thread"""
+    mocker.patch("bugmon.builds.Fetcher")
+    mocker.patch("bugmon.prefetch.shutil.disk_usage", return_value=Usage(0, 0, 1))
+    manager = mocker.patch("bugmon.prefetch.BuildManager")
+    manager.return_value.pid = os.getpid()
+    prefetcher = BuildPrefetcher(min_free=0)
+
+    prefetcher.prefetch(
+        "central", None, BuildFlags(), "js", Platform("Linux", "x86_64")
+    )
+    prefetcher.close()
+
+    assert manager.return_value.get_build.call_count == 1
+    assert manager.return_value.pid != os.getpid()
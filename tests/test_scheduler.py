@@ -0,0 +1,63 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+from autobisect.evaluators import EvaluatorResult
+
+from bugmon.scheduler import BuildScheduler
+
+
+def test_scheduler_groups_bugs_by_build(mocker, build, js_config):
+    """Verify that bugs sharing a build are evaluated with a single download"""
+    build.get_auto_name.return_value = "m-c-20221004040915-fuzzing-asan-opt"
+    monitors = [mocker.Mock() for _ in range(3)]
+    for monitor in monitors:
+        monitor.plan_reproductions.return_value = [(js_config, "central", build)]
+    mocker.patch.object(
+        js_config.evaluator,
+        "evaluate_testcase",
+        return_value=EvaluatorResult.BUILD_CRASHED,
+    )
+    get_build = mocker.patch("bugmon.scheduler.BuildManager").return_value.get_build
+
+    BuildScheduler(monitors).run()
+
+    assert get_build.call_count == 1
+    for monitor in monitors:
+        monitor.record_result.assert_called_once_with(
+            js_config, "central", build, EvaluatorResult.BUILD_CRASHED
+        )
+
+
+def test_scheduler_isolates_planning_failures(mocker, build, js_config):
+    """Verify that a bug failing to plan doesn't prevent others from running"""
+    build.get_auto_name.return_value = "m-c-20221004040915-fuzzing-asan-opt"
+    failing, working = mocker.Mock(), mocker.Mock()
+    failing.plan_reproductions.side_effect = AssertionError
+    working.plan_reproductions.return_value = [(js_config, "central", build)]
+    mocker.patch("bugmon.scheduler.BuildManager")
+
+    plan = BuildScheduler([failing, working]).plan()
+
+    assert len(plan) == 1
+    assert plan[0][2] == [(working, js_config, "central")]
+
+
+def test_scheduler_isolates_evaluation_failures(mocker, build, js_config):
+    """Verify that a bug failing to evaluate doesn't prevent others in the group"""
+    build.get_auto_name.return_value = "m-c-20221004040915-fuzzing-asan-opt"
+    failing, working = mocker.Mock(), mocker.Mock()
+    failing.record_result.side_effect = AssertionError
+    for monitor in (failing, working):
+        monitor.plan_reproductions.return_value = [(js_config, "central", build)]
+    mocker.patch.object(
+        js_config.evaluator,
+        "evaluate_testcase",
+        return_value=EvaluatorResult.BUILD_CRASHED,
+    )
+    mocker.patch("bugmon.scheduler.BuildManager")
+
+    BuildScheduler([failing, working]).run()
+
+    working.record_result.assert_called_once_with(
+        js_config, "central", build, EvaluatorResult.BUILD_CRASHED
+    )
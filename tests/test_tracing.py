@@ -0,0 +1,52 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import json
+
+import pytest
+
+from bugmon.tracing import set_tracer, span
+
+
+@pytest.fixture(name="trace_path")
+def fixture_trace_path(tmp_path):
+    """Enable tracing for the duration of the test"""
+    path = tmp_path / "trace.jsonl"
+    set_tracer(path)
+    yield path
+    set_tracer(None)
+
+
+def test_span_exports_nested_spans(trace_path):
+    """Verify that spans are exported with their parent and attributes"""
+    with span("outer", bug_id=1):
+        with span("inner") as inner:
+            inner.set(cache="hit")
+
+    inner_record, outer_record = [
+        json.loads(line) for line in trace_path.read_text().splitlines()
+    ]
+    assert outer_record["name"] == "outer"
+    assert outer_record["attrs"] == {"bug_id": 1}
+    assert outer_record["parent_id"] is None
+    assert inner_record["attrs"] == {"cache": "hit"}
+    assert inner_record["parent_id"] == outer_record["span_id"]
+    assert outer_record["duration"] >= inner_record["duration"]
+
+
+def test_span_records_errors(trace_path):
+    """Verify that exceptions are recorded and re-raised"""
+    with pytest.raises(ValueError):
+        with span("failing"):
+            raise ValueError("failed")
+
+    record = json.loads(trace_path.read_text())
+    assert record["attrs"] == {"error": "ValueError"}
+
+
+def test_span_without_tracer(tmp_path):
+    """Verify that nothing is exported when tracing is disabled"""
+    with span("untraced") as current:
+        current.set(cache="miss")
+
+    assert not list(tmp_path.iterdir())
@@ -0,0 +1,58 @@
+# This Source Code Form is subject to the terms of the Mozilla Public License,
+# v. 2.0. If a copy of the MPL was not distributed with this file, You can
+# obtain one at http://mozilla.org/MPL/2.0/.
+import requests
+from bugsy import BugsyException
+
+from bugmon.bugmon import BugMonitor
+from bugmon.bugzilla import AsyncBugzilla
+from bugmon.updates import CommitQueue, set_commit_queue
+
+
+def test_queue_persists_updates(tmp_path, bugsy):
+    """Verify that persisted updates are submitted in order by a later queue"""
+    CommitQueue(tmp_path).add(1, {"status": "RESOLVED"})
+    CommitQueue(tmp_path).add(1, {"keywords": {"add": ["regression"]}})
+
+    queue = CommitQueue(tmp_path)
+    assert len(queue.pending) == 2
+    assert queue.flush(AsyncBugzilla(bugsy)) == 0
+
+    assert [call.kwargs["json"] for call in bugsy.request.call_args_list] == [
+        {"status": "RESOLVED"},
+        {"keywords": {"add": ["regression"]}},
+    ]
+    assert not queue.pending
+
+
+def test_queue_keeps_failed_updates(tmp_path, bugsy):
+    """Verify that updates failing with transient errors remain pending"""
+
+    def request(path, **_kwargs):
+        if path == "bug/1":
+            raise requests.exceptions.ConnectionError("reset")
+        raise BugsyException("Invalid field", 108)
+
+    bugsy.request.side_effect = request
+    queue = CommitQueue(tmp_path)
+    queue.add(1, {"status": "RESOLVED"})
+    queue.add(2, {"status": "RESOLVED"})
+
+    assert queue.flush(AsyncBugzilla(bugsy)) == 1
+    assert [update["bug_id"] for update in queue.pending] == [1]
+
+
+def test_commit_queues_changes(bug, bugsy, tmp_path):
+    """Verify that changes are queued without submitting or refreshing the bug"""
+    queue = set_commit_queue(True)
+    try:
+        bugmon = BugMonitor(bugsy, bug, tmp_path, dry_run=False)
+        bugmon.report("Verified")
+        bugmon.commit()
+    finally:
+        set_commit_queue(False)
+
+    assert queue is not None
+    assert queue.pending[0]["diff"]["comment"]["body"] == "Verified"
+    assert not bug.diff()
+    bugsy.request.assert_not_called()
@@ -1,11 +1,26 @@
 # This Source Code Form is subject to the terms of the Mozilla Public License,
 # v. 2.0. If a copy of the MPL was not distributed with this file, You can
 # obtain one at http://mozilla.org/MPL/2.0/.
+import base64
+import binascii
+import io
 import subprocess
+import zipfile
 
 import pytest
 
 import bugmon.utils as utils
+from bugmon.exceptions import BugmonException
+
+
+def make_zip(files):
+    """Create an in-memory zip archive containing the supplied files"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    buffer.seek(0)
+    return buffer
 
 
 @pytest.mark.parametrize("returncode, expected", [(0, True), (1, False)])
@@ -46,3 +61,76 @@ def test_has_pernosco_creds_partial(caplog):
     assert utils.has_pernosco_creds(dictionary) is False
     expected = "Cannot find Pernosco env variable PERNOSCO_USER_SECRET_KEY!"
     assert caplog.messages[-1] == expected
+
+
+def test_product_details_are_shared(mocker, cache):
+    """Verify that product details are fetched once and reused between runs"""
+    get_url = mocker.patch("bugmon.utils._get_url")
+    get_url.return_value.json.return_value = {
+        "FIREFOX_NIGHTLY": "81.0a1",
+        "FIREFOX_ESR": "78.1.0esr",
+        "FIREFOX_ESR_NEXT": "",
+    }
+
+    assert utils._get_milestone() == 81
+    assert utils._get_esr("esr-stable") == "esr78"
+    assert utils._get_esr("esr-next") is None
+    assert get_url.call_count == 1
+
+    # Simulate a new run
+    utils._PRODUCT_DETAILS = None
+    assert utils._get_milestone() == 81
+    assert get_url.call_count == 1
+
+
+def test_decode_base64_chunked(mocker):
+    """Verify that data is decoded correctly across chunk boundaries"""
+    mocker.patch("bugmon.utils.DECODE_CHUNK_SIZE", 8)
+    raw = bytes(range(256)) * 3
+    encoded = base64.encodebytes(raw).decode("utf-8")
+
+    with utils.decode_base64(encoded) as data:
+        assert data.read() == raw
+
+
+def test_decode_base64_lenient(mocker):
+    """Verify that stray characters are discarded as with base64.decodebytes"""
+    mocker.patch("bugmon.utils.DECODE_CHUNK_SIZE", 5)
+    encoded = "YWxl\ncnQo$MSk=\nYQ=="
+
+    with utils.decode_base64(encoded) as data:
+        assert data.read() == base64.decodebytes(encoded.encode("utf-8"))
+
+
+def test_decode_base64_invalid():
+    """Verify that invalid data raises binascii.Error"""
+    with pytest.raises(binascii.Error):
+        with utils.decode_base64("YWxlcnQ$"):
+            pass
+
+
+def test_extract_zip(tmp_path):
+    """Verify that zip members are extracted"""
+    archive = make_zip({"test.js": "alert(1)", "dir/prefs.js": ""})
+
+    assert utils.extract_zip(archive, tmp_path) == ["test.js", "dir/prefs.js"]
+    assert (tmp_path / "test.js").read_text() == "alert(1)"
+    assert (tmp_path / "dir" / "prefs.js").exists()
+
+
+@pytest.mark.parametrize(
+    "files, kwargs",
+    [
+        ({"../escape.js": ""}, {}),
+        ({"a.js": "", "b.js": ""}, {"max_files": 1}),
+        ({"a.js": "a" * 16}, {"max_size": 8}),
+    ],
+)
+def test_extract_zip_rejects_unsafe(tmp_path, files, kwargs):
+    """Verify that unsafe archives are rejected"""
+    dest = tmp_path / "dest"
+    dest.mkdir()
+    with pytest.raises(BugmonException):
+        utils.extract_zip(make_zip(files), dest, **kwargs)
+
+    assert not (tmp_path / "escape.js").exists()